@@ -2,6 +2,8 @@ from django.shortcuts import render
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from bookstore_backend.conditional import ConditionalRequestMixin
+from bookstore_backend.idempotency import IdempotentActionMixin
 from django.contrib.auth import get_user_model, authenticate
 from .serializers import UserSerializer
 from .permissions import IsAdminOrSelf, IsAdminUser
@@ -10,10 +12,12 @@ from rest_framework_simplejwt.tokens import RefreshToken
 
 User = get_user_model()
 
-class UserViewSet(viewsets.ModelViewSet):
+class UserViewSet(IdempotentActionMixin, ConditionalRequestMixin, viewsets.ModelViewSet):
     queryset = User.objects.all()
     serializer_class = UserSerializer
     permission_classes = [IsAdminOrSelf]
+    # 登录的响应包含令牌，不保存到幂等键记录中
+    idempotency_exempt_actions = ('login',)
 
     def get_permissions(self):
         if self.action == 'me':
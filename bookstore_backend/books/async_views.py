@@ -0,0 +1,143 @@
+"""
+收银台异步接口
+
+在 ASGI 下运行时，等待慢速手持终端的请求不占用工作线程。
+查询使用异步 ORM；结账需要 transaction.atomic，只有这一步通过 sync_to_async 执行。
+只接受 JWT 认证，与同步接口使用相同的权限、校验和错误格式。
+"""
+import json
+
+from asgiref.sync import sync_to_async
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_http_methods
+from rest_framework.exceptions import APIException
+from rest_framework.utils.encoders import JSONEncoder
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+from accounts.models import User
+from accounts.permissions import IsStaffOrManagerOrAdmin
+from bookstore_backend import idempotency
+from .checkout import CheckoutError, checkout as run_checkout
+from .models import Sale
+from .scan import cache as scan_cache, split_isbns, MAX_LOOKUP_ISBNS
+from .serializers import SaleSerializer
+
+
+def _response(data, status=200):
+    return JsonResponse(data, status=status, encoder=JSONEncoder, safe=False)
+
+
+def _error(message, status=400):
+    return _response({'error': message}, status)
+
+
+async def _authenticate(request):
+    authentication = JWTAuthentication()
+    header = authentication.get_header(request)
+    raw_token = authentication.get_raw_token(header) if header else None
+    if raw_token is None:
+        return None
+    try:
+        token = authentication.get_validated_token(raw_token)
+    except (InvalidToken, TokenError):
+        return None
+    return await User.objects.filter(
+        **{api_settings.USER_ID_FIELD: token.get(api_settings.USER_ID_CLAIM)}, is_active=True
+    ).afirst()
+
+
+def pos_view(view):
+    """认证和权限检查，失败时返回与 DRF 相同的状态码"""
+    async def wrapper(request):
+        request.user = await _authenticate(request)
+        if request.user is None:
+            return _response({'detail': '身份认证信息未提供或无效'}, 401)
+        if not IsStaffOrManagerOrAdmin().has_permission(request, None):
+            return _response({'detail': '您没有执行该操作的权限'}, 403)
+        return await view(request)
+    return csrf_exempt(wrapper)
+
+
+def _json_body(request):
+    try:
+        data = json.loads(request.body or b'{}')
+    except ValueError:
+        return None
+    return data if isinstance(data, dict) else None
+
+
+@pos_view
+@require_http_methods(['GET', 'POST'])
+async def lookup(request):
+    # 与 BookViewSet.lookup 相同：GET ?isbn=a,b 或 POST {"isbns": [...]}
+    if request.method == 'POST':
+        data = _json_body(request)
+        if data is None:
+            return _error('请求体必须是 JSON 对象')
+        values = data.get('isbns', [])
+        if not isinstance(values, list):
+            values = [values]
+    else:
+        values = [value for value in request.GET.get('isbn', '').split(',') if value]
+
+    if not values:
+        return _error('ISBN不能为空')
+    if len(values) > MAX_LOOKUP_ISBNS:
+        return _error(f'单次最多查询 {MAX_LOOKUP_ISBNS} 个ISBN')
+
+    isbns, invalid = split_isbns(values)
+    found = await scan_cache.alookup(isbns)
+    return _response({
+        'results': [found[isbn] for isbn in isbns if isbn in found],
+        'not_found': [isbn for isbn in isbns if isbn not in found],
+        'invalid': invalid
+    })
+
+
+def _checkout(items, user):
+    def build_sale(book, quantity):
+        return Sale(book=book, quantity=quantity, sale_price=book.price, created_by=user, **Sale.snapshot_fields(book))
+
+    try:
+        sales = run_checkout(items, user, Sale, build_sale)
+    except CheckoutError as exc:
+        return 400, {'error': str(exc)}
+    return 201, SaleSerializer(sales, many=True).data
+
+
+@pos_view
+@require_http_methods(['POST'])
+async def checkout(request):
+    """与 SaleViewSet.create_batch 相同，支持 Idempotency-Key"""
+    data = _json_body(request)
+    if data is None:
+        return _error('请求体必须是 JSON 对象')
+
+    record = None
+    key = request.headers.get('Idempotency-Key')
+    if key:
+        request_hash = idempotency.fingerprint(request.method, request.path, data)
+        try:
+            # 占用幂等键需要事务保护，只能同步执行
+            record = await sync_to_async(idempotency.claim_key)(key, request.user, request_hash)
+        except idempotency.Replay as replay:
+            status, body = idempotency.stored_response(replay.record)
+            response = _response(body, status)
+            response['Idempotent-Replayed'] = 'true'
+            return response
+        except APIException as exc:
+            return _response({'detail': str(exc.detail)}, exc.status_code)
+
+    try:
+        # 结账在一个数据库事务中完成，Django 的事务 API 只有同步版本
+        status, body = await sync_to_async(_checkout)(data.get('items', []), request.user)
+    except Exception:
+        if record is not None:
+            await record.adelete()
+        raise
+    if record is not None:
+        await idempotency.astore_response(record, status, body)
+    return _response(body, status)
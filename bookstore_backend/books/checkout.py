@@ -0,0 +1,150 @@
+"""
+批量销售结账与退货
+
+一次 id__in 查询加载购物篮中的全部图书并预先校验，bulk_create 写入销售记录，
+用一条 UPDATE 扣减库存，财务记录和每日销售汇总在同一事务中写入。
+查询次数与购物篮的行数无关，任何一项失败都会整单回滚。
+整单退货同样用固定次数的查询完成。
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.utils import timezone
+
+from financials.models import Financial
+from .models import Book, Sale
+from . import costing, rollup
+from .leaderboard import leaderboard
+from .stock import InsufficientStock, apply_stock_changes
+
+
+class CheckoutError(Exception):
+    pass
+
+
+def collect_quantities(items):
+    """把销售项目整理为 {book_id: 数量}，同一本书的多行合并"""
+    if not items:
+        raise CheckoutError('销售项目不能为空')
+    quantities = {}
+    for item in items:
+        try:
+            book_id = int(item['book_id'])
+            quantity = int(item['quantity'])
+        except (KeyError, TypeError, ValueError):
+            raise CheckoutError('销售项目格式错误')
+        if quantity <= 0:
+            raise CheckoutError('销售数量必须大于0')
+        quantities[book_id] = quantities.get(book_id, 0) + quantity
+    return quantities
+
+
+def load_books(quantities):
+    books = Book.objects.select_related('category').in_bulk(list(quantities))
+    for book_id, quantity in quantities.items():
+        book = books.get(book_id)
+        if book is None:
+            raise CheckoutError(f'图书ID {book_id} 不存在')
+        if book.status != 'in_stock':
+            raise CheckoutError(f'图书 {book.title} 不在销售状态')
+        if book.stock < quantity:
+            raise CheckoutError(f'图书 {book.title} 库存不足')
+    return books
+
+
+def checkout(items, operator, sale_model, build_sale):
+    """
+    build_sale(book, quantity) 返回未保存的销售记录，每本书一条。
+    返回已保存的销售记录列表，失败时抛出 CheckoutError。
+    """
+    quantities = collect_quantities(items)
+    try:
+        with transaction.atomic():
+            books = load_books(quantities)
+            sales = [build_sale(books[book_id], quantity) for book_id, quantity in quantities.items()]
+            costs = costing.consume(list(quantities.items()))
+            for sale, cost in zip(sales, costs):
+                # 旧版销售记录没有成本字段，只消耗成本批次
+                if hasattr(sale, 'cogs'):
+                    sale.cogs = cost
+            sales = sale_model.objects.bulk_create(sales)
+            # 预先校验之后库存仍可能被并发的销售扣减，条件 UPDATE 兜底
+            apply_stock_changes(
+                {book_id: -quantity for book_id, quantity in quantities.items()},
+                'sale',
+                references={sale.book_id: sale.id for sale in sales},
+                operator=operator,
+            )
+            rollup.record_sales(books, quantities)
+            leaderboard.record_sales(books, quantities)
+            Financial.objects.create(
+                type='income',
+                category='sale',
+                amount=sum(books[book_id].price * quantity for book_id, quantity in quantities.items()),
+                description=f'销售图书 {len(sales)} 本',
+                operator=operator
+            )
+    except InsufficientStock as exc:
+        book_id = min(exc.book_ids)
+        raise CheckoutError(f'图书 {books[book_id].title} 库存不足')
+    return sales
+
+
+def collect_sale_ids(sale_ids):
+    if not sale_ids or not isinstance(sale_ids, list):
+        raise CheckoutError('退货项目不能为空')
+    try:
+        ids = [int(sale_id) for sale_id in sale_ids]
+    except (TypeError, ValueError):
+        raise CheckoutError('退货项目格式错误')
+    return list(dict.fromkeys(ids))
+
+
+def return_sales(sale_ids, operator):
+    """
+    整单退货：一次加载并校验全部销售记录，一条 UPDATE 修改状态，一条 UPDATE 恢复库存，
+    记一笔退款。返回已退货的销售记录，失败时抛出 CheckoutError 并整体回滚。
+    """
+    ids = collect_sale_ids(sale_ids)
+    with transaction.atomic():
+        sales = (
+            Sale.objects.select_for_update(of=('self',))
+            .select_related('book', 'created_by')
+            .in_bulk(ids)
+        )
+        for sale_id in ids:
+            sale = sales.get(sale_id)
+            if sale is None:
+                raise CheckoutError(f'销售记录ID {sale_id} 不存在')
+            if sale.status != 'completed':
+                raise CheckoutError(f'销售记录 {sale_id} 不是已完成的销售，不能退货')
+        sales = [sales[sale_id] for sale_id in ids]
+
+        # SQLite 不支持行锁，条件 UPDATE 保证同一笔销售只退货一次
+        now = timezone.now()
+        returned = Sale.objects.filter(pk__in=ids, status='completed').update(status='returned', updated_at=now)
+        if returned != len(ids):
+            raise CheckoutError('部分销售已被退货，请刷新后重试')
+        changes = defaultdict(int)
+        references = defaultdict(list)
+        for sale in sales:
+            sale.status, sale.updated_at = 'returned', now
+            changes[sale.book_id] += sale.quantity
+            references[sale.book_id].append(sale.id)
+
+        apply_stock_changes(
+            changes, 'sale_return',
+            references={book_id: refs[0] for book_id, refs in references.items() if len(refs) == 1},
+            operator=operator,
+        )
+        costing.restore(sales)
+        rollup.record_returns(sales)
+        leaderboard.record_returns(sales)
+        Financial.objects.create(
+            type='expense',
+            category='sale',
+            amount=sum(sale.sale_price * sale.quantity for sale in sales),
+            description=f'销售退货 {len(sales)} 笔',
+            operator=operator
+        )
+    return sales
@@ -0,0 +1,222 @@
+"""
+销售成本（COGS）
+
+进货付款时每个订单生成一个成本批次（CostLot），旧版采购记录（purchases.Purchase）在创建时生成，销售按入库时间先进先出消耗批次的剩余数量，
+销售成本在写入销售记录时一并保存。设置 INVENTORY_COST_METHOD = 'average' 时，
+成本改按当前剩余批次的加权平均单价计算（批次仍按先进先出扣减，剩余数量与库存对应）。
+退货按原销售的单位成本补回一个批次。
+
+超出批次剩余的数量（成本批次启用前的库存、上架时增加的库存等）按该书最近一次进货单价计算，
+没有进货记录时成本为 0。consume 固定两到三条查询，与图书和批次的数量无关。
+replay_books 从历史记录重新计算批次和销售成本，供 rebuild_cost_lots 命令使用。
+"""
+from collections import defaultdict
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, IntegerField, OuterRef, Subquery, Value, When
+from django.db.models.functions import Coalesce
+
+from .models import Book, CostLot, PurchaseOrder, Sale, StockMovement
+
+CENT = Decimal('0.01')
+METHODS = ('fifo', 'average')
+# 最近进货单价取自这些来源的批次
+PURCHASE_SOURCES = ('purchase', 'legacy_purchase')
+
+
+def cost_method():
+    return getattr(settings, 'INVENTORY_COST_METHOD', 'fifo')
+
+
+def _allocate(lots, quantity, fallback, average=False):
+    """
+    从按入库时间排序的批次中先进先出取出 quantity，直接修改批次的 remaining。
+    返回 (成本, [(批次, 取出数量)])，批次不足的部分按 fallback 单价计算。
+    """
+    on_hand = [lot for lot in lots if lot.remaining > 0]
+    if average and on_hand:
+        units = sum(lot.remaining for lot in on_hand)
+        average_cost = sum(lot.remaining * lot.unit_cost for lot in on_hand) / units
+    taken = []
+    cost = Decimal(0)
+    left = quantity
+    for lot in on_hand:
+        if not left:
+            break
+        take = min(left, lot.remaining)
+        lot.remaining -= take
+        left -= take
+        cost += take * lot.unit_cost
+        taken.append((lot, take))
+    if average and taken:
+        cost = (quantity - left) * average_cost
+    cost += left * (fallback or 0)
+    return cost.quantize(CENT), taken
+
+
+def _latest_costs(book_ids):
+    latest = CostLot.objects.filter(book=OuterRef('pk'), source__in=PURCHASE_SOURCES).order_by('-received_at', '-id')
+    return dict(
+        Book.objects.filter(pk__in=list(book_ids))
+        .annotate(cost=Subquery(latest.values('unit_cost')[:1]))
+        .values_list('pk', 'cost')
+    )
+
+
+def receive(orders, received_at=None):
+    """进货付款：每个订单生成一个成本批次"""
+    CostLot.objects.bulk_create([
+        CostLot(
+            book_id=order.book_id, source='purchase', reference_id=order.id,
+            unit_cost=order.purchase_price, quantity=order.quantity, remaining=order.quantity,
+            received_at=received_at or order.updated_at,
+        )
+        for order in orders
+    ])
+
+
+def receive_legacy(purchases):
+    """旧版采购记录：入库即生成成本批次，入库时间取采购日期"""
+    CostLot.objects.bulk_create([
+        CostLot(
+            book_id=purchase.book_id, source='legacy_purchase', reference_id=purchase.id,
+            unit_cost=purchase.price, quantity=purchase.quantity, remaining=purchase.quantity,
+            received_at=purchase.purchase_date,
+        )
+        for purchase in purchases
+    ])
+
+
+def consume(requests):
+    """
+    requests 为 [(book_id, 数量)]，按顺序消耗成本批次，返回对应的销售成本列表。
+    需要在事务中调用，与库存扣减一起回滚。
+    """
+    lots = defaultdict(list)
+    for lot in (
+        CostLot.objects.select_for_update()
+        .filter(book_id__in={book_id for book_id, _ in requests}, remaining__gt=0)
+        .order_by('book_id', 'received_at', 'id')
+    ):
+        lots[lot.book_id].append(lot)
+    # 只有批次不足时才需要查询最近的进货单价
+    available = {book_id: sum(lot.remaining for lot in book_lots) for book_id, book_lots in lots.items()}
+    needed = defaultdict(int)
+    for book_id, quantity in requests:
+        needed[book_id] += quantity
+    short = [book_id for book_id, quantity in needed.items() if quantity > available.get(book_id, 0)]
+    fallback = _latest_costs(short) if short else {}
+
+    average = cost_method() == 'average'
+    costs = []
+    used = defaultdict(int)
+    for book_id, quantity in requests:
+        cost, taken = _allocate(lots[book_id], quantity, fallback.get(book_id), average)
+        costs.append(cost)
+        for lot, take in taken:
+            used[lot.pk] += take
+    if used:
+        CostLot.objects.filter(pk__in=list(used)).update(remaining=F('remaining') - Case(
+            *[When(pk=lot_id, then=Value(take)) for lot_id, take in used.items()],
+            default=Value(0), output_field=IntegerField(),
+        ))
+    return costs
+
+
+def _unit_cost(sale, fallback):
+    if sale.cogs is not None and sale.quantity:
+        return sale.cogs / sale.quantity
+    return fallback or 0
+
+
+def restore(sales):
+    """退货：按原销售的单位成本补回批次，入库时间取原销售时间"""
+    missing = {sale.book_id for sale in sales if sale.cogs is None}
+    fallback = _latest_costs(missing) if missing else {}
+    CostLot.objects.bulk_create([
+        CostLot(
+            book_id=sale.book_id, source='sale_return', reference_id=sale.id,
+            unit_cost=_unit_cost(sale, fallback.get(sale.book_id)),
+            quantity=sale.quantity, remaining=sale.quantity, received_at=sale.created_at,
+        )
+        for sale in sales
+    ])
+
+
+def replay_books(book_ids, method=None):
+    """
+    只读：按时间重放一组图书的进货付款、旧版采购、销售和退货，
+    返回 (新的批次列表, {销售ID: 销售成本})。
+    """
+    from purchases.models import Purchase as LegacyPurchase
+    from sales.models import Sale as LegacySale
+
+    average = (method or cost_method()) == 'average'
+    paid_at = StockMovement.objects.filter(
+        reason='purchase', reference_id=OuterRef('pk')
+    ).order_by('created_at').values('created_at')[:1]
+    # 事件排序：同一时刻先入库、再退货、最后销售
+    events = defaultdict(list)
+    for order in (
+        PurchaseOrder.objects.filter(book_id__in=book_ids, status__in=('paid', 'shelved'))
+        .annotate(paid_at=Coalesce(Subquery(paid_at), F('updated_at')))
+        .values('id', 'book_id', 'purchase_price', 'quantity', 'paid_at')
+    ):
+        events[order['book_id']].append((order['paid_at'], 0, order['id'], 'purchase', order))
+    for purchase in LegacyPurchase.objects.filter(book_id__in=book_ids).values(
+        'id', 'book_id', 'price', 'quantity', 'purchase_date'
+    ):
+        events[purchase['book_id']].append((purchase['purchase_date'], 0, purchase['id'], 'legacy_purchase', purchase))
+    for sale in Sale.objects.filter(book_id__in=book_ids).values(
+        'id', 'book_id', 'quantity', 'status', 'created_at', 'updated_at'
+    ):
+        events[sale['book_id']].append((sale['created_at'], 2, sale['id'], 'sale', sale))
+        if sale['status'] == 'returned':
+            events[sale['book_id']].append((sale['updated_at'], 1, sale['id'], 'return', sale))
+    for sale in LegacySale.objects.filter(book_id__in=book_ids).values('id', 'book_id', 'quantity', 'sale_date'):
+        events[sale['book_id']].append((sale['sale_date'], 2, sale['id'], 'legacy', sale))
+
+    all_lots = []
+    costs = {}
+    for book_id, book_events in events.items():
+        lots = []
+        latest = None
+        for moment, _, _, kind, row in sorted(book_events, key=lambda event: event[:3]):
+            if kind == 'purchase':
+                latest = row['purchase_price']
+                lots.append(CostLot(
+                    book_id=book_id, source='purchase', reference_id=row['id'], unit_cost=latest,
+                    quantity=row['quantity'], remaining=row['quantity'], received_at=moment,
+                ))
+            elif kind == 'legacy_purchase':
+                latest = row['price']
+                lots.append(CostLot(
+                    book_id=book_id, source='legacy_purchase', reference_id=row['id'], unit_cost=latest,
+                    quantity=row['quantity'], remaining=row['quantity'], received_at=moment,
+                ))
+            elif kind == 'return':
+                cost = costs.get(row['id'])
+                lots.append(CostLot(
+                    book_id=book_id, source='sale_return', reference_id=row['id'],
+                    unit_cost=cost / row['quantity'] if cost is not None and row['quantity'] else latest or 0,
+                    quantity=row['quantity'], remaining=row['quantity'], received_at=row['created_at'],
+                ))
+                lots.sort(key=lambda lot: lot.received_at)
+            else:
+                cost, _ = _allocate(lots, row['quantity'], latest, average)
+                if kind == 'sale':
+                    costs[row['id']] = cost
+        all_lots.extend(lots)
+    return all_lots, costs
+
+
+def write_books(book_ids, lots, costs):
+    """替换一组图书的成本批次并写回销售成本"""
+    with transaction.atomic():
+        CostLot.objects.filter(book_id__in=book_ids).delete()
+        CostLot.objects.bulk_create(lots, batch_size=1000)
+        sales = [Sale(pk=sale_id, cogs=cost) for sale_id, cost in costs.items()]
+        Sale.objects.bulk_update(sales, ['cogs'], batch_size=500)
+    return len(lots), len(sales)
@@ -0,0 +1,116 @@
+"""
+封面缩略图处理
+
+上传封面后在后台进程池中生成固定尺寸的 JPEG 缩略图和 WebP 版本。
+变体文件以图片内容的 SHA-256 命名，相同图片只处理、存储一次；
+内容相同的原图也会合并为同一个文件。
+
+render_variants 在子进程中运行，只依赖文件系统和 Pillow，不访问数据库。
+"""
+import hashlib
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from PIL import Image, features
+
+THUMBNAIL_SIZE = (96, 96)
+WEBP_SIZE = (320, 320)
+THUMBNAIL_DIR = 'book_covers/thumbs'
+WEBP_DIR = 'book_covers/webp'
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def _file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def _write_variant(image, media_root, name, size, image_format, **options):
+    path = os.path.join(media_root, name)
+    if os.path.exists(path):
+        return
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    variant = image.copy()
+    variant.thumbnail(size)
+    # 先写临时文件再改名，避免并发处理同一图片时读到半个文件
+    temporary = f'{path}.{os.getpid()}.tmp'
+    variant.save(temporary, image_format, **options)
+    os.replace(temporary, path)
+
+
+def render_variants(media_root, source_name):
+    """返回 (内容哈希, 缩略图路径, WebP 路径)，路径相对于 MEDIA_ROOT"""
+    source = os.path.join(media_root, source_name)
+    digest = _file_hash(source)
+    thumbnail_name = f'{THUMBNAIL_DIR}/{digest}.jpg'
+    webp_name = f'{WEBP_DIR}/{digest}.webp' if features.check('webp') else ''
+    with Image.open(source) as image:
+        image = image.convert('RGB')
+        _write_variant(image, media_root, thumbnail_name, THUMBNAIL_SIZE, 'JPEG', quality=85, optimize=True)
+        if webp_name:
+            _write_variant(image, media_root, webp_name, WEBP_SIZE, 'WEBP', quality=80)
+    return digest, thumbnail_name, webp_name
+
+
+def apply_variants(book_id, source_name, result):
+    from django.db.models import Q
+    from django.utils import timezone
+    from .models import Book
+
+    digest, thumbnail_name, webp_name = result
+    updates = {
+        'cover_hash': digest,
+        'cover_thumbnail': thumbnail_name,
+        'cover_webp': webp_name,
+        'updated_at': timezone.now(),
+    }
+    original = (
+        Book.objects.filter(cover_hash=digest).exclude(pk=book_id)
+        .exclude(Q(cover='') | Q(cover=source_name))
+        .values_list('cover', flat=True).first()
+    )
+    if original:
+        updates['cover'] = original
+    # 只在封面没有再次被替换时写入结果
+    updated = Book.objects.filter(pk=book_id, cover=source_name).update(**updates)
+    if updated and original and not Book.objects.filter(cover=source_name).exists():
+        Book._meta.get_field('cover').storage.delete(source_name)
+
+
+def _executor_instance(workers):
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=workers)
+    return _executor
+
+
+def _apply_in_thread(book_id, source_name, future):
+    from django.db import close_old_connections, connection
+    try:
+        apply_variants(book_id, source_name, future.result())
+    except Exception:
+        logger.exception('处理图书 %s 的封面失败', book_id)
+    finally:
+        close_old_connections()
+        connection.close()
+
+
+def schedule(book):
+    """为图书的当前封面安排后台处理，COVER_THUMBNAIL_WORKERS 为 0 时同步处理"""
+    from django.conf import settings
+
+    source_name = book.cover.name
+    workers = getattr(settings, 'COVER_THUMBNAIL_WORKERS', 2)
+    media_root = str(settings.MEDIA_ROOT)
+    if not workers:
+        apply_variants(book.id, source_name, render_variants(media_root, source_name))
+        return
+    future = _executor_instance(workers).submit(render_variants, media_root, source_name)
+    future.add_done_callback(lambda done: _apply_in_thread(book.id, source_name, done))
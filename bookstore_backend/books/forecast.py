@@ -0,0 +1,207 @@
+"""
+需求预测与补货建议
+
+从每日销售汇总读取最近 REORDER_HISTORY_DAYS 天的净销量（销量减退货），
+装入 图书 x 天 的 NumPy 矩阵，对全部图书一次性计算：
+日均销量、指数平滑预测（权重向量与矩阵相乘）、需求标准差、安全库存、再订货点和可售天数。
+库存不高于再订货点的图书建议补足到 到货周期 + 盘点周期 的预测需求加安全库存。
+
+结果整体替换 ReorderSuggestion；create_draft_orders 把建议转成一张未付款的进货单。
+"""
+import math
+import time
+from datetime import timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import CharField, F, OuterRef, Subquery
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from .models import Book, DailySalesRollup, PurchaseOrder, PurchaseOrderHeader, ReorderPolicy, ReorderSuggestion
+from .purchasing import RETAIL_MARKUP
+
+DEFAULTS = {
+    'REORDER_HISTORY_DAYS': 90,
+    'REORDER_SMOOTHING': 0.3,
+    'REORDER_LEAD_TIME_DAYS': 7,
+    'REORDER_REVIEW_DAYS': 14,
+    # 服务水平 95% 对应的正态分位数
+    'REORDER_SERVICE_Z': 1.65,
+}
+BATCH_SIZE = 5000
+CENT = Decimal('0.01')
+
+
+class ForecastError(Exception):
+    pass
+
+
+def _setting(name):
+    return getattr(settings, name, DEFAULTS[name])
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise ForecastError('服务器未安装 numpy，无法计算补货建议')
+    return numpy
+
+
+def load_history(np, book_ids, start, days):
+    """返回 len(book_ids) x days 的净销量矩阵，book_ids 需已排序"""
+    history = np.zeros((len(book_ids), days), dtype=np.float32)
+    # 日期以文本读出，由 NumPy 整列解析，避免逐行构造 date 对象
+    rows = list(DailySalesRollup.objects.filter(date__gte=start).values_list(
+        'book_id', Cast('date', CharField()), F('units') - F('returned_units')
+    ))
+    if not rows:
+        return history
+    book_column, date_column, net_column = zip(*rows)
+    rows_book = np.array(book_column, dtype=np.int64)
+    offsets = (np.array(date_column, dtype='datetime64[D]') - np.datetime64(start, 'D')).astype(np.int64)
+    positions = np.searchsorted(book_ids, rows_book)
+    known = (positions < len(book_ids)) & (book_ids[np.minimum(positions, len(book_ids) - 1)] == rows_book)
+    known &= (offsets >= 0) & (offsets < days)
+    np.add.at(history, (positions[known], offsets[known]), np.array(net_column, dtype=np.float32)[known])
+    return history
+
+
+def _ceil(np, values):
+    # 先舍去 float32 的累计误差，避免 14.000001 被进位成 15
+    return np.ceil(np.round(values, 4))
+
+
+def compute(np, history, stock, lead_time, review_days, reorder_override, alpha, z):
+    """全部参数为按图书对齐的数组，返回各项指标的数组"""
+    days = history.shape[1]
+    demand = np.maximum(history, 0)
+    velocity = demand.mean(axis=1)
+    # 指数平滑 level_t = a * x_t + (1 - a) * level_{t-1}，以第一天为初值展开成权重向量
+    weights = alpha * (1 - alpha) ** np.arange(days - 1, -1, -1, dtype=np.float64)
+    weights[0] += (1 - alpha) ** days
+    forecast = demand @ weights.astype(np.float32)
+    safety = _ceil(np, z * demand.std(axis=1) * np.sqrt(lead_time))
+    reorder_point = np.where(reorder_override >= 0, reorder_override, _ceil(np, forecast * lead_time + safety))
+    # 补足到 到货周期 + 盘点周期 的预测需求加安全库存，至少补到再订货点
+    target = np.maximum(_ceil(np, forecast * (lead_time + review_days) + safety), reorder_point)
+    suggested = np.where(stock <= reorder_point, np.maximum(target - stock, 0), 0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cover = np.where(forecast > 0, stock / forecast, np.nan)
+    return {
+        'velocity': velocity,
+        'forecast': forecast,
+        'safety_stock': safety,
+        'reorder_point': reorder_point,
+        'days_of_cover': cover,
+        'suggested_quantity': suggested,
+    }
+
+
+def write_suggestions(rows, computed_at):
+    """
+    rows 为 (book_id, 库存, 日均销量, 预测, 安全库存, 再订货点, 可售天数, 建议数量)。
+    全目录一次写入数万行，直接 executemany，不经过 bulk_create 逐字段准备参数。
+    """
+    columns = [
+        'book_id', 'stock', 'velocity', 'forecast', 'safety_stock', 'reorder_point',
+        'days_of_cover', 'suggested_quantity', 'computed_at',
+    ]
+    computed_at = ReorderSuggestion._meta.get_field('computed_at').get_db_prep_save(computed_at, connection)
+    quote = connection.ops.quote_name
+    sql = (
+        f"INSERT INTO {quote(ReorderSuggestion._meta.db_table)} ({', '.join(quote(column) for column in columns)}) "
+        f"VALUES ({', '.join(['%s'] * len(columns))})"
+    )
+    values = [
+        (
+            book_id, stock, round(velocity, 4), round(forecast, 4), int(safety), int(reorder_point),
+            None if math.isnan(cover) else round(cover, 2), int(suggested), computed_at,
+        )
+        for book_id, stock, velocity, forecast, safety, reorder_point, cover, suggested in rows
+    ]
+    with connection.cursor() as cursor:
+        for start in range(0, len(values), BATCH_SIZE):
+            cursor.executemany(sql, values[start:start + BATCH_SIZE])
+
+
+def run():
+    """计算全部在售图书的补货建议并整体替换，返回统计信息"""
+    np = _numpy()
+    started = time.monotonic()
+    now = timezone.now()
+    days = _setting('REORDER_HISTORY_DAYS')
+    start = timezone.localdate(now) - timedelta(days=days)
+
+    books = np.array(
+        list(Book.objects.exclude(status='discontinued').order_by('id').values_list('id', 'stock')),
+        dtype=np.int64,
+    ).reshape(-1, 2)
+    book_ids, stock = books[:, 0], books[:, 1].astype(np.float64)
+    history = load_history(np, book_ids, start, days)
+
+    lead_time = np.full(len(book_ids), _setting('REORDER_LEAD_TIME_DAYS'), dtype=np.float64)
+    reorder_override = np.full(len(book_ids), -1, dtype=np.float64)
+    for book_id, reorder_point, lead_days in ReorderPolicy.objects.values_list('book_id', 'reorder_point', 'lead_time_days'):
+        position = np.searchsorted(book_ids, book_id)
+        if position < len(book_ids) and book_ids[position] == book_id:
+            if reorder_point is not None:
+                reorder_override[position] = reorder_point
+            if lead_days is not None:
+                lead_time[position] = lead_days
+
+    result = compute(
+        np, history, stock, lead_time, _setting('REORDER_REVIEW_DAYS'),
+        reorder_override, _setting('REORDER_SMOOTHING'), _setting('REORDER_SERVICE_Z'),
+    )
+    # 没有销量也没有补货参数的图书不生成建议
+    keep = np.flatnonzero((result['forecast'] > 0) | (reorder_override >= 0) | (result['suggested_quantity'] > 0))
+    columns = {name: values[keep].tolist() for name, values in result.items()}
+    ids, stocks = book_ids[keep].tolist(), stock[keep].astype(np.int64).tolist()
+
+    with transaction.atomic():
+        ReorderSuggestion.objects.all().delete()
+        write_suggestions(
+            zip(
+                ids, stocks,
+                columns['velocity'], columns['forecast'], columns['safety_stock'], columns['reorder_point'],
+                columns['days_of_cover'], columns['suggested_quantity'],
+            ),
+            now,
+        )
+
+    return {
+        'books': len(book_ids),
+        'suggestions': len(ids),
+        'reorder': int((np.asarray(columns['suggested_quantity']) > 0).sum()) if ids else 0,
+        'elapsed_seconds': round(time.monotonic() - started, 3),
+    }
+
+
+def create_draft_orders(suggestions, operator):
+    """把补货建议转成一张未付款的进货单，进货价格取该书最近一次进货价，没有时按零售价倒推"""
+    suggestions = [suggestion for suggestion in suggestions if suggestion.suggested_quantity > 0]
+    if not suggestions:
+        return None
+    latest = PurchaseOrder.objects.filter(book=OuterRef('pk')).order_by('-created_at', '-id')
+    books = Book.objects.select_related('category').annotate(
+        last_price=Subquery(latest.values('purchase_price')[:1])
+    ).in_bulk([suggestion.book_id for suggestion in suggestions])
+    with transaction.atomic():
+        header = PurchaseOrderHeader.objects.create(note='补货建议生成', created_by=operator)
+        PurchaseOrder.objects.bulk_create([
+            PurchaseOrder(
+                header=header,
+                book=books[suggestion.book_id],
+                purchase_price=books[suggestion.book_id].last_price
+                or (books[suggestion.book_id].price / RETAIL_MARKUP).quantize(CENT),
+                quantity=suggestion.suggested_quantity,
+                created_by=operator,
+                created_at=header.created_at,
+                **PurchaseOrder.snapshot_fields(books[suggestion.book_id])
+            )
+            for suggestion in suggestions if suggestion.book_id in books
+        ])
+    return header
@@ -0,0 +1,155 @@
+"""
+供应商图书目录批量导入
+
+分块读取 CSV / XLSX，批量校验 ISBN，按 ISBN 执行
+bulk_create(update_conflicts=True) 插入或更新，分类名通过一次性加载的映射解析。
+已存在图书的库存和状态不会被目录覆盖。
+"""
+import csv
+import io
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .models import Book, Category
+from .scan import normalize_isbn
+from .signals import bulk_create_books
+
+CHUNK_SIZE = 1000
+MAX_REPORTED_ERRORS = 1000
+UPDATE_FIELDS = ['title', 'author', 'publisher', 'category', 'price', 'description', 'updated_at']
+
+
+class ImportFormatError(Exception):
+    pass
+
+
+def read_rows(file, filename):
+    """逐行产生 (行号, 字段字典)，行号从数据的第一行起算为 2（第 1 行为表头）"""
+    if filename.lower().endswith('.xlsx'):
+        try:
+            from openpyxl import load_workbook
+        except ImportError:
+            raise ImportFormatError('服务器未安装 openpyxl，无法读取 XLSX 文件')
+        sheet = load_workbook(file, read_only=True, data_only=True).active
+        rows = sheet.iter_rows(values_only=True)
+        header = [str(value).strip() if value is not None else '' for value in next(rows, ())]
+        for number, values in enumerate(rows, start=2):
+            yield number, {key: value for key, value in zip(header, values) if key}
+    else:
+        text = io.TextIOWrapper(file, encoding='utf-8-sig', newline='')
+        for number, row in enumerate(csv.DictReader(text), start=2):
+            yield number, row
+
+
+def _text(row, key):
+    value = row.get(key)
+    return '' if value is None else str(value).strip()
+
+
+class CatalogImporter:
+    def __init__(self, chunk_size=CHUNK_SIZE):
+        self.chunk_size = chunk_size
+        self.categories = dict(Category.objects.values_list('name', 'id'))
+        self.created = 0
+        self.updated = 0
+        self.failed = 0
+        self.errors = []
+
+    def error(self, number, isbn, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': number, 'isbn': isbn, 'error': message})
+
+    def category_id(self, name):
+        if not name:
+            return None
+        if name not in self.categories:
+            category, _ = Category.objects.get_or_create(name=name)
+            self.categories[name] = category.id
+        return self.categories[name]
+
+    def parse(self, number, row):
+        isbn = normalize_isbn(_text(row, 'isbn'))
+        if isbn is None:
+            self.error(number, _text(row, 'isbn'), 'ISBN必须是13位数字')
+            return None
+        for field in ('title', 'author', 'publisher'):
+            if not _text(row, field):
+                self.error(number, isbn, f'{field} 不能为空')
+                return None
+        try:
+            price = Decimal(_text(row, 'price'))
+            # NaN、Infinity 无法比较和舍入，按格式错误处理
+            if not price.is_finite():
+                raise InvalidOperation
+            price = price.quantize(Decimal('0.01'))
+        except InvalidOperation:
+            self.error(number, isbn, '价格格式错误')
+            return None
+        if price <= 0:
+            self.error(number, isbn, '价格必须大于0')
+            return None
+        try:
+            stock = int(_text(row, 'stock') or 0)
+        except ValueError:
+            self.error(number, isbn, '库存必须是整数')
+            return None
+        if stock < 0:
+            self.error(number, isbn, '库存不能为负数')
+            return None
+        return Book(
+            isbn=isbn,
+            title=_text(row, 'title')[:200],
+            author=_text(row, 'author')[:100],
+            publisher=_text(row, 'publisher')[:100],
+            category_id=self.category_id(_text(row, 'category')),
+            price=price,
+            stock=stock,
+            status='in_stock' if stock > 0 else 'out_of_stock',
+            description=_text(row, 'description'),
+        )
+
+    def flush(self, books):
+        if not books:
+            return
+        # 同一批次内重复的 ISBN 以最后一行为准
+        books = list({book.isbn: book for book in books}.values())
+        with transaction.atomic():
+            _, existing = bulk_create_books(
+                books,
+                update_conflicts=True,
+                unique_fields=['isbn'],
+                update_fields=UPDATE_FIELDS,
+            )
+        self.updated += len(existing)
+        self.created += len(books) - len(existing)
+
+    def run(self, rows):
+        started = time.monotonic()
+        total = 0
+        chunk = []
+        for number, row in rows:
+            total += 1
+            book = self.parse(number, row)
+            if book is not None:
+                chunk.append(book)
+            if len(chunk) >= self.chunk_size:
+                self.flush(chunk)
+                chunk = []
+        self.flush(chunk)
+        elapsed = time.monotonic() - started
+        return {
+            'total': total,
+            'created': self.created,
+            'updated': self.updated,
+            'failed': self.failed,
+            'errors': self.errors,
+            'elapsed_seconds': round(elapsed, 3),
+            'rows_per_second': round(total / elapsed) if elapsed else total,
+        }
+
+
+def import_catalog(file, filename, chunk_size=CHUNK_SIZE):
+    return CatalogImporter(chunk_size).run(read_rows(file, filename))
@@ -0,0 +1,182 @@
+"""
+畅销榜
+
+每个工作进程在内存中维护最近 30 天按小时分桶的销量（环形数组），
+以及 1 天 / 7 天 / 30 天窗口内每本书的累计销量（全部图书和按分类各一份）。销售和退货提交后增量更新，
+时间前进时把移出窗口的桶从累计中减去。取前 K 名用堆完成，结果缓存到下一次变化，
+重复的看板请求不需要重新计算。
+
+进程启动后首次使用时从最近 30 天的销售记录重建；
+多进程部署时，每次记录销量都把共享版本号加一，其他进程定期比对版本号，发现漏掉的变化时重建。
+"""
+import heapq
+import threading
+import time
+from collections import defaultdict
+from datetime import timedelta
+
+from django.db import transaction
+from django.db.models import Sum
+from django.db.models.functions import TruncHour
+from django.utils import timezone
+
+from .models import IndexVersion, Sale
+
+BUCKET_SECONDS = 3600
+WINDOWS = {'1d': 24, '7d': 24 * 7, '30d': 24 * 30}
+RING_SIZE = max(WINDOWS.values())
+REFRESH_INTERVAL = 30
+VERSION_NAME = 'leaderboard'
+
+
+def _bucket(moment):
+    return int(moment.timestamp() // BUCKET_SECONDS)
+
+
+class Leaderboard:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._version = None
+        self._checked_at = 0
+        self._reset()
+
+    def _reset(self, now_bucket=None):
+        self._ring = [None] * RING_SIZE  # 每个槽位为 (桶号, {(book_id, category_id): 销量})
+        self._totals = {window: defaultdict(int) for window in WINDOWS}
+        # 按分类的累计：{窗口: {category_id: {book_id: 销量}}}，分类榜不需要扫描全部图书
+        self._category_totals = {window: defaultdict(lambda: defaultdict(int)) for window in WINDOWS}
+        self._current = now_bucket
+        self._cache = {}
+
+    def _db_version(self):
+        return IndexVersion.current(VERSION_NAME)
+
+    def _apply(self, window, book_id, category_id, units):
+        for totals in (self._totals[window], self._category_totals[window][category_id]):
+            totals[book_id] += units
+            if totals[book_id] <= 0:
+                del totals[book_id]
+
+    def _advance(self, now_bucket):
+        """时间前进到 now_bucket，把移出各窗口的桶从累计中减去"""
+        if self._current is None or now_bucket <= self._current:
+            self._current = max(now_bucket, self._current or now_bucket)
+            return
+        for window, length in WINDOWS.items():
+            # 窗口从 (current - length, current] 移到 (now - length, now]
+            for bucket in range(self._current - length + 1, min(now_bucket - length, self._current) + 1):
+                slot = self._ring[bucket % RING_SIZE]
+                if slot is None or slot[0] != bucket:
+                    continue
+                for (book_id, category_id), units in slot[1].items():
+                    self._apply(window, book_id, category_id, -units)
+        self._current = now_bucket
+        self._cache = {}
+
+    def _add(self, bucket, book_id, category_id, units):
+        if bucket > self._current or bucket <= self._current - RING_SIZE:
+            return
+        position = bucket % RING_SIZE
+        slot = self._ring[position]
+        if category_id is None:
+            # 退货：图书之后可能换了分类，从原销售在该桶中计入的分类扣除
+            if slot is None or slot[0] != bucket:
+                return
+            remaining = -units
+            for (slot_book, slot_category), slot_units in list(slot[1].items()):
+                take = min(slot_units, remaining)
+                if slot_book == book_id and take > 0:
+                    self._add(bucket, book_id, slot_category, -take)
+                    remaining -= take
+            return
+        if slot is None or slot[0] != bucket:
+            slot = self._ring[position] = (bucket, defaultdict(int))
+        slot[1][(book_id, category_id)] += units
+        for window, length in WINDOWS.items():
+            if bucket > self._current - length:
+                self._apply(window, book_id, category_id, units)
+        self._cache = {}
+
+    def rebuild(self):
+        from sales.models import Sale as LegacySale
+
+        now = timezone.now()
+        since = now - timedelta(seconds=RING_SIZE * BUCKET_SECONDS)
+        version = self._db_version()
+        # 已退货的销售不计入排行
+        rows = list(
+            Sale.objects.filter(created_at__gte=since, status='completed')
+            .annotate(hour=TruncHour('created_at'))
+            .values('hour', 'book_id', 'book__category_id')
+            .annotate(units=Sum('quantity'))
+        ) + list(
+            LegacySale.objects.filter(sale_date__gte=since)
+            .annotate(hour=TruncHour('sale_date'))
+            .values('hour', 'book_id', 'book__category_id')
+            .annotate(units=Sum('quantity'))
+        )
+        with self._lock:
+            self._reset(_bucket(now))
+            for row in rows:
+                self._add(_bucket(row['hour']), row['book_id'], row['book__category_id'], row['units'])
+            self._version = version
+            self._loaded = True
+            self._checked_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        if not self._loaded:
+            self.rebuild()
+        elif time.monotonic() - self._checked_at > REFRESH_INTERVAL:
+            if self._db_version() != self._version:
+                self.rebuild()
+            else:
+                self._checked_at = time.monotonic()
+
+    def record(self, entries, moment=None):
+        """entries 为 [(book_id, category_id, 销量变化)]，退货传入负数，category_id 为 None 时按原销售计入的分类扣除"""
+        bucket = _bucket(moment or timezone.now())
+        self._record([(bucket,) + tuple(entry) for entry in entries])
+
+    def _record(self, entries):
+        # entries 为 [(桶号, book_id, category_id, 销量变化)]
+        version = IndexVersion.bump(VERSION_NAME)
+        if not self._loaded:
+            return
+        with self._lock:
+            self._advance(_bucket(timezone.now()))
+            for bucket, book_id, category_id, units in entries:
+                self._add(bucket, book_id, category_id, units)
+            # 版本号恰好是本次记录时才前进；期间其他进程记录的销量留给下一次检查时重建
+            if version == self._version + 1:
+                self._version = version
+
+    def record_sales(self, books, quantities):
+        """在事务提交后计入销量，books 为 {book_id: Book}"""
+        entries = [(book_id, books[book_id].category_id, quantity) for book_id, quantity in quantities.items()]
+        transaction.on_commit(lambda: self.record(entries))
+
+    def record_returns(self, sales):
+        # 退货从原销售所在的桶和当时计入的分类中扣除，不使用图书现在的分类
+        entries = [(_bucket(sale.created_at), sale.book_id, None, -sale.quantity) for sale in sales]
+        transaction.on_commit(lambda: self._record(entries))
+
+    def record_return(self, sale):
+        self.record_returns([sale])
+
+    def top(self, window, category=None, limit=10):
+        """返回 [(book_id, 销量)]，按销量降序"""
+        self._ensure_fresh()
+        with self._lock:
+            self._advance(_bucket(timezone.now()))
+            key = (window, category, limit)
+            if key not in self._cache:
+                if category is None:
+                    items = self._totals[window].items()
+                else:
+                    items = self._category_totals[window].get(category, {}).items()
+                self._cache[key] = heapq.nlargest(limit, items, key=lambda item: (item[1], -item[0]))
+            return self._cache[key]
+
+
+leaderboard = Leaderboard()
@@ -0,0 +1,133 @@
+import json
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from decimal import Decimal
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from accounts.models import User
+from books.models import Book
+from books.stock import adjust_stock
+from financials.models import Financial
+
+BENCHMARK_ISBN_PREFIX = '979999999'
+BENCHMARK_PRICE = Decimal('10.00')
+BENCHMARK_STOCK = 10 ** 9
+
+
+def _post(url, payload, token=None):
+    headers = {'Content-Type': 'application/json'}
+    if token:
+        headers['Authorization'] = f'Bearer {token}'
+    request = urllib.request.Request(url, json.dumps(payload).encode(), headers)
+    with urllib.request.urlopen(request, timeout=60) as response:
+        return response.status, json.loads(response.read() or b'null')
+
+
+class Command(BaseCommand):
+    help = (
+        '并发结账压测：分别向 WSGI 部署的 /sales/create_batch/ 和 ASGI 部署的 /pos/checkout/ '
+        '发送相同的结账请求，比较吞吐量和延迟。需要先用 deploy/ 下的配置启动两个服务，且使用同一个数据库。'
+        '压测会写入真实的销售、库存流水和财务记录，应使用专门的压测数据库，并需要 --confirm-writes 确认；'
+        '结束后删除压测图书及其全部记录，以及压测产生的销售收入'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi', default='http://127.0.0.1:8000', help='WSGI 服务地址，为空则跳过')
+        parser.add_argument('--asgi', default='http://127.0.0.1:8001', help='ASGI 服务地址，为空则跳过')
+        parser.add_argument('--username', required=True)
+        parser.add_argument('--password', required=True)
+        parser.add_argument('--concurrency', type=int, default=50, help='并发的收银台数')
+        parser.add_argument('--requests', type=int, default=500, help='每个服务的结账次数')
+        parser.add_argument('--items', type=int, default=3, help='每单的图书种数')
+        parser.add_argument(
+            '--confirm-writes', action='store_true',
+            help='确认允许在当前数据库中写入压测销售，不要对生产数据库使用'
+        )
+
+    def prepare_books(self, count):
+        # 压测用图书，库存足够大，避免压测过程中售罄；上次中断留下的压测图书先清理
+        self.cleanup()
+        books = []
+        for number in range(count):
+            book = Book.objects.create(
+                isbn=f'{BENCHMARK_ISBN_PREFIX}{number:04d}', title=f'压测图书 {number}', author='压测',
+                publisher='压测', price=BENCHMARK_PRICE, stock=0, status='out_of_stock',
+            )
+            # 库存经过库存流水增加，按时间查询库存的结果保持正确
+            adjust_stock(book.id, BENCHMARK_STOCK, 'adjustment')
+            books.append(book.id)
+        return books
+
+    def cleanup(self, operator=None, since=None, amount=None):
+        # 删除压测图书会级联删除其销售、库存流水、成本批次和销售汇总；财务记录不关联图书，按压测的条件删除
+        Book.objects.filter(isbn__startswith=BENCHMARK_ISBN_PREFIX).delete()
+        if operator is not None:
+            Financial.objects.filter(
+                operator=operator, type='income', category='sale', amount=amount, created_at__gte=since,
+            ).delete()
+
+    def run_target(self, url, token, payload, options):
+        latencies = []
+        errors = 0
+
+        def one(_):
+            started = time.perf_counter()
+            try:
+                status, _ = _post(url, payload, token)
+                ok = status == 201
+            except (urllib.error.URLError, OSError):
+                ok = False
+            return ok, time.perf_counter() - started
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as executor:
+            for ok, latency in executor.map(one, range(options['requests'])):
+                if ok:
+                    latencies.append(latency)
+                else:
+                    errors += 1
+        elapsed = time.perf_counter() - started
+        return {
+            'throughput': len(latencies) / elapsed if elapsed else 0,
+            'p50': statistics.median(latencies) * 1000 if latencies else 0,
+            'p95': statistics.quantiles(latencies, n=20)[-1] * 1000 if len(latencies) >= 20 else 0,
+            'errors': errors,
+        }
+
+    def handle(self, *args, **options):
+        if not options['confirm_writes']:
+            raise CommandError('压测会在当前数据库中写入销售和财务记录，请使用专门的压测数据库并加上 --confirm-writes')
+        operator = User.objects.filter(username=options['username']).first()
+        if operator is None:
+            raise CommandError(f"用户 {options['username']} 不存在")
+        started = timezone.now()
+        books = self.prepare_books(options['items'])
+        try:
+            self.run_targets(books, options)
+        finally:
+            self.cleanup(operator, started, BENCHMARK_PRICE * len(books))
+
+    def run_targets(self, books, options):
+        payload = {'items': [{'book_id': book_id, 'quantity': 1} for book_id in books]}
+        targets = [
+            ('WSGI', options['wsgi'], '/api/books/sales/create_batch/'),
+            ('ASGI', options['asgi'], '/api/books/pos/checkout/'),
+        ]
+        for name, base, path in targets:
+            if not base:
+                continue
+            base = base.rstrip('/')
+            try:
+                _, tokens = _post(f'{base}/api/token/', {
+                    'username': options['username'], 'password': options['password']
+                })
+            except (urllib.error.URLError, OSError) as exc:
+                raise CommandError(f'{name} 服务 {base} 无法登录: {exc}')
+            result = self.run_target(f'{base}{path}', tokens['access'], payload, options)
+            self.stdout.write(
+                f"{name:<5} {result['throughput']:8.1f} 单/秒  p50 {result['p50']:7.1f} ms  "
+                f"p95 {result['p95']:7.1f} ms  失败 {result['errors']}"
+            )
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from books.stock import create_checkpoints
+
+
+class Command(BaseCommand):
+    help = '把库存流水汇总为新的库存快照，建议定期执行（如每天一次）'
+
+    def handle(self, *args, **options):
+        created = create_checkpoints()
+        self.stdout.write(self.style.SUCCESS(f'新建库存快照 {created} 个'))
@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand, CommandError
+from books import forecast
+
+
+class Command(BaseCommand):
+    help = '根据最近的销售汇总计算全部在售图书的需求预测和补货建议，可由定时任务每天运行'
+
+    def handle(self, *args, **options):
+        try:
+            result = forecast.run()
+        except forecast.ForecastError as error:
+            raise CommandError(str(error))
+        self.stdout.write(self.style.SUCCESS(
+            f"计算 {result['books']} 本图书，生成 {result['suggestions']} 条建议，"
+            f"其中 {result['reorder']} 本需要补货，用时 {result['elapsed_seconds']} 秒"
+        ))
@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand, CommandError
+from books.importer import CHUNK_SIZE, ImportFormatError, import_catalog
+
+
+class Command(BaseCommand):
+    help = '从 CSV / XLSX 文件批量导入图书目录，按 ISBN 插入或更新'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE)
+
+    def handle(self, *args, **options):
+        try:
+            with open(options['path'], 'rb') as file:
+                report = import_catalog(file, options['path'], options['chunk_size'])
+        except (OSError, ImportFormatError) as exc:
+            raise CommandError(str(exc))
+
+        for error in report['errors']:
+            self.stderr.write(f"第 {error['row']} 行 {error['isbn']}: {error['error']}")
+        self.stdout.write(self.style.SUCCESS(
+            f"共 {report['total']} 行，新增 {report['created']}，更新 {report['updated']}，"
+            f"失败 {report['failed']}，耗时 {report['elapsed_seconds']} 秒"
+            f"（{report['rows_per_second']} 行/秒）"
+        ))
@@ -0,0 +1,41 @@
+from concurrent.futures import ProcessPoolExecutor
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from books.covers import apply_variants, render_variants
+from books.models import Book
+
+
+class Command(BaseCommand):
+    help = '为已有封面并行生成缩略图和 WebP 版本，并按内容哈希合并重复图片'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--workers', type=int, default=None, help='进程数，默认使用 CPU 核数')
+        parser.add_argument('--force', action='store_true', help='重新处理已处理过的封面')
+
+    def handle(self, *args, **options):
+        books = Book.objects.exclude(cover='').exclude(cover__isnull=True)
+        if not options['force']:
+            books = books.filter(cover_hash='')
+        pending = list(books.values_list('id', 'cover'))
+        # 同一个文件只处理一次
+        sources = sorted({cover for _, cover in pending})
+        media_root = str(settings.MEDIA_ROOT)
+
+        results = {}
+        failed = 0
+        with ProcessPoolExecutor(max_workers=options['workers']) as executor:
+            futures = {source: executor.submit(render_variants, media_root, source) for source in sources}
+            for source, future in futures.items():
+                try:
+                    results[source] = future.result()
+                except Exception as exc:
+                    failed += 1
+                    self.stderr.write(f'处理 {source} 失败: {exc}')
+
+        for book_id, cover in pending:
+            if cover in results:
+                apply_variants(book_id, cover, results[cover])
+
+        self.stdout.write(self.style.SUCCESS(
+            f'处理图书 {len(pending)} 本，封面文件 {len(sources)} 个，失败 {failed} 个'
+        ))
@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from bookstore_backend.idempotency import purge_expired_keys
+
+
+class Command(BaseCommand):
+    help = '删除超过 IDEMPOTENCY_KEY_TTL 的幂等键，建议定期执行'
+
+    def handle(self, *args, **options):
+        deleted = purge_expired_keys()
+        self.stdout.write(self.style.SUCCESS(f'删除过期幂等键 {deleted} 个'))
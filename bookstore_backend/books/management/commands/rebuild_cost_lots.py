@@ -0,0 +1,36 @@
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connections
+from books import costing
+from books.models import Book
+
+
+class Command(BaseCommand):
+    help = '根据进货和销售记录重新计算成本批次和每笔销售的成本，按图书分块并行计算，应在停止收银时运行'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--chunk-size', type=int, default=500, help='每块包含的图书数')
+        parser.add_argument('--workers', type=int, default=4, help='并行计算的进程数')
+        parser.add_argument('--method', choices=costing.METHODS, help='成本计算方式，默认使用 INVENTORY_COST_METHOD')
+
+    def handle(self, *args, **options):
+        chunk_size = options['chunk_size']
+        if chunk_size <= 0:
+            raise CommandError('--chunk-size 必须大于0')
+        book_ids = list(Book.objects.order_by('id').values_list('id', flat=True))
+        chunks = [book_ids[start:start + chunk_size] for start in range(0, len(book_ids), chunk_size)]
+
+        lots = sales = 0
+        # 重放只读，在子进程中并行计算；写入在主进程按块逐个提交。
+        # 先关闭数据库连接，子进程各自建立连接，不共用继承来的连接
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=max(options['workers'], 1)) as executor:
+            futures = {executor.submit(costing.replay_books, chunk, options['method']): chunk for chunk in chunks}
+            for future in as_completed(futures):
+                chunk = futures[future]
+                chunk_lots, chunk_sales = costing.write_books(chunk, *future.result())
+                lots += chunk_lots
+                sales += chunk_sales
+                self.stdout.write(f'图书 {chunk[0]}-{chunk[-1]}: {chunk_lots} 个批次, {chunk_sales} 笔销售')
+
+        self.stdout.write(self.style.SUCCESS(f'重建 {len(book_ids)} 本图书，共 {lots} 个批次、{sales} 笔销售成本'))
@@ -0,0 +1,52 @@
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.utils import timezone
+from books import rollup
+
+
+def _aggregate(month):
+    try:
+        return rollup.aggregate_month(month)
+    finally:
+        connection.close()
+
+
+class Command(BaseCommand):
+    help = (
+        '根据销售记录重新计算每日销售汇总，默认处理全部月份。已结束的月份按月并行汇总；'
+        '本月仍有销售写入，在一个事务中汇总并写入，期间收银会短暂等待，建议在停止收银时运行'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('months', nargs='*', help='要重建的月份，格式 YYYY-MM')
+        parser.add_argument('--workers', type=int, default=4, help='并行汇总的线程数')
+
+    def handle(self, *args, **options):
+        try:
+            months = [datetime.strptime(value, '%Y-%m').date() for value in options['months']]
+        except ValueError:
+            raise CommandError('月份格式应为 YYYY-MM')
+        months = months or rollup.sales_months()
+
+        current = timezone.localdate().replace(day=1)
+        closed = [month for month in months if month < current]
+
+        rows = 0
+        # 已结束的月份不会再有新的销售，汇总查询只读，可以并行；写入在主线程按月逐个提交
+        with ThreadPoolExecutor(max_workers=max(options['workers'], 1)) as executor:
+            futures = {executor.submit(_aggregate, month): month for month in closed}
+            for future in as_completed(futures):
+                month = futures[future]
+                count = rollup.write_month(month, future.result())
+                rows += count
+                self.stdout.write(f'{month:%Y-%m}: {count} 行')
+        # 本月（以及尚未到来的月份）汇总和写入放在同一个事务中，不丢失汇总期间提交的销售
+        for month in months:
+            if month >= current:
+                count = rollup.rebuild_month(month)
+                rows += count
+                self.stdout.write(f'{month:%Y-%m}: {count} 行')
+
+        self.stdout.write(self.style.SUCCESS(f'重建 {len(months)} 个月，共 {rows} 行汇总'))
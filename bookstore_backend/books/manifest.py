@@ -0,0 +1,136 @@
+"""
+供应商到货清单导入
+
+一张 CSV / XLSX 清单对应一张进货单，每行一个进货订单：
+isbn, quantity, purchase_price，目录中没有的新书还需要 title, author, publisher（可选 category, description）。
+
+一次查询按 ISBN 匹配目录，bulk_create 新建缺少的图书（零售价按进货价加价），
+再 bulk_create 进货单的全部订单行，全部在一个事务中完成。
+任何一行有错误时不写入任何数据，返回全部错误行。
+"""
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.db import transaction
+
+from .importer import MAX_REPORTED_ERRORS, _text, read_rows
+from .models import Book, Category, PurchaseOrder, PurchaseOrderHeader
+from .purchasing import RETAIL_MARKUP
+from .scan import normalize_isbn
+from .signals import bulk_create_books
+
+
+class ManifestError(Exception):
+    def __init__(self, message, errors=()):
+        super().__init__(message)
+        self.errors = list(errors)
+
+
+class ManifestImporter:
+    def __init__(self):
+        self.lines = []
+        self.failed = 0
+        self.errors = []
+
+    def error(self, number, isbn, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': number, 'isbn': isbn, 'error': message})
+
+    def parse(self, number, row):
+        isbn = normalize_isbn(_text(row, 'isbn'))
+        if isbn is None:
+            return self.error(number, _text(row, 'isbn'), 'ISBN必须是13位数字')
+        try:
+            quantity = int(_text(row, 'quantity'))
+        except ValueError:
+            return self.error(number, isbn, '数量必须是整数')
+        if quantity <= 0:
+            return self.error(number, isbn, '数量必须大于0')
+        try:
+            price = Decimal(_text(row, 'purchase_price'))
+        except InvalidOperation:
+            return self.error(number, isbn, '进货价格格式错误')
+        if not price.is_finite() or price <= 0:
+            return self.error(number, isbn, '进货价格必须大于0')
+        self.lines.append((number, isbn, quantity, price.quantize(Decimal('0.01')), row))
+
+    def build_new_books(self, existing):
+        """目录中没有的 ISBN 以第一次出现的行新建图书，分类一次性补齐"""
+        rows = {}
+        for number, isbn, quantity, price, row in self.lines:
+            if isbn in existing or isbn in rows:
+                continue
+            missing = [field for field in ('title', 'author', 'publisher') if not _text(row, field)]
+            if missing:
+                self.error(number, isbn, f'新书的 {"、".join(missing)} 不能为空')
+                continue
+            rows[isbn] = (price, row)
+
+        names = {_text(row, 'category') for _, row in rows.values()} - {''}
+        categories = Category.objects.in_bulk(names, field_name='name')
+        Category.objects.bulk_create([Category(name=name) for name in names - set(categories)], ignore_conflicts=True)
+        categories = Category.objects.in_bulk(names, field_name='name')
+
+        return [
+            Book(
+                isbn=isbn,
+                title=_text(row, 'title')[:200],
+                author=_text(row, 'author')[:100],
+                publisher=_text(row, 'publisher')[:100],
+                category=categories.get(_text(row, 'category')),
+                description=_text(row, 'description'),
+                # 与单本新书进货相同：零售价为进货价格的 1.3 倍，上架前库存为 0
+                price=(price * RETAIL_MARKUP).quantize(Decimal('0.01')),
+                stock=0,
+                status='out_of_stock',
+            )
+            for isbn, (price, row) in rows.items()
+        ]
+
+    def run(self, rows, supplier='', note='', operator=None):
+        started = time.monotonic()
+        for number, row in rows:
+            self.parse(number, row)
+        if not self.lines and not self.failed:
+            raise ManifestError('到货清单没有数据')
+
+        with transaction.atomic():
+            # 一次查询匹配目录中已有的图书
+            books = Book.objects.select_related('category').in_bulk(
+                {isbn for _, isbn, _, _, _ in self.lines}, field_name='isbn'
+            )
+            new_books = self.build_new_books(books)
+            if self.failed:
+                raise ManifestError(f'到货清单有 {self.failed} 行错误，未导入任何数据', self.errors)
+
+            bulk_create_books(new_books)
+            books.update({book.isbn: book for book in new_books})
+
+            header = PurchaseOrderHeader.objects.create(supplier=supplier, note=note, created_by=operator)
+            PurchaseOrder.objects.bulk_create([
+                PurchaseOrder(
+                    header=header,
+                    book=books[isbn],
+                    purchase_price=price,
+                    quantity=quantity,
+                    created_by=operator,
+                    created_at=header.created_at,
+                    **PurchaseOrder.snapshot_fields(books[isbn])
+                )
+                for _, isbn, quantity, price, _ in self.lines
+            ])
+
+        elapsed = time.monotonic() - started
+        return {
+            'header': header.id,
+            'lines': len(self.lines),
+            'created_books': len(new_books),
+            'total_quantity': sum(quantity for _, _, quantity, _, _ in self.lines),
+            'total_amount': sum(quantity * price for _, _, quantity, price, _ in self.lines),
+            'elapsed_seconds': round(elapsed, 3),
+        }
+
+
+def import_manifest(file, filename, supplier='', note='', operator=None):
+    return ManifestImporter().run(read_rows(file, filename), supplier, note, operator)
@@ -0,0 +1,22 @@
+from django.db import migrations
+
+from books import search
+
+
+def create_search_index(apps, schema_editor):
+    search.create_index(schema_editor)
+
+
+def drop_search_index(apps, schema_editor):
+    search.drop_index(schema_editor)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0005_sale'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0007_book_book_title_id_idx_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='book',
+            name='cover_hash',
+            field=models.CharField(blank=True, db_index=True, editable=False, max_length=64, verbose_name='封面内容哈希'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='cover_thumbnail',
+            field=models.ImageField(blank=True, editable=False, upload_to='book_covers/thumbs/', verbose_name='封面缩略图'),
+        ),
+        migrations.AddField(
+            model_name='book',
+            name='cover_webp',
+            field=models.ImageField(blank=True, editable=False, upload_to='book_covers/webp/', verbose_name='封面WebP'),
+        ),
+    ]
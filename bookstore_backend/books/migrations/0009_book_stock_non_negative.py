@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0008_book_cover_variants'),
+    ]
+
+    operations = [
+        migrations.AddConstraint(
+            model_name='book',
+            constraint=models.CheckConstraint(condition=models.Q(('stock__gte', 0)), name='book_stock_non_negative'),
+        ),
+    ]
@@ -0,0 +1,60 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:27
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+def create_initial_checkpoints(apps, schema_editor):
+    # 流水从此刻开始记录，以现有库存作为每本书的第一个快照
+    Book = apps.get_model('books', 'Book')
+    StockCheckpoint = apps.get_model('books', 'StockCheckpoint')
+    now = django.utils.timezone.now()
+    StockCheckpoint.objects.bulk_create([
+        StockCheckpoint(book_id=book_id, stock=stock, taken_at=now)
+        for book_id, stock in Book.objects.values_list('id', 'stock').iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0009_book_stock_non_negative'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StockCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.IntegerField(verbose_name='库存')),
+                ('taken_at', models.DateTimeField(verbose_name='快照时间')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_checkpoints', to='books.book', verbose_name='图书')),
+            ],
+            options={
+                'verbose_name': '库存快照',
+                'verbose_name_plural': '库存快照',
+                'indexes': [models.Index(fields=['book', 'taken_at'], name='checkpoint_book_taken_idx')],
+            },
+        ),
+        migrations.CreateModel(
+            name='StockMovement',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('quantity', models.IntegerField(verbose_name='变化数量')),
+                ('reason', models.CharField(choices=[('sale', '销售'), ('sale_return', '销售退货'), ('purchase', '进货付款'), ('shelve', '上架'), ('adjustment', '手动调整')], max_length=20, verbose_name='原因')),
+                ('reference_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='关联单据')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='发生时间')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='stock_movements', to='books.book', verbose_name='图书')),
+                ('operator', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='操作人')),
+            ],
+            options={
+                'verbose_name': '库存流水',
+                'verbose_name_plural': '库存流水',
+                'indexes': [models.Index(fields=['book', 'created_at'], name='movement_book_created_idx')],
+            },
+        ),
+        migrations.RunPython(create_initial_checkpoints, migrations.RunPython.noop),
+    ]
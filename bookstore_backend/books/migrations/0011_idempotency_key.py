@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:31
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0010_stock_ledger'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, verbose_name='幂等键')),
+                ('request_hash', models.CharField(max_length=64, verbose_name='请求摘要')),
+                ('status_code', models.PositiveSmallIntegerField(blank=True, null=True, verbose_name='响应状态码')),
+                ('response_body', models.TextField(blank=True, verbose_name='响应内容')),
+                ('created_at', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='创建时间')),
+                ('user', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='用户')),
+            ],
+            options={
+                'verbose_name': '幂等键',
+                'verbose_name_plural': '幂等键',
+                'constraints': [models.UniqueConstraint(fields=('user', 'key'), name='idempotency_user_key_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:32
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0011_idempotency_key'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailySalesRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('units', models.IntegerField(default=0, verbose_name='销售数量')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='销售额')),
+                ('returned_units', models.IntegerField(default=0, verbose_name='退货数量')),
+                ('returned_revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='退货金额')),
+                ('updated_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='更新时间')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='daily_sales', to='books.book', verbose_name='图书')),
+                ('category', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to='books.category', verbose_name='分类')),
+            ],
+            options={
+                'verbose_name': '每日销售汇总',
+                'verbose_name_plural': '每日销售汇总',
+                'indexes': [models.Index(fields=['date', 'category'], name='rollup_date_category_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'book'), name='rollup_date_book_unique')],
+            },
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:42
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0012_daily_sales_rollup'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='client_id',
+            field=models.CharField(blank=True, max_length=64, null=True, verbose_name='客户端编号'),
+        ),
+        migrations.AddConstraint(
+            model_name='sale',
+            constraint=models.UniqueConstraint(fields=('client_id', 'book'), name='sale_client_book_unique'),
+        ),
+    ]
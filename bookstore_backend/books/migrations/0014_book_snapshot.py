@@ -0,0 +1,87 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:46
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0013_sale_client_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='book_author',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='作者'),
+        ),
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='book_category',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='分类'),
+        ),
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='book_isbn',
+            field=models.CharField(blank=True, default='', max_length=13, verbose_name='ISBN'),
+        ),
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='book_title',
+            field=models.CharField(blank=True, default='', max_length=200, verbose_name='书名'),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='book_author',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='作者'),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='book_category',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='分类'),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='book_isbn',
+            field=models.CharField(blank=True, default='', max_length=13, verbose_name='ISBN'),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='book_title',
+            field=models.CharField(blank=True, default='', max_length=200, verbose_name='书名'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['book_title'], name='purchaseorder_book_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['book_isbn'], name='purchaseorder_book_isbn_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['book_author'], name='purchaseorder_book_author_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorder',
+            index=models.Index(fields=['book_category'], name='purchaseorder_book_cat_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['book_title'], name='sale_book_title_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['book_isbn'], name='sale_book_isbn_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['book_author'], name='sale_book_author_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='sale',
+            index=models.Index(fields=['book_category'], name='sale_book_category_idx'),
+        ),
+    ]
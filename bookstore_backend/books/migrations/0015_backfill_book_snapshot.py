@@ -0,0 +1,28 @@
+from django.db import migrations
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_book_snapshot(apps, schema_editor):
+    # 已有记录以当前的图书信息作为快照，每张表一条 UPDATE
+    Book = apps.get_model('books', 'Book')
+    book = Book.objects.filter(pk=OuterRef('book_id'))
+    snapshot = {
+        'book_title': Subquery(book.values('title')[:1]),
+        'book_isbn': Subquery(book.values('isbn')[:1]),
+        'book_author': Subquery(book.values('author')[:1]),
+        'book_category': Coalesce(Subquery(book.values('category__name')[:1]), Value('')),
+    }
+    for model_name in ('Sale', 'PurchaseOrder'):
+        apps.get_model('books', model_name).objects.filter(book_title='').update(**snapshot)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0014_book_snapshot'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_book_snapshot, migrations.RunPython.noop),
+    ]
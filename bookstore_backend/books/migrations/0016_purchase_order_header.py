@@ -0,0 +1,42 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:49
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0015_backfill_book_snapshot'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PurchaseOrderHeader',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('supplier', models.CharField(blank=True, max_length=100, verbose_name='供应商')),
+                ('note', models.TextField(blank=True, verbose_name='备注')),
+                ('status', models.CharField(choices=[('pending', '未付款'), ('paid', '已付款'), ('shelved', '已上架'), ('returned', '已退货')], default='pending', max_length=20, verbose_name='状态')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='创建时间')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('created_by', models.ForeignKey(null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='创建人')),
+            ],
+            options={
+                'verbose_name': '进货单',
+                'verbose_name_plural': '进货单',
+            },
+        ),
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='header',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='lines', to='books.purchaseorderheader', verbose_name='进货单'),
+        ),
+        migrations.AddIndex(
+            model_name='purchaseorderheader',
+            index=models.Index(fields=['created_at', 'id'], name='purchaseheader_created_id_idx'),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:56
+
+import django.db.models.deletion
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0016_purchase_order_header'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='cogs',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name='销售成本'),
+        ),
+        migrations.CreateModel(
+            name='CostLot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('source', models.CharField(choices=[('purchase', '进货付款'), ('sale_return', '销售退货')], default='purchase', max_length=20, verbose_name='来源')),
+                ('reference_id', models.PositiveIntegerField(blank=True, null=True, verbose_name='关联单据')),
+                ('unit_cost', models.DecimalField(decimal_places=4, max_digits=12, verbose_name='单位成本')),
+                ('quantity', models.IntegerField(verbose_name='入库数量')),
+                ('remaining', models.IntegerField(verbose_name='剩余数量')),
+                ('received_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='入库时间')),
+                ('book', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='cost_lots', to='books.book', verbose_name='图书')),
+            ],
+            options={
+                'verbose_name': '成本批次',
+                'verbose_name_plural': '成本批次',
+                'indexes': [models.Index(fields=['book', 'received_at', 'id'], name='costlot_book_received_idx')],
+                'constraints': [models.CheckConstraint(condition=models.Q(('remaining__gte', 0)), name='costlot_remaining_non_negative')],
+            },
+        ),
+    ]
@@ -0,0 +1,48 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0017_cost_lots'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ReorderPolicy',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('reorder_point', models.PositiveIntegerField(blank=True, null=True, verbose_name='再订货点')),
+                ('lead_time_days', models.PositiveIntegerField(blank=True, null=True, verbose_name='到货周期（天）')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reorder_policy', to='books.book', verbose_name='图书')),
+            ],
+            options={
+                'verbose_name': '补货参数',
+                'verbose_name_plural': '补货参数',
+            },
+        ),
+        migrations.CreateModel(
+            name='ReorderSuggestion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('stock', models.IntegerField(verbose_name='计算时库存')),
+                ('velocity', models.FloatField(verbose_name='日均销量')),
+                ('forecast', models.FloatField(verbose_name='预测日销量')),
+                ('safety_stock', models.IntegerField(verbose_name='安全库存')),
+                ('reorder_point', models.IntegerField(verbose_name='再订货点')),
+                ('days_of_cover', models.FloatField(blank=True, null=True, verbose_name='可售天数')),
+                ('suggested_quantity', models.IntegerField(verbose_name='建议进货数量')),
+                ('computed_at', models.DateTimeField(verbose_name='计算时间')),
+                ('book', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, related_name='reorder_suggestion', to='books.book', verbose_name='图书')),
+            ],
+            options={
+                'verbose_name': '补货建议',
+                'verbose_name_plural': '补货建议',
+                'indexes': [models.Index(fields=['days_of_cover', 'id'], name='suggestion_cover_id_idx'), models.Index(fields=['-suggested_quantity', 'id'], name='suggestion_quantity_id_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0018_reorder_suggestions'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IndexVersion',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=50, unique=True, verbose_name='索引名称')),
+                ('version', models.BigIntegerField(default=0, verbose_name='版本')),
+            ],
+            options={
+                'verbose_name': '索引版本',
+                'verbose_name_plural': '索引版本',
+            },
+        ),
+    ]
@@ -0,0 +1,65 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:48
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def backfill_book_publisher(apps, schema_editor):
+    # 已有记录以当前图书的出版社作为快照，每张表一条 UPDATE
+    Book = apps.get_model('books', 'Book')
+    publisher = Subquery(Book.objects.filter(pk=OuterRef('book_id')).values('publisher')[:1])
+    for model_name in ('Sale', 'PurchaseOrder'):
+        apps.get_model('books', model_name).objects.update(book_publisher=publisher)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0019_index_version'),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='purchaseorder',
+            name='purchaseorder_book_title_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='purchaseorder',
+            name='purchaseorder_book_isbn_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='purchaseorder',
+            name='purchaseorder_book_author_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='purchaseorder',
+            name='purchaseorder_book_cat_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='sale',
+            name='sale_book_title_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='sale',
+            name='sale_book_isbn_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='sale',
+            name='sale_book_author_idx',
+        ),
+        migrations.RemoveIndex(
+            model_name='sale',
+            name='sale_book_category_idx',
+        ),
+        migrations.AddField(
+            model_name='purchaseorder',
+            name='book_publisher',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='出版社'),
+        ),
+        migrations.AddField(
+            model_name='sale',
+            name='book_publisher',
+            field=models.CharField(blank=True, default='', max_length=100, verbose_name='出版社'),
+        ),
+        migrations.RunPython(backfill_book_publisher, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 14:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0020_book_publisher_snapshot'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='costlot',
+            name='source',
+            field=models.CharField(choices=[('purchase', '进货付款'), ('legacy_purchase', '旧版采购'), ('sale_return', '销售退货')], default='purchase', max_length=20, verbose_name='来源'),
+        ),
+        migrations.AlterField(
+            model_name='stockmovement',
+            name='reason',
+            field=models.CharField(choices=[('sale', '销售'), ('sale_return', '销售退货'), ('purchase', '进货付款'), ('legacy_purchase', '旧版采购'), ('shelve', '上架'), ('adjustment', '手动调整')], max_length=20, verbose_name='原因'),
+        ),
+    ]
@@ -0,0 +1,24 @@
+from django.db import migrations
+
+from books import search
+
+
+def create_snapshot_indexes(apps, schema_editor):
+    for table in search.SNAPSHOT_TABLES:
+        search.create_snapshot_index(schema_editor, table)
+
+
+def drop_snapshot_indexes(apps, schema_editor):
+    for table in search.SNAPSHOT_TABLES:
+        search.drop_snapshot_index(schema_editor, table)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('books', '0021_legacy_purchase_cost_lots'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_snapshot_indexes, drop_snapshot_indexes),
+    ]
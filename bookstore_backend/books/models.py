@@ -35,6 +35,9 @@ class Book(models.Model):
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='in_stock', verbose_name='状态')
     description = models.TextField(_('描述'), blank=True)
     cover = models.ImageField(upload_to='book_covers/', null=True, blank=True, verbose_name='封面')
+    cover_hash = models.CharField(max_length=64, blank=True, db_index=True, editable=False, verbose_name='封面内容哈希')
+    cover_thumbnail = models.ImageField(upload_to='book_covers/thumbs/', blank=True, editable=False, verbose_name='封面缩略图')
+    cover_webp = models.ImageField(upload_to='book_covers/webp/', blank=True, editable=False, verbose_name='封面WebP')
     created_at = models.DateTimeField(_('创建时间'), auto_now_add=True)
     updated_at = models.DateTimeField(_('更新时间'), auto_now=True)
 
@@ -42,23 +45,118 @@ class Book(models.Model):
         verbose_name = _('图书')
         verbose_name_plural = _('图书')
         ordering = ['title']
+        indexes = [
+            models.Index(fields=['title', 'id'], name='book_title_id_idx'),
+        ]
+        constraints = [
+            # 库存由数据库保证非负，库存变更见 books.stock
+            models.CheckConstraint(condition=models.Q(stock__gte=0), name='book_stock_non_negative'),
+        ]
 
     def __str__(self):
         return self.title
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # 记录加载时的书名和作者，保存时据此判断联想索引是否需要更新
+        instance._loaded_names = (instance.__dict__.get('title'), instance.__dict__.get('author'))
+        return instance
+
+class IndexVersion(models.Model):
+    """进程内索引的共享版本号，数据变化时加一，其他工作进程据此判断是否需要重建"""
+    name = models.CharField(max_length=50, unique=True, verbose_name='索引名称')
+    version = models.BigIntegerField(default=0, verbose_name='版本')
+
+    class Meta:
+        verbose_name = '索引版本'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f"{self.name}: {self.version}"
+
+    @classmethod
+    def current(cls, name):
+        return cls.objects.filter(name=name).values_list('version', flat=True).first() or 0
+
+    @classmethod
+    def bump(cls, name):
+        """版本号加一并返回新的版本号"""
+        if not cls.objects.filter(name=name).update(version=models.F('version') + 1):
+            cls.objects.get_or_create(name=name, defaults={'version': 1})
+        return cls.current(name)
+
+class BookSnapshot(models.Model):
+    """写入时记录的图书信息：图书改名后历史记录不变，列表和搜索不需要关联图书表"""
+    book_title = models.CharField(max_length=200, blank=True, default='', verbose_name='书名')
+    book_isbn = models.CharField(max_length=13, blank=True, default='', verbose_name='ISBN')
+    book_author = models.CharField(max_length=100, blank=True, default='', verbose_name='作者')
+    book_publisher = models.CharField(max_length=100, blank=True, default='', verbose_name='出版社')
+    book_category = models.CharField(max_length=100, blank=True, default='', verbose_name='分类')
+
+    class Meta:
+        abstract = True
+
+    @staticmethod
+    def snapshot_fields(book):
+        # 调用方需要预先 select_related('category')，避免逐行查询
+        return {
+            'book_title': book.title,
+            'book_isbn': book.isbn,
+            'book_author': book.author,
+            'book_publisher': book.publisher,
+            'book_category': book.category.name if book.category_id else '',
+        }
+
     def save(self, *args, **kwargs):
-        # 确保库存不为负数
-        if self.stock < 0:
-            self.stock = 0
+        if self._state.adding and not self.book_title:
+            for field, value in self.snapshot_fields(self.book).items():
+                setattr(self, field, value)
         super().save(*args, **kwargs)
 
-class PurchaseOrder(models.Model):
+
+class PurchaseOrderHeader(models.Model):
+    """进货单：一次供应商到货，包含多行进货订单，付款和上架对整张单据一次完成"""
+    STATUS_CHOICES = (
+        ('pending', '未付款'),
+        ('paid', '已付款'),
+        ('shelved', '已上架'),
+        ('returned', '已退货'),
+    )
+
+    supplier = models.CharField(max_length=100, blank=True, verbose_name='供应商')
+    note = models.TextField(blank=True, verbose_name='备注')
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending', verbose_name='状态')
+    created_by = models.ForeignKey('accounts.User', on_delete=models.SET_NULL, null=True, verbose_name='创建人')
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='创建时间')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        verbose_name = '进货单'
+        verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='purchaseheader_created_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"进货单 {self.id}"
+
+    @property
+    def total_amount(self):
+        return sum(line.purchase_price * line.quantity for line in self.lines.all())
+
+
+class PurchaseOrder(BookSnapshot):
     STATUS_CHOICES = (
         ('pending', '未付款'),
         ('paid', '已付款'),
         ('returned', '已退货'),
     )
 
+    header = models.ForeignKey(
+        PurchaseOrderHeader, on_delete=models.CASCADE, null=True, blank=True,
+        related_name='lines', verbose_name='进货单'
+    )
     book = models.ForeignKey(Book, on_delete=models.CASCADE, verbose_name='图书')
     purchase_price = models.DecimalField(max_digits=10, decimal_places=2, verbose_name='进货价格')
     quantity = models.IntegerField(verbose_name='数量')
@@ -70,12 +168,15 @@ class PurchaseOrder(models.Model):
     class Meta:
         verbose_name = '进货订单'
         verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='purchaseorder_created_id_idx'),
+        ]
 
     def __str__(self):
-        return f"{self.book.title} - {self.quantity}本"
+        return f"{self.book_title} - {self.quantity}本"
     
 
-class Sale(models.Model):
+class Sale(BookSnapshot):
     STATUS_CHOICES = (
         ('completed', '已完成'),
         ('returned', '已退货'),
@@ -88,14 +189,193 @@ class Sale(models.Model):
     created_by = models.ForeignKey('accounts.User', on_delete=models.SET_NULL, null=True, verbose_name='创建人', related_name='created_sales')
     created_at = models.DateTimeField(default=timezone.now, verbose_name='创建时间')
     updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+    # 写入时按成本批次计算的销售成本，早于成本批次的历史记录为空
+    cogs = models.DecimalField(max_digits=12, decimal_places=2, null=True, blank=True, verbose_name='销售成本')
+    # 离线收银台生成的小票编号，同步时用于去重
+    client_id = models.CharField(max_length=64, null=True, blank=True, verbose_name='客户端编号')
 
     class Meta:
         verbose_name = '销售记录'
         verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='sale_created_id_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['client_id', 'book'], name='sale_client_book_unique'),
+        ]
 
     def __str__(self):
-        return f"{self.book.title} - {self.quantity}本"
+        return f"{self.book_title} - {self.quantity}本"
 
     @property
     def total_amount(self):
         return self.quantity * self.sale_price
+
+
+class StockMovement(models.Model):
+    """库存流水，只追加不修改；quantity 为带符号的变化量"""
+    REASON_CHOICES = (
+        ('sale', '销售'),
+        ('sale_return', '销售退货'),
+        ('purchase', '进货付款'),
+        ('legacy_purchase', '旧版采购'),
+        ('shelve', '上架'),
+        ('adjustment', '手动调整'),
+    )
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='stock_movements', verbose_name='图书')
+    quantity = models.IntegerField(verbose_name='变化数量')
+    reason = models.CharField(max_length=20, choices=REASON_CHOICES, verbose_name='原因')
+    reference_id = models.PositiveIntegerField(null=True, blank=True, verbose_name='关联单据')
+    operator = models.ForeignKey('accounts.User', on_delete=models.SET_NULL, null=True, blank=True, verbose_name='操作人')
+    created_at = models.DateTimeField(default=timezone.now, verbose_name='发生时间')
+
+    class Meta:
+        verbose_name = '库存流水'
+        verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(fields=['book', 'created_at'], name='movement_book_created_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} {self.quantity:+d} ({self.reason})"
+
+    def save(self, *args, **kwargs):
+        if not self._state.adding:
+            raise ValueError('库存流水只能追加，不能修改')
+        super().save(*args, **kwargs)
+
+
+class StockCheckpoint(models.Model):
+    """某一时刻的库存快照，按时间点查询库存时从最近的快照开始累加流水"""
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='stock_checkpoints', verbose_name='图书')
+    stock = models.IntegerField(verbose_name='库存')
+    taken_at = models.DateTimeField(verbose_name='快照时间')
+
+    class Meta:
+        verbose_name = '库存快照'
+        verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(fields=['book', 'taken_at'], name='checkpoint_book_taken_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} @ {self.taken_at}: {self.stock}"
+
+
+class CostLot(models.Model):
+    """
+    成本批次：进货付款时按订单生成（旧版采购记录在创建时生成），销售按先进先出消耗 remaining，
+    退货按原销售的单位成本补回一个批次。见 books.costing
+    """
+    SOURCE_CHOICES = (
+        ('purchase', '进货付款'),
+        ('legacy_purchase', '旧版采购'),
+        ('sale_return', '销售退货'),
+    )
+
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='cost_lots', verbose_name='图书')
+    source = models.CharField(max_length=20, choices=SOURCE_CHOICES, default='purchase', verbose_name='来源')
+    reference_id = models.PositiveIntegerField(null=True, blank=True, verbose_name='关联单据')
+    unit_cost = models.DecimalField(max_digits=12, decimal_places=4, verbose_name='单位成本')
+    quantity = models.IntegerField(verbose_name='入库数量')
+    remaining = models.IntegerField(verbose_name='剩余数量')
+    received_at = models.DateTimeField(default=timezone.now, verbose_name='入库时间')
+
+    class Meta:
+        verbose_name = '成本批次'
+        verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(fields=['book', 'received_at', 'id'], name='costlot_book_received_idx'),
+        ]
+        constraints = [
+            models.CheckConstraint(condition=models.Q(remaining__gte=0), name='costlot_remaining_non_negative'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id} @ {self.unit_cost}: {self.remaining}/{self.quantity}"
+
+
+class ReorderPolicy(models.Model):
+    """单本图书的补货参数，为空的字段使用 settings 中的默认值"""
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, related_name='reorder_policy', verbose_name='图书')
+    reorder_point = models.PositiveIntegerField(null=True, blank=True, verbose_name='再订货点')
+    lead_time_days = models.PositiveIntegerField(null=True, blank=True, verbose_name='到货周期（天）')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        verbose_name = '补货参数'
+        verbose_name_plural = verbose_name
+
+    def __str__(self):
+        return f"{self.book_id}: {self.reorder_point}"
+
+
+class ReorderSuggestion(models.Model):
+    """forecast_reorders 批量计算的补货建议，每次运行整体替换"""
+    book = models.OneToOneField(Book, on_delete=models.CASCADE, related_name='reorder_suggestion', verbose_name='图书')
+    stock = models.IntegerField(verbose_name='计算时库存')
+    velocity = models.FloatField(verbose_name='日均销量')
+    forecast = models.FloatField(verbose_name='预测日销量')
+    safety_stock = models.IntegerField(verbose_name='安全库存')
+    reorder_point = models.IntegerField(verbose_name='再订货点')
+    days_of_cover = models.FloatField(null=True, blank=True, verbose_name='可售天数')
+    suggested_quantity = models.IntegerField(verbose_name='建议进货数量')
+    computed_at = models.DateTimeField(verbose_name='计算时间')
+
+    class Meta:
+        verbose_name = '补货建议'
+        verbose_name_plural = verbose_name
+        indexes = [
+            models.Index(fields=['days_of_cover', 'id'], name='suggestion_cover_id_idx'),
+            models.Index(fields=['-suggested_quantity', 'id'], name='suggestion_quantity_id_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.book_id}: {self.suggested_quantity}"
+
+
+class IdempotencyKey(models.Model):
+    """写操作的幂等键，同一用户重复提交相同的键时直接返回保存的响应"""
+    key = models.CharField(max_length=255, verbose_name='幂等键')
+    user = models.ForeignKey('accounts.User', on_delete=models.CASCADE, null=True, blank=True, verbose_name='用户')
+    request_hash = models.CharField(max_length=64, verbose_name='请求摘要')
+    # 为空表示请求仍在处理中
+    status_code = models.PositiveSmallIntegerField(null=True, blank=True, verbose_name='响应状态码')
+    response_body = models.TextField(blank=True, verbose_name='响应内容')
+    created_at = models.DateTimeField(default=timezone.now, db_index=True, verbose_name='创建时间')
+
+    class Meta:
+        verbose_name = '幂等键'
+        verbose_name_plural = verbose_name
+        constraints = [
+            models.UniqueConstraint(fields=['user', 'key'], name='idempotency_user_key_unique'),
+        ]
+
+    def __str__(self):
+        return self.key
+
+
+class DailySalesRollup(models.Model):
+    """按 (日期, 图书) 汇总的销售数据，销售和退货时在同一事务中增量更新"""
+    date = models.DateField(verbose_name='日期')
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name='daily_sales', verbose_name='图书')
+    category = models.ForeignKey(Category, on_delete=models.SET_NULL, null=True, blank=True, verbose_name='分类')
+    units = models.IntegerField(default=0, verbose_name='销售数量')
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='销售额')
+    returned_units = models.IntegerField(default=0, verbose_name='退货数量')
+    returned_revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='退货金额')
+    updated_at = models.DateTimeField(default=timezone.now, verbose_name='更新时间')
+
+    class Meta:
+        verbose_name = '每日销售汇总'
+        verbose_name_plural = verbose_name
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'book'], name='rollup_date_book_unique'),
+        ]
+        indexes = [
+            models.Index(fields=['date', 'category'], name='rollup_date_category_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} {self.book_id}: {self.units}"
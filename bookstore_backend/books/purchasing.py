@@ -0,0 +1,149 @@
+"""
+进货付款与上架
+
+pay_orders / shelve_orders 对一组进货订单一次完成：一条条件 UPDATE 修改状态，
+一条 UPDATE 增加库存并写入流水，付款只记一笔支出。查询次数与订单行数无关。
+调用方需要在 transaction.atomic 中调用，抛出 PurchaseError 时整体回滚。
+"""
+from collections import defaultdict
+from decimal import Decimal, InvalidOperation
+
+from django.db.models import Case, DecimalField, Value, When
+from django.utils import timezone
+
+from financials.models import Financial
+from .models import Book, PurchaseOrder
+from . import costing
+from .stock import apply_stock_changes
+
+
+# 新书的零售价为进货价格的 1.3 倍
+RETAIL_MARKUP = Decimal('1.3')
+PAY_ERROR = '只有未付款的订单才能进行付款'
+SHELVE_ERROR = '只有已付款的订单才能上架'
+
+
+class PurchaseError(Exception):
+    pass
+
+
+def parse_retail_prices(data):
+    """把 {book_id: 零售价} 整理为 {int: Decimal}"""
+    if data in (None, ''):
+        return {}
+    if not isinstance(data, dict):
+        raise PurchaseError('零售价格格式错误')
+    prices = {}
+    for book_id, price in data.items():
+        try:
+            book_id, price = int(book_id), Decimal(str(price))
+        except (TypeError, ValueError, InvalidOperation):
+            raise PurchaseError('零售价格格式错误')
+        if not price.is_finite() or price <= 0:
+            raise PurchaseError('零售价格必须为正数')
+        prices[book_id] = price
+    return prices
+
+
+def collect_order_ids(order_ids):
+    if not order_ids or not isinstance(order_ids, list):
+        raise PurchaseError('订单列表不能为空')
+    try:
+        ids = [int(order_id) for order_id in order_ids]
+    except (TypeError, ValueError):
+        raise PurchaseError('订单列表格式错误')
+    return list(dict.fromkeys(ids))
+
+
+def partition_orders(ids, source, error, retail_prices=None):
+    """
+    一次查询加载订单并检查状态转换，返回 (可以处理的订单, {订单ID: 错误信息})。
+    给出 retail_prices 时（上架）还检查新书是否有零售价格。
+    """
+    orders = PurchaseOrder.objects.select_related('book').in_bulk(ids)
+    accepted, errors = [], {}
+    for order_id in ids:
+        order = orders.get(order_id)
+        if order is None:
+            errors[order_id] = '订单不存在'
+        elif order.header_id:
+            errors[order_id] = f'该订单属于进货单 {order.header_id}，请对整张进货单操作'
+        elif order.status != source:
+            errors[order_id] = error
+        elif retail_prices is not None and order.book.stock == 0 and order.book_id not in retail_prices:
+            errors[order_id] = f'图书 《{order.book.title}》 需要设置零售价格'
+        else:
+            accepted.append(order)
+    return accepted, errors
+
+
+def _stock_changes(orders):
+    changes = defaultdict(int)
+    references = defaultdict(list)
+    for order in orders:
+        changes[order.book_id] += order.quantity
+        references[order.book_id].append(order.id)
+    # 同一本书有多行时合并为一条流水，只有一行时才能关联到订单
+    return changes, {book_id: ids[0] for book_id, ids in references.items() if len(ids) == 1}
+
+
+def _transition(orders, source, target, error):
+    """按原状态条件更新，重复提交或并发操作只有一次生效"""
+    now = timezone.now()
+    updated = PurchaseOrder.objects.filter(
+        pk__in=[order.id for order in orders], status=source
+    ).update(status=target, updated_at=now)
+    if updated != len(orders):
+        raise PurchaseError(error)
+    for order in orders:
+        order.status, order.updated_at = target, now
+
+
+def pay_orders(orders, operator, description=None, source=None):
+    """orders 为待付款的进货订单，需要 select_related('book')；source 为支出记录关联的单据"""
+    if any(order.status != 'pending' for order in orders):
+        raise PurchaseError(PAY_ERROR)
+    _transition(orders, 'pending', 'paid', PAY_ERROR)
+
+    # 更新图书库存
+    changes, references = _stock_changes(orders)
+    apply_stock_changes(changes, 'purchase', references=references, operator=operator)
+    costing.receive(orders)
+
+    if description is None:
+        description = f'进货图书 {len(changes)} 种 {sum(changes.values())} 本'
+    Financial.objects.create(
+        type='expense',
+        category='purchase',
+        amount=sum(order.purchase_price * order.quantity for order in orders),
+        description=description,
+        operator=operator,
+        content_object=source
+    )
+
+
+def shelve_orders(orders, operator, retail_prices=None):
+    """
+    orders 为已付款的进货订单，需要 select_related('book')；
+    库存为 0 的图书是新书，需要在 retail_prices 中给出零售价格。
+    返回上架涉及的图书 id。
+    """
+    if any(order.status != 'paid' for order in orders):
+        raise PurchaseError(SHELVE_ERROR)
+    retail_prices = retail_prices or {}
+    prices = {}
+    for order in orders:
+        if order.book.stock == 0:
+            if order.book_id not in retail_prices:
+                raise PurchaseError(f'图书 《{order.book.title}》 需要设置零售价格')
+            prices[order.book_id] = retail_prices[order.book_id]
+    _transition(orders, 'paid', 'shelved', SHELVE_ERROR)
+
+    if prices:
+        Book.objects.filter(pk__in=list(prices)).update(price=Case(
+            *[When(pk=book_id, then=Value(price)) for book_id, price in prices.items()],
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        ))
+    changes, references = _stock_changes(orders)
+    apply_stock_changes(changes, 'shelve', references=references, operator=operator)
+    return list(changes)
@@ -0,0 +1,176 @@
+"""
+每日销售汇总
+
+销售和退货在各自的事务中调用 record_sales / record_return 增量更新 DailySalesRollup，
+报表只读汇总表，不再扫描销售记录。
+rebuild_month 从 books.Sale 和旧版 sales.Sale 重新计算某个月的汇总，用于回填历史数据；
+汇总和写入在同一个事务中完成，可以用于仍有销售写入的当月。
+"""
+from datetime import date, datetime
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, DecimalField, ExpressionWrapper, F, IntegerField, Sum, Value, When
+from django.db.models.functions import TruncDate
+from django.utils import timezone
+
+from .models import DailySalesRollup, Sale
+
+COUNTERS = ('units', 'revenue', 'returned_units', 'returned_revenue')
+AMOUNT = ExpressionWrapper(F('quantity') * F('sale_price'), output_field=DecimalField(max_digits=12, decimal_places=2))
+
+
+def _increment(field, changes):
+    output = DecimalField(max_digits=12, decimal_places=2) if field.endswith('revenue') else IntegerField()
+    return F(field) + Case(
+        *[When(book_id=book_id, then=Value(values[field], output_field=output))
+          for book_id, values in changes.items() if values.get(field)],
+        default=Value(0, output_field=output),
+    )
+
+
+def apply_changes(day, changes):
+    """
+    changes 为 {book_id: {'category_id': ..., 'units': ..., 'revenue': ...}}，
+    固定两条查询：先插入缺少的行，再用一条 UPDATE 累加全部计数。
+    """
+    if not changes:
+        return
+    now = timezone.now()
+    DailySalesRollup.objects.bulk_create([
+        DailySalesRollup(date=day, book_id=book_id, category_id=values.get('category_id'), updated_at=now)
+        for book_id, values in changes.items()
+    ], ignore_conflicts=True)
+    DailySalesRollup.objects.filter(date=day, book_id__in=list(changes)).update(
+        updated_at=now,
+        **{field: _increment(field, changes) for field in COUNTERS
+           if any(values.get(field) for values in changes.values())}
+    )
+
+
+def record_sales(books, quantities, day=None):
+    """books 为 {book_id: Book}，quantities 为 {book_id: 数量}"""
+    apply_changes(day or timezone.localdate(), {
+        book_id: {
+            'category_id': books[book_id].category_id,
+            'units': quantity,
+            'revenue': books[book_id].price * quantity,
+        }
+        for book_id, quantity in quantities.items()
+    })
+
+
+def record_returns(sales, day=None):
+    """退货计入退货当天，同一本书的多笔退货合并为一行"""
+    changes = {}
+    for sale in sales:
+        entry = changes.setdefault(sale.book_id, {
+            'category_id': sale.book.category_id, 'returned_units': 0, 'returned_revenue': Decimal(0),
+        })
+        entry['returned_units'] += sale.quantity
+        entry['returned_revenue'] += sale.sale_price * sale.quantity
+    apply_changes(day or timezone.localdate(), changes)
+
+
+def record_return(sale, day=None):
+    record_returns([sale], day)
+
+
+def month_bounds(month):
+    start = timezone.make_aware(datetime(month.year, month.month, 1))
+    next_month = date(month.year + month.month // 12, month.month % 12 + 1, 1)
+    end = timezone.make_aware(datetime(next_month.year, next_month.month, 1))
+    return start, end
+
+
+def _merge(rows, totals, counters):
+    for row in rows:
+        entry = totals.setdefault((row['day'], row['book_id']), {
+            'category_id': row['category_id'],
+            'units': 0, 'revenue': Decimal(0), 'returned_units': 0, 'returned_revenue': Decimal(0),
+        })
+        for target, source in counters.items():
+            value = row[source] or 0
+            # SQLite 上金额的 SUM 可能返回浮点数
+            entry[target] += Decimal(str(value)) if target.endswith('revenue') else value
+
+
+def aggregate_month(month):
+    """只读：汇总某个月的销售和退货，返回 {(日期, book_id): 计数}"""
+    from sales.models import Sale as LegacySale
+
+    start, end = month_bounds(month)
+    totals = {}
+    sold = (
+        Sale.objects.filter(created_at__gte=start, created_at__lt=end)
+        .annotate(day=TruncDate('created_at'), category_id=F('book__category_id'))
+        .values('day', 'book_id', 'category_id')
+        .annotate(units=Sum('quantity'), revenue=Sum(AMOUNT))
+    )
+    _merge(sold, totals, {'units': 'units', 'revenue': 'revenue'})
+    # 退货按退货当天计入，退货时间即销售记录最后一次更新的时间
+    returned = (
+        Sale.objects.filter(status='returned', updated_at__gte=start, updated_at__lt=end)
+        .annotate(day=TruncDate('updated_at'), category_id=F('book__category_id'))
+        .values('day', 'book_id', 'category_id')
+        .annotate(units=Sum('quantity'), revenue=Sum(AMOUNT))
+    )
+    _merge(returned, totals, {'returned_units': 'units', 'returned_revenue': 'revenue'})
+    legacy = (
+        LegacySale.objects.filter(sale_date__gte=start, sale_date__lt=end)
+        .annotate(day=TruncDate('sale_date'), category_id=F('book__category_id'))
+        .values('day', 'book_id', 'category_id')
+        .annotate(units=Sum('quantity'), revenue=Sum('total'))
+    )
+    _merge(legacy, totals, {'units': 'units', 'revenue': 'revenue'})
+    return totals
+
+
+def _month_rows(month):
+    start, end = month_bounds(month)
+    return DailySalesRollup.objects.filter(date__gte=timezone.localdate(start), date__lt=timezone.localdate(end))
+
+
+def write_month(month, totals):
+    """用 aggregate_month 的结果替换某个月的汇总，汇总之后提交的销售不会计入，只用于已结束的月份"""
+    now = timezone.now()
+    with transaction.atomic():
+        _month_rows(month).delete()
+        DailySalesRollup.objects.bulk_create([
+            DailySalesRollup(
+                date=day, book_id=book_id, category_id=values['category_id'], updated_at=now,
+                units=values['units'], revenue=values['revenue'].quantize(Decimal('0.01')),
+                returned_units=values['returned_units'],
+                returned_revenue=values['returned_revenue'].quantize(Decimal('0.01')),
+            )
+            for (day, book_id), values in totals.items()
+        ], batch_size=1000)
+    return len(totals)
+
+
+def rebuild_month(month):
+    with transaction.atomic():
+        # 先删除旧的汇总行取得写锁，汇总期间其他收银事务的增量更新要等本事务提交后才能写入
+        _month_rows(month).delete()
+        return write_month(month, aggregate_month(month))
+
+
+def sales_months():
+    """有销售记录的所有月份（每月第一天），从最早的记录到本月"""
+    from sales.models import Sale as LegacySale
+
+    dates = [
+        value for value in (
+            Sale.objects.order_by('created_at').values_list('created_at', flat=True).first(),
+            LegacySale.objects.order_by('sale_date').values_list('sale_date', flat=True).first(),
+        ) if value
+    ]
+    if not dates:
+        return []
+    first = timezone.localdate(min(dates)).replace(day=1)
+    last = timezone.localdate().replace(day=1)
+    months = []
+    while first <= last:
+        months.append(first)
+        first = date(first.year + first.month // 12, first.month % 12 + 1, 1)
+    return months
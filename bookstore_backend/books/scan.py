@@ -0,0 +1,135 @@
+"""
+扫码收银的 ISBN 快速查询
+
+进程内保存最近扫描图书的 LRU 缓存（价格、库存、状态），
+重复扫描直接命中缓存；未命中的 ISBN 合并为一次 isbn__in 查询。
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from .models import Book
+
+MAX_LOOKUP_ISBNS = 500
+CACHE_SIZE = 2048
+# 其他工作进程修改的价格/库存最多在这段时间后可见
+CACHE_TTL = 10
+
+
+def normalize_isbn(value):
+    """返回 13 位 ISBN，ISBN-10 会转换为 ISBN-13，无效输入返回 None"""
+    raw = ''.join(char for char in str(value).upper() if char.isdigit() or char == 'X')
+    if len(raw) == 10:
+        if not raw[:9].isdigit() or not (raw[9].isdigit() or raw[9] == 'X'):
+            return None
+        body = '978' + raw[:9]
+        checksum = sum(int(digit) * (1 if position % 2 == 0 else 3) for position, digit in enumerate(body))
+        return body + str((10 - checksum % 10) % 10)
+    if len(raw) == 13 and raw.isdigit():
+        return raw
+    return None
+
+
+def split_isbns(values):
+    """规范化并去重，返回 (有效的 ISBN 列表, 无效的原始输入列表)"""
+    isbns = []
+    invalid = []
+    for value in values:
+        isbn = normalize_isbn(value)
+        if isbn is None:
+            invalid.append(value)
+        elif isbn not in isbns:
+            isbns.append(isbn)
+    return isbns, invalid
+
+
+def _snapshot(book):
+    return {
+        'id': book.id,
+        'isbn': book.isbn,
+        'title': book.title,
+        'price': str(book.price),
+        'stock': book.stock,
+        'status': book.status,
+    }
+
+
+class ScanCache:
+    def __init__(self, size=CACHE_SIZE, ttl=CACHE_TTL):
+        self.size = size
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._items = OrderedDict()  # isbn -> (expires_at, data)
+        self._isbns = {}  # book_id -> isbn，修改 ISBN 时用于清除旧键
+
+    def get(self, isbn):
+        with self._lock:
+            item = self._items.get(isbn)
+            if item is None:
+                return None
+            if item[0] < time.monotonic():
+                self._discard(isbn)
+                return None
+            self._items.move_to_end(isbn)
+            return item[1]
+
+    def put(self, data):
+        with self._lock:
+            self._items[data['isbn']] = (time.monotonic() + self.ttl, data)
+            self._items.move_to_end(data['isbn'])
+            self._isbns[data['id']] = data['isbn']
+            while len(self._items) > self.size:
+                self._discard(next(iter(self._items)))
+
+    def _discard(self, isbn):
+        item = self._items.pop(isbn, None)
+        if item is not None:
+            self._isbns.pop(item[1]['id'], None)
+
+    def invalidate(self, book_ids):
+        with self._lock:
+            for book_id in book_ids:
+                isbn = self._isbns.pop(book_id, None)
+                if isbn is not None:
+                    self._items.pop(isbn, None)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self._isbns.clear()
+
+    def _cached(self, isbns):
+        found = {}
+        missing = []
+        for isbn in isbns:
+            data = self.get(isbn)
+            if data is None:
+                missing.append(isbn)
+            else:
+                found[isbn] = data
+        return found, missing
+
+    def _missing_books(self, missing):
+        return Book.objects.filter(isbn__in=missing).only('id', 'isbn', 'title', 'price', 'stock', 'status')
+
+    def _store(self, book, found):
+        data = _snapshot(book)
+        self.put(data)
+        found[book.isbn] = data
+
+    def lookup(self, isbns):
+        found, missing = self._cached(isbns)
+        if missing:
+            for book in self._missing_books(missing):
+                self._store(book, found)
+        return found
+
+    async def alookup(self, isbns):
+        found, missing = self._cached(isbns)
+        if missing:
+            async for book in self._missing_books(missing):
+                self._store(book, found)
+        return found
+
+
+cache = ScanCache()
@@ -0,0 +1,153 @@
+"""
+图书全文检索索引
+
+基于 SQLite FTS5（trigram 分词）维护 books_book_fts 虚拟表，
+对书名、作者、出版社、ISBN 建立索引，语义与原有的 icontains 子串匹配一致，
+但不再需要全表扫描，并支持 bm25 相关度排序。
+
+销售和进货订单按写入时的图书快照检索：books_sale_fts / books_purchaseorder_fts
+索引快照列，由表上的触发器同步，bulk_create 等不经过信号的写入同样生效。
+迁移重建这两张表（SQLite 上的 AlterField 等）会删除触发器，之后需要再调用 create_snapshot_index。
+"""
+from django.db import connection
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = 'books_book_fts'
+FTS_COLUMNS = ('title', 'author', 'publisher', 'isbn')
+# bm25 列权重：书名 > 作者 > 出版社 > ISBN
+FTS_WEIGHTS = (10.0, 5.0, 2.0, 1.0)
+# trigram 分词器无法匹配少于 3 个字符的词
+MIN_TERM_LENGTH = 3
+SNAPSHOT_COLUMNS = ('book_title', 'book_author', 'book_publisher', 'book_isbn')
+SNAPSHOT_TABLES = ('books_sale', 'books_purchaseorder')
+
+
+def create_index(schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(
+        f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} "
+        f"USING fts5({', '.join(FTS_COLUMNS)}, tokenize='trigram')"
+    )
+    schema_editor.execute(
+        f"INSERT INTO {FTS_TABLE}(rowid, {', '.join(FTS_COLUMNS)}) "
+        f"SELECT id, {', '.join(FTS_COLUMNS)} FROM books_book"
+    )
+
+
+def drop_index(schema_editor):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    schema_editor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def create_snapshot_index(schema_editor, table):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    drop_snapshot_index(schema_editor, table)
+    fts = f'{table}_fts'
+    columns = ', '.join(SNAPSHOT_COLUMNS)
+    new_values = ', '.join(f'new.{column}' for column in SNAPSHOT_COLUMNS)
+    schema_editor.execute(f"CREATE VIRTUAL TABLE {fts} USING fts5({columns}, tokenize='trigram')")
+    schema_editor.execute(f"INSERT INTO {fts}(rowid, {columns}) SELECT id, {columns} FROM {table}")
+    schema_editor.execute(
+        f"CREATE TRIGGER {fts}_insert AFTER INSERT ON {table} BEGIN "
+        f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values}); END"
+    )
+    schema_editor.execute(
+        f"CREATE TRIGGER {fts}_delete AFTER DELETE ON {table} BEGIN "
+        f"DELETE FROM {fts} WHERE rowid = old.id; END"
+    )
+    # 只有快照列变化时才重建索引行，状态、成本等字段的更新不触发
+    schema_editor.execute(
+        f"CREATE TRIGGER {fts}_update AFTER UPDATE OF {columns} ON {table} BEGIN "
+        f"DELETE FROM {fts} WHERE rowid = old.id; "
+        f"INSERT INTO {fts}(rowid, {columns}) VALUES (new.id, {new_values}); END"
+    )
+
+
+def drop_snapshot_index(schema_editor, table):
+    if schema_editor.connection.vendor != 'sqlite':
+        return
+    fts = f'{table}_fts'
+    for suffix in ('insert', 'delete', 'update'):
+        schema_editor.execute(f"DROP TRIGGER IF EXISTS {fts}_{suffix}")
+    schema_editor.execute(f"DROP TABLE IF EXISTS {fts}")
+
+
+def is_enabled():
+    return connection.vendor == 'sqlite'
+
+
+def build_match(search):
+    """把用户输入转换为 FTS5 查询表达式，不能使用索引时返回 None"""
+    terms = search.split()
+    if not terms or any(len(term) < MIN_TERM_LENGTH for term in terms):
+        return None
+    # 每个词作为短语查询，转义其中的双引号，多个词之间为 AND 关系
+    return ' '.join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+
+def index_books(books):
+    if not is_enabled():
+        return
+    rows = [(book.id,) + tuple(getattr(book, column) for column in FTS_COLUMNS) for book in books]
+    if not rows:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(row[0],) for row in rows])
+        cursor.executemany(
+            f"INSERT INTO {FTS_TABLE}(rowid, {', '.join(FTS_COLUMNS)}) VALUES (%s, %s, %s, %s, %s)",
+            rows
+        )
+
+
+def remove_books(book_ids):
+    if not is_enabled() or not book_ids:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [(book_id,) for book_id in book_ids])
+
+
+def rebuild_index():
+    if not is_enabled():
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {FTS_TABLE}")
+        cursor.execute(
+            f"INSERT INTO {FTS_TABLE}(rowid, {', '.join(FTS_COLUMNS)}) "
+            f"SELECT id, {', '.join(FTS_COLUMNS)} FROM books_book"
+        )
+
+
+def matching_ids(match):
+    """返回匹配图书 id 的子查询，可用于 id__in / book_id__in 过滤"""
+    return RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [match])
+
+
+def rank(match, book_column='books_book.id'):
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    return RawSQL(
+        f"SELECT bm25({FTS_TABLE}, {weights}) FROM {FTS_TABLE} "
+        f"WHERE {FTS_TABLE} MATCH %s AND rowid = {book_column}",
+        [match]
+    )
+
+
+def search_books(queryset, search):
+    """在图书查询集上执行全文检索并按相关度排序，无法使用索引时返回 None"""
+    match = build_match(search) if is_enabled() else None
+    if match is None:
+        return None
+    return queryset.filter(id__in=matching_ids(match)).annotate(
+        search_rank=rank(match)
+    ).order_by('search_rank', 'title')
+
+
+def filter_by_snapshot(queryset, search):
+    """通过快照索引过滤销售或进货订单，匹配写入时的图书信息，无法使用索引时返回 None"""
+    match = build_match(search) if is_enabled() else None
+    if match is None:
+        return None
+    fts = f'{queryset.model._meta.db_table}_fts'
+    return queryset.filter(id__in=RawSQL(f"SELECT rowid FROM {fts} WHERE {fts} MATCH %s", [match]))
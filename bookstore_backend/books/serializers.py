@@ -1,5 +1,6 @@
+from django.db import transaction
 from rest_framework import serializers
-from .models import Book, Category, PurchaseOrder, Sale
+from .models import Book, Category, PurchaseOrder, PurchaseOrderHeader, ReorderPolicy, ReorderSuggestion, Sale
 
 class CategorySerializer(serializers.ModelSerializer):
     class Meta:
@@ -16,9 +17,9 @@ class BookSerializer(serializers.ModelSerializer):
         fields = [
             'id', 'title', 'author', 'publisher', 'isbn', 'category', 'category_name',
             'price', 'stock', 'status', 'status_display', 'description', 'cover',
-            'created_at', 'updated_at'
+            'cover_thumbnail', 'cover_webp', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['created_at', 'updated_at']
+        read_only_fields = ['cover_thumbnail', 'cover_webp', 'created_at', 'updated_at']
 
     def validate_isbn(self, value):
         # 移除所有非数字字符
@@ -37,9 +38,24 @@ class BookSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError('库存不能为负数')
         return value
 
+    def update(self, instance, validated_data):
+        # 只写入本次提交的字段，其他请求并发的库存变化不会被内存中的旧值覆盖
+        for attr, value in validated_data.items():
+            setattr(instance, attr, value)
+        fields = set(validated_data) | {'updated_at'}
+        if 'cover' in fields:
+            fields |= {'cover_hash', 'cover_thumbnail', 'cover_webp'}
+        instance.save(update_fields=sorted(fields))
+        return instance
+
+    def to_representation(self, instance):
+        data = super().to_representation(instance)
+        # 带 ?as_of= 查询时附带该时刻的库存
+        if hasattr(instance, 'stock_as_of'):
+            data['stock_as_of'] = instance.stock_as_of
+        return data
+
 class PurchaseOrderSerializer(serializers.ModelSerializer):
-    book_title = serializers.CharField(source='book.title', read_only=True)
-    book_isbn = serializers.CharField(source='book.isbn', read_only=True)
     book_stock = serializers.IntegerField(source='book.stock', read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     created_by_name = serializers.CharField(source='created_by.username', read_only=True)
@@ -47,11 +63,29 @@ class PurchaseOrderSerializer(serializers.ModelSerializer):
     class Meta:
         model = PurchaseOrder
         fields = [
-            'id', 'book', 'book_title', 'book_isbn', 'book_stock',
+            'id', 'book', 'book_title', 'book_isbn', 'book_author', 'book_publisher', 'book_category', 'book_stock',
             'purchase_price', 'quantity', 'status', 'status_display',
             'created_by', 'created_by_name', 'created_at', 'updated_at'
         ]
-        read_only_fields = ['created_by', 'created_at', 'updated_at']
+        read_only_fields = [
+            'book_title', 'book_isbn', 'book_author', 'book_publisher', 'book_category',
+            'created_by', 'created_at', 'updated_at'
+        ]
+
+    def validate_quantity(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("数量必须大于0")
+        return value
+
+    def validate_purchase_price(self, value):
+        if value <= 0:
+            raise serializers.ValidationError("进货价格必须大于0")
+        return value
+
+class PurchaseOrderLineSerializer(serializers.Serializer):
+    book = serializers.IntegerField()
+    purchase_price = serializers.DecimalField(max_digits=10, decimal_places=2)
+    quantity = serializers.IntegerField()
 
     def validate_quantity(self, value):
         if value <= 0:
@@ -63,6 +97,50 @@ class PurchaseOrderSerializer(serializers.ModelSerializer):
             raise serializers.ValidationError("进货价格必须大于0")
         return value
 
+class PurchaseOrderHeaderSerializer(serializers.ModelSerializer):
+    lines = PurchaseOrderSerializer(many=True, read_only=True)
+    items = PurchaseOrderLineSerializer(many=True, write_only=True)
+    total_amount = serializers.DecimalField(max_digits=12, decimal_places=2, read_only=True)
+    status_display = serializers.CharField(source='get_status_display', read_only=True)
+    created_by_name = serializers.CharField(source='created_by.username', read_only=True)
+
+    class Meta:
+        model = PurchaseOrderHeader
+        fields = [
+            'id', 'supplier', 'note', 'status', 'status_display', 'total_amount',
+            'lines', 'items', 'created_by', 'created_by_name', 'created_at', 'updated_at'
+        ]
+        read_only_fields = ['status', 'created_by', 'created_at', 'updated_at']
+
+    def validate_items(self, value):
+        if not value:
+            raise serializers.ValidationError("进货项目不能为空")
+        # 一次查询加载全部图书，供创建订单行时记录快照
+        self.books = Book.objects.select_related('category').in_bulk({item['book'] for item in value})
+        missing = sorted({item['book'] for item in value} - set(self.books))
+        if missing:
+            raise serializers.ValidationError(f"图书ID {missing[0]} 不存在")
+        return value
+
+    def create(self, validated_data):
+        items = validated_data.pop('items')
+        # 进货单和订单行一起提交，订单行写入失败时不留下空的进货单
+        with transaction.atomic():
+            header = PurchaseOrderHeader.objects.create(**validated_data)
+            PurchaseOrder.objects.bulk_create([
+                PurchaseOrder(
+                    header=header,
+                    book=self.books[item['book']],
+                    purchase_price=item['purchase_price'],
+                    quantity=item['quantity'],
+                    created_by=header.created_by,
+                    created_at=header.created_at,
+                    **PurchaseOrder.snapshot_fields(self.books[item['book']])
+                )
+                for item in items
+            ])
+        return header
+
 class NewBookPurchaseOrderSerializer(serializers.Serializer):
     isbn = serializers.CharField(max_length=13)
     title = serializers.CharField(max_length=200)
@@ -82,16 +160,40 @@ class NewBookPurchaseOrderSerializer(serializers.Serializer):
     
 
 class SaleSerializer(serializers.ModelSerializer):
-    book_title = serializers.CharField(source='book.title', read_only=True)
-    book_isbn = serializers.CharField(source='book.isbn', read_only=True)
     status_display = serializers.CharField(source='get_status_display', read_only=True)
     created_by_name = serializers.CharField(source='created_by.username', read_only=True)
 
     class Meta:
         model = Sale
         fields = [
-            'id', 'book', 'book_title', 'book_isbn',
-            'quantity', 'sale_price', 'status', 'status_display',
-            'created_by', 'created_by_name', 'created_at', 'updated_at'
+            'id', 'book', 'book_title', 'book_isbn', 'book_author', 'book_publisher', 'book_category',
+            'quantity', 'sale_price', 'cogs', 'status', 'status_display',
+            'created_by', 'created_by_name', 'created_at', 'updated_at', 'client_id'
+        ]
+        read_only_fields = [
+            'book_title', 'book_isbn', 'book_author', 'book_publisher', 'book_category',
+            'cogs', 'created_by', 'created_at', 'updated_at', 'client_id'
+        ]
+
+class ReorderPolicySerializer(serializers.ModelSerializer):
+    book_title = serializers.CharField(source='book.title', read_only=True)
+
+    class Meta:
+        model = ReorderPolicy
+        fields = ['id', 'book', 'book_title', 'reorder_point', 'lead_time_days', 'updated_at']
+        read_only_fields = ['updated_at']
+
+class ReorderSuggestionSerializer(serializers.ModelSerializer):
+    book_title = serializers.CharField(source='book.title', read_only=True)
+    book_isbn = serializers.CharField(source='book.isbn', read_only=True)
+    category_name = serializers.CharField(source='book.category.name', read_only=True, default=None)
+    current_stock = serializers.IntegerField(source='book.stock', read_only=True)
+
+    class Meta:
+        model = ReorderSuggestion
+        fields = [
+            'id', 'book', 'book_title', 'book_isbn', 'category_name', 'stock', 'current_stock',
+            'velocity', 'forecast', 'safety_stock', 'reorder_point', 'days_of_cover',
+            'suggested_quantity', 'computed_at'
         ]
-        read_only_fields = ['created_by', 'created_at', 'updated_at']
\ No newline at end of file
+        read_only_fields = fields
@@ -0,0 +1,70 @@
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+from .models import Book
+from . import search
+from .suggest import index as suggest_index
+from .scan import cache as scan_cache
+from . import covers
+from .stock import record_initial_checkpoints
+
+
+def sync_indexes(books, names_changed=True):
+    # bulk_create / update() 不会触发信号，批量写入后需要手动调用
+    books = list(books)
+    search.index_books(books)
+    if names_changed:
+        suggest_index.update_many(books)
+    scan_cache.invalidate([book.id for book in books])
+
+
+def bulk_create_books(books, **options):
+    """
+    批量写入图书，并补上 post_save 信号会做的事：同步检索索引、记录新书的初始库存。
+    update_conflicts 时冲突行不会回填主键，写入后按 ISBN 重新读取。
+    返回 (写入后的图书, 写入前已存在的 ISBN 集合)，需在事务中调用。
+    """
+    books = list(books)
+    isbns = [book.isbn for book in books]
+    existing = set()
+    if options.get('update_conflicts'):
+        existing = set(Book.objects.filter(isbn__in=isbns).values_list('isbn', flat=True))
+    Book.objects.bulk_create(books, **options)
+    if options.get('update_conflicts'):
+        books = list(Book.objects.filter(isbn__in=isbns).only(
+            'id', 'isbn', 'title', 'author', 'publisher', 'stock', 'created_at'
+        ))
+    sync_indexes(books)
+    record_initial_checkpoints([book for book in books if book.isbn not in existing])
+    return books, existing
+
+
+@receiver(pre_save, sender=Book)
+def reset_cover_variants(sender, instance, **kwargs):
+    # 新上传的文件此时尚未写入存储（_committed 为 False）
+    cover = instance.cover
+    instance._cover_changed = bool(cover) and not cover._committed
+    if instance._cover_changed or not cover:
+        instance.cover_hash = ''
+        instance.cover_thumbnail = ''
+        instance.cover_webp = ''
+
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, created=False, **kwargs):
+    # 库存、价格等字段的保存不影响联想索引，也不需要通知其他进程重建
+    names = (instance.title, instance.author)
+    names_changed = created or getattr(instance, '_loaded_names', None) != names
+    instance._loaded_names = names
+    sync_indexes([instance], names_changed)
+    if created:
+        record_initial_checkpoints([instance])
+    if getattr(instance, '_cover_changed', False):
+        transaction.on_commit(lambda: covers.schedule(instance))
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, **kwargs):
+    search.remove_books([instance.id])
+    suggest_index.remove(instance.id)
+    scan_cache.invalidate([instance.id])
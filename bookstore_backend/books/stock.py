@@ -0,0 +1,144 @@
+"""
+库存变更与库存流水
+
+所有库存变化都通过单条条件 UPDATE 完成：
+UPDATE books_book SET stock = stock + n, status = ... WHERE id = ? AND stock + n >= 0
+不在 Python 中读-改-写，并发收银时不会丢失更新，也不会把库存减成负数。
+停售状态不会被库存变化改写。
+
+每次变更同时追加一条 StockMovement。某一时刻的库存 =
+该时刻之前最近的 StockCheckpoint + 快照之后到该时刻的流水之和，
+create_checkpoints 定期生成新的快照，使需要累加的流水保持很短。
+"""
+from datetime import timedelta
+from functools import reduce
+from operator import or_
+
+from django.db import transaction
+from django.db.models import Case, F, OuterRef, Q, Subquery, Sum, Value, When
+from django.utils import timezone
+
+from .models import Book, StockCheckpoint, StockMovement
+from .scan import cache as scan_cache
+
+# 生成快照时只汇总这么久以前的流水，避免漏掉尚未提交的事务
+CHECKPOINT_DELAY = timedelta(minutes=5)
+
+
+class InsufficientStock(Exception):
+    def __init__(self, book_ids):
+        super().__init__(f'库存不足: {sorted(book_ids)}')
+        self.book_ids = book_ids
+
+
+def _status_after(stock_lookup):
+    return Case(
+        When(status='discontinued', then=Value('discontinued')),
+        When(stock_lookup, then=Value('out_of_stock')),
+        default=Value('in_stock'),
+    )
+
+
+def adjust_stock(book_id, delta, reason='adjustment', reference=None, operator=None, **updates):
+    """按 delta 增减库存并记录流水，库存不足或图书不存在时返回 False"""
+    queryset = Book.objects.filter(pk=book_id)
+    if delta < 0:
+        queryset = queryset.filter(stock__gte=-delta)
+    now = timezone.now()
+    with transaction.atomic():
+        updated = queryset.update(
+            stock=F('stock') + delta,
+            status=_status_after(Q(stock__lte=-delta)),
+            updated_at=now,
+            **updates
+        )
+        if updated and delta:
+            StockMovement.objects.create(
+                book_id=book_id, quantity=delta, reason=reason,
+                reference_id=reference, operator=operator, created_at=now,
+            )
+    scan_cache.invalidate([book_id])
+    return updated == 1
+
+
+def apply_stock_changes(changes, reason, references=None, operator=None):
+    """
+    用一条 UPDATE 批量变更多本图书的库存，changes 为 {book_id: delta}，
+    references 为 {book_id: 关联单据 id}。
+    有任何一本库存不足时抛出 InsufficientStock，调用方需在事务中执行以便整体回滚。
+    """
+    changes = {book_id: delta for book_id, delta in changes.items() if delta}
+    if not changes:
+        return
+    references = references or {}
+    allowed = reduce(or_, [
+        Q(pk=book_id, stock__gte=-delta) if delta < 0 else Q(pk=book_id)
+        for book_id, delta in changes.items()
+    ])
+    new_stock = Case(
+        *[When(pk=book_id, then=F('stock') + delta) for book_id, delta in changes.items()],
+        default=F('stock'),
+    )
+    reaches_zero = reduce(or_, [Q(pk=book_id, stock__lte=-delta) for book_id, delta in changes.items()])
+    now = timezone.now()
+    updated = Book.objects.filter(allowed).update(
+        stock=new_stock,
+        status=_status_after(reaches_zero),
+        updated_at=now,
+    )
+    scan_cache.invalidate(list(changes))
+    if updated != len(changes):
+        # 本次更新过的行 updated_at 等于 now，其余即为库存不足或不存在的图书
+        done = set(Book.objects.filter(pk__in=list(changes), updated_at=now).values_list('pk', flat=True))
+        raise InsufficientStock(set(changes) - done)
+    StockMovement.objects.bulk_create([
+        StockMovement(
+            book_id=book_id, quantity=delta, reason=reason,
+            reference_id=references.get(book_id), operator=operator, created_at=now,
+        )
+        for book_id, delta in changes.items()
+    ])
+
+
+def with_stock_as_of(queryset, moment):
+    """为图书查询集标注 stock_as_of：moment 时刻的库存，没有更早的快照时为 None"""
+    checkpoints = StockCheckpoint.objects.filter(
+        book=OuterRef('pk'), taken_at__lte=moment
+    ).order_by('-taken_at', '-id')
+    queryset = queryset.annotate(
+        _checkpoint_stock=Subquery(checkpoints.values('stock')[:1]),
+        _checkpoint_at=Subquery(checkpoints.values('taken_at')[:1]),
+    )
+    movements = (
+        StockMovement.objects
+        .filter(book=OuterRef('pk'), created_at__gt=OuterRef('_checkpoint_at'), created_at__lte=moment)
+        .order_by().values('book').annotate(total=Sum('quantity')).values('total')
+    )
+    queryset = queryset.annotate(_movement_total=Subquery(movements))
+    return queryset.annotate(stock_as_of=Case(
+        When(_movement_total__isnull=True, then=F('_checkpoint_stock')),
+        default=F('_checkpoint_stock') + F('_movement_total'),
+    ))
+
+
+def record_initial_checkpoints(books):
+    """新建图书时记录初始库存，作为流水的起点"""
+    StockCheckpoint.objects.bulk_create([
+        StockCheckpoint(book_id=book.id, stock=book.stock, taken_at=book.created_at or timezone.now())
+        for book in books
+    ])
+
+
+def create_checkpoints(cutoff=None):
+    """把截至 cutoff 的流水汇总为新快照，只处理快照之后有流水的图书，返回新建的快照数"""
+    cutoff = cutoff or timezone.now() - CHECKPOINT_DELAY
+    rows = (
+        with_stock_as_of(Book.objects.all(), cutoff)
+        .filter(_checkpoint_at__isnull=False, _movement_total__isnull=False)
+        .values_list('pk', 'stock_as_of')
+    )
+    created = StockCheckpoint.objects.bulk_create([
+        StockCheckpoint(book_id=book_id, stock=stock, taken_at=cutoff)
+        for book_id, stock in rows.iterator(chunk_size=2000)
+    ], batch_size=1000)
+    return len(created)
@@ -0,0 +1,146 @@
+"""
+书名/作者前缀联想索引
+
+每个工作进程在内存中维护一个有序的 (前缀键, 图书id) 列表，
+用二分查找定位前缀区间，联想请求不访问数据库。
+"""
+import threading
+import time
+from bisect import bisect_left
+from heapq import merge
+
+from .models import Book, IndexVersion
+
+# 多进程部署时，其他进程的修改通过定期比对数据库中的版本号感知
+REFRESH_INTERVAL = 30
+VERSION_NAME = 'suggest'
+
+
+def _keys(text):
+    # 从每个单词开头生成一个键，使 "pyt" 也能匹配 "Fluent Python"
+    text = ' '.join(text.lower().split())
+    keys = {text}
+    for position, char in enumerate(text):
+        if char == ' ':
+            keys.add(text[position + 1:])
+    keys.discard('')
+    return keys
+
+
+class SuggestIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._entries = []  # [(key, field, book_id)]，field 0 为书名、1 为作者
+        self._books = {}  # book_id -> (title, author, [entries])
+        self._version = None
+        self._checked_at = 0
+
+    def _db_version(self):
+        return IndexVersion.current(VERSION_NAME)
+
+    def _bump_version(self):
+        # 书名或作者变化、图书增删时版本号加一
+        return IndexVersion.bump(VERSION_NAME)
+
+    def _bumped(self, version):
+        # 只有版本号恰好是本进程的这一次修改时才前进，期间其他进程的修改留给下一次检查时重建
+        if self._version is not None and version == self._version + 1:
+            self._version = version
+
+    def _entries_for(self, book_id, title, author):
+        return [(key, 0, book_id) for key in _keys(title)] + [(key, 1, book_id) for key in _keys(author)]
+
+    def rebuild(self):
+        books = {}
+        entries = []
+        version = self._db_version()
+        for book_id, title, author in Book.objects.values_list('id', 'title', 'author').iterator():
+            book_entries = self._entries_for(book_id, title, author)
+            books[book_id] = (title, author, book_entries)
+            entries.extend(book_entries)
+        entries.sort()
+        with self._lock:
+            self._entries = entries
+            self._books = books
+            self._version = version
+            self._checked_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        if self._version is None:
+            self.rebuild()
+        elif time.monotonic() - self._checked_at > REFRESH_INTERVAL:
+            if self._db_version() != self._version:
+                self.rebuild()
+            else:
+                self._checked_at = time.monotonic()
+
+    def _remove(self, book_id):
+        book = self._books.pop(book_id, None)
+        if book is None:
+            return
+        for entry in book[2]:
+            index = bisect_left(self._entries, entry)
+            if index < len(self._entries) and self._entries[index] == entry:
+                del self._entries[index]
+
+    def update(self, book):
+        self.update_many([book])
+
+    def update_many(self, books):
+        """books 为书名或作者有变化（含新建）的图书"""
+        if not books:
+            return
+        version = self._bump_version()
+        if self._version is None:
+            return
+        with self._lock:
+            # 导入时一批上千本，逐条 insort 是 O(N) 的列表插入；先收集新旧词条，再一次归并
+            stale = set()
+            added = []
+            for book in {book.id: book for book in books}.values():
+                current = self._books.get(book.id)
+                if current is not None:
+                    if current[:2] == (book.title, book.author):
+                        continue
+                    stale.update(current[2])
+                book_entries = self._entries_for(book.id, book.title, book.author)
+                added.extend(book_entries)
+                self._books[book.id] = (book.title, book.author, book_entries)
+            if stale or added:
+                kept = [entry for entry in self._entries if entry not in stale] if stale else self._entries
+                self._entries = list(merge(kept, sorted(added)))
+            self._bumped(version)
+
+    def remove(self, book_id):
+        version = self._bump_version()
+        if self._version is None:
+            return
+        with self._lock:
+            self._remove(book_id)
+            self._bumped(version)
+
+    def suggest(self, query, limit=10):
+        query = ' '.join(query.lower().split())
+        if not query:
+            return []
+        self._ensure_fresh()
+        with self._lock:
+            matches = ({}, {})  # 按字段收集匹配的图书，dict 保持插入顺序
+            position = bisect_left(self._entries, (query,))
+            while position < len(self._entries):
+                key, field, book_id = self._entries[position]
+                if not key.startswith(query):
+                    break
+                if len(matches[field]) < limit:
+                    matches[field][book_id] = None
+                elif all(len(found) >= limit for found in matches):
+                    break
+                position += 1
+            # 书名匹配优先于作者匹配
+            book_ids = list(dict.fromkeys([*matches[0], *matches[1]]))[:limit]
+            return [
+                {'id': book_id, 'title': self._books[book_id][0], 'author': self._books[book_id][1]}
+                for book_id in book_ids
+            ]
+
+index = SuggestIndex()
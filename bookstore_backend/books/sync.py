@@ -0,0 +1,222 @@
+"""
+离线收银同步
+
+断网期间收银台在本地保存小票，恢复后把全部小票作为 NDJSON 一次上传，每行一张：
+{"client_id": "till-3-000123", "created_at": "2026-10-17T10:15:00+08:00",
+ "items": [{"book_id": 1, "quantity": 2}]}
+
+按块处理，每块在一个事务中用固定次数的查询完成：一次查询已同步的 client_id 去重，
+一次加载图书，bulk_create 写入销售记录（保留原始销售时间），一条 UPDATE 扣减库存。
+每处理完一块就把这一块每行的结果以 NDJSON 返回，客户端据此删除已同步的小票。
+"""
+import json
+from collections import defaultdict
+
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+
+from financials.models import Financial
+from .checkout import CheckoutError, collect_quantities
+from .leaderboard import BUCKET_SECONDS, leaderboard
+from .models import Book, Sale
+from . import costing, rollup
+from .stock import InsufficientStock, apply_stock_changes
+
+CHUNK_SIZE = 200
+MAX_CLIENT_ID_LENGTH = 64
+# 并发的销售或重复上传导致整块回滚时，重新校验后再试
+MAX_ATTEMPTS = 3
+
+
+class Receipt:
+    def __init__(self, line, client_id=None, created_at=None, quantities=None, error=None):
+        self.line = line
+        self.client_id = client_id
+        self.created_at = created_at
+        self.quantities = quantities
+        self.error = error
+        self.status = 'error' if error else None
+        self.sales = []
+
+    def result(self):
+        data = {'line': self.line, 'client_id': self.client_id, 'status': self.status}
+        if self.error:
+            data['error'] = self.error
+        else:
+            data['sales'] = self.sales
+        return data
+
+
+def parse_line(line, raw):
+    try:
+        data = json.loads(raw)
+    except ValueError:
+        return Receipt(line, error='不是有效的 JSON')
+    if not isinstance(data, dict):
+        return Receipt(line, error='每行必须是 JSON 对象')
+    client_id = data.get('client_id')
+    if not isinstance(client_id, str) or not client_id:
+        return Receipt(line, error='client_id 不能为空')
+    if len(client_id) > MAX_CLIENT_ID_LENGTH:
+        return Receipt(line, client_id, error=f'client_id 长度不能超过 {MAX_CLIENT_ID_LENGTH}')
+    try:
+        created_at = parse_datetime(data.get('created_at') or '')
+    except (TypeError, ValueError):
+        created_at = None
+    if created_at is None:
+        return Receipt(line, client_id, error='created_at 时间格式错误')
+    if timezone.is_naive(created_at):
+        created_at = timezone.make_aware(created_at)
+    try:
+        quantities = collect_quantities(data.get('items'))
+    except CheckoutError as exc:
+        return Receipt(line, client_id, error=str(exc))
+    return Receipt(line, client_id, created_at, quantities)
+
+
+def _validate(receipts, books):
+    """按行号顺序校验，库存在同一块内累计扣减，返回可以写入的小票"""
+    remaining = {book_id: book.stock for book_id, book in books.items()}
+    accepted = []
+    for receipt in receipts:
+        receipt.error = None
+        for book_id, quantity in receipt.quantities.items():
+            book = books.get(book_id)
+            if book is None:
+                receipt.error = f'图书ID {book_id} 不存在'
+            elif book.status != 'in_stock':
+                receipt.error = f'图书 {book.title} 不在销售状态'
+            elif remaining[book_id] < quantity:
+                receipt.error = f'图书 {book.title} 库存不足'
+            if receipt.error:
+                break
+        if receipt.error:
+            receipt.status = 'error'
+            continue
+        for book_id, quantity in receipt.quantities.items():
+            remaining[book_id] -= quantity
+        accepted.append(receipt)
+    return accepted
+
+
+def _write(receipts, operator):
+    """在一个事务中写入一块小票，小票对象上记录各自的结果"""
+    existing = defaultdict(list)
+    for client_id, sale_id in Sale.objects.filter(
+        client_id__in=[receipt.client_id for receipt in receipts]
+    ).values_list('client_id', 'id'):
+        existing[client_id].append(sale_id)
+    pending = []
+    for receipt in receipts:
+        if receipt.client_id in existing:
+            receipt.status, receipt.sales = 'duplicate', sorted(existing[receipt.client_id])
+        else:
+            pending.append(receipt)
+
+    books = Book.objects.select_related('category').in_bulk(
+        {book_id for receipt in pending for book_id in receipt.quantities}
+    )
+    accepted = _validate(pending, books)
+    if not accepted:
+        return
+
+    sales = [
+        Sale(
+            book=books[book_id], quantity=quantity, sale_price=books[book_id].price,
+            created_by=operator, created_at=receipt.created_at, client_id=receipt.client_id,
+            **Sale.snapshot_fields(books[book_id])
+        )
+        for receipt in accepted for book_id, quantity in receipt.quantities.items()
+    ]
+    costs = costing.consume([(sale.book_id, sale.quantity) for sale in sales])
+    for sale, cost in zip(sales, costs):
+        sale.cogs = cost
+    sales = Sale.objects.bulk_create(sales)
+    amounts = {}
+    position = 0
+    for receipt in accepted:
+        receipt_sales = sales[position:position + len(receipt.quantities)]
+        position += len(receipt_sales)
+        receipt.status, receipt.sales = 'created', [sale.id for sale in receipt_sales]
+        amounts[receipt.client_id] = sum(sale.sale_price * sale.quantity for sale in receipt_sales)
+
+    changes = defaultdict(int)
+    by_book = defaultdict(list)
+    by_day = defaultdict(lambda: defaultdict(int))
+    by_hour = {}
+    for sale in sales:
+        changes[sale.book_id] -= sale.quantity
+        by_book[sale.book_id].append(sale.id)
+        by_day[timezone.localdate(sale.created_at)][sale.book_id] += sale.quantity
+        moment, entries = by_hour.setdefault(sale.created_at.timestamp() // BUCKET_SECONDS, (sale.created_at, []))
+        entries.append((sale.book_id, books[sale.book_id].category_id, sale.quantity))
+    # 同一块中同一本书只记一条流水，只有一笔销售时才能关联到单据
+    apply_stock_changes(
+        changes, 'sale',
+        references={book_id: ids[0] for book_id, ids in by_book.items() if len(ids) == 1},
+        operator=operator,
+    )
+    # 汇总和畅销榜按小票的原始销售时间计入
+    for day, quantities in by_day.items():
+        rollup.record_sales(books, quantities, day)
+
+    def record_leaderboard():
+        for moment, entries in by_hour.values():
+            leaderboard.record(entries, moment)
+
+    transaction.on_commit(record_leaderboard)
+    Financial.objects.bulk_create([
+        Financial(
+            type='income',
+            category='sale',
+            amount=amounts[receipt.client_id],
+            description=f'离线销售 {receipt.client_id}，图书 {len(receipt.sales)} 本',
+            operator=operator,
+        )
+        for receipt in accepted
+    ])
+
+
+def sync_chunk(receipts, operator):
+    """处理一块已解析的小票，返回每行的结果"""
+    valid = [receipt for receipt in receipts if receipt.status is None]
+    for _ in range(MAX_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                _write(valid, operator)
+            break
+        except (InsufficientStock, IntegrityError):
+            for receipt in valid:
+                receipt.status, receipt.error, receipt.sales = None, None, []
+    else:
+        for receipt in valid:
+            receipt.status, receipt.error = 'error', '同步冲突，请重试'
+    return [receipt.result() for receipt in receipts]
+
+
+def sync_stream(lines, operator, chunk_size=None):
+    """lines 为字节行的迭代器，逐块生成 NDJSON 结果行"""
+    chunk_size = chunk_size or CHUNK_SIZE
+    chunk = []
+    seen = set()
+    for line, raw in enumerate(lines, 1):
+        if not raw.strip():
+            continue
+        receipt = parse_line(line, raw)
+        if receipt.status is None:
+            if receipt.client_id in seen:
+                # 同一次上传中重复的小票只处理第一张
+                receipt.status = 'duplicate'
+            seen.add(receipt.client_id)
+        chunk.append(receipt)
+        if len(chunk) >= chunk_size:
+            yield from _dump(sync_chunk(chunk, operator))
+            chunk = []
+    if chunk:
+        yield from _dump(sync_chunk(chunk, operator))
+
+
+def _dump(results):
+    for result in results:
+        yield json.dumps(result, ensure_ascii=False) + '\n'
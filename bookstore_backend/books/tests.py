@@ -1,3 +1,1680 @@
-from django.test import TestCase
+import csv
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+from PIL import Image
+from django.core.management import CommandError, call_command
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import Client, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+from accounts.models import User
+from bookstore_backend.pagination import StandardPagination
+from .models import (
+    Book, Category, CostLot, DailySalesRollup, IdempotencyKey, IndexVersion, PurchaseOrder, PurchaseOrderHeader,
+    ReorderPolicy, ReorderSuggestion, Sale, StockCheckpoint, StockMovement
+)
+from .suggest import index as suggest_index
+from .views import BookViewSet
+from .scan import cache as scan_cache, normalize_isbn
+from financials.models import Financial
+from . import checkout as checkout_module
+from . import forecast, rollup
+from .leaderboard import Leaderboard, leaderboard
+from .stock import InsufficientStock, adjust_stock, apply_stock_changes, create_checkpoints
 
 # Create your tests here.
+
+class BookAPITestCase(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('staff', 'staff@example.com', 'password123', role='staff')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name='小说')
+
+    def create_book(self, isbn, title, author='作者', stock=10, price='50.00', **kwargs):
+        return Book.objects.create(
+            isbn=isbn, title=title, author=author, publisher=kwargs.pop('publisher', '出版社'),
+            category=kwargs.pop('category', self.category), price=Decimal(price), stock=stock, **kwargs
+        )
+
+
+class BookSearchTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.python = self.create_book('9780000000001', 'Python Cookbook', author='David Beazley')
+        self.fluent = self.create_book('9780000000002', 'Fluent Python', author='Luciano Ramalho')
+        self.sicp = self.create_book('9780000000003', 'Structure and Interpretation', author='Abelson')
+
+    def test_fts_search_ranks_matches(self):
+        response = self.client.get('/api/books/books/', {'search': 'python', 'search_mode': 'fts'})
+        self.assertEqual(response.status_code, 200)
+        ids = {row['id'] for row in response.data['results']}
+        self.assertEqual(ids, {self.python.id, self.fluent.id})
+
+    def test_fts_index_follows_updates_and_deletes(self):
+        self.sicp.title = 'Python Structure'
+        self.sicp.save()
+        self.python.delete()
+        response = self.client.get('/api/books/books/', {'search': 'python', 'search_mode': 'fts'})
+        ids = {row['id'] for row in response.data['results']}
+        self.assertEqual(ids, {self.fluent.id, self.sicp.id})
+
+    def test_fts_short_term_falls_back_to_icontains(self):
+        response = self.client.get('/api/books/books/', {'search': 'py', 'search_mode': 'fts'})
+        self.assertEqual(len(response.data['results']), 2)
+
+    def test_fts_filters_sales_and_purchase_orders(self):
+        Sale.objects.create(book=self.python, quantity=1, sale_price=Decimal('50.00'), created_by=self.user)
+        Sale.objects.create(book=self.sicp, quantity=1, sale_price=Decimal('50.00'), created_by=self.user)
+        PurchaseOrder.objects.create(book=self.fluent, purchase_price=Decimal('30.00'), quantity=5, created_by=self.user)
+
+        response = self.client.get('/api/books/sales/', {'search': 'beazley', 'search_mode': 'fts'})
+        self.assertEqual([row['book'] for row in response.data['results']], [self.python.id])
+        response = self.client.get('/api/books/purchase-orders/', {'search': 'ramalho', 'search_mode': 'fts'})
+        self.assertEqual([row['book'] for row in response.data['results']], [self.fluent.id])
+
+    def test_fts_matches_snapshot_like_default_search(self):
+        sale = Sale.objects.create(book=self.python, quantity=1, sale_price=Decimal('50.00'), created_by=self.user)
+        # bulk_create 不经过 save()，快照索引由触发器同步
+        Sale.objects.bulk_create([Sale(
+            book=self.sicp, quantity=1, sale_price=Decimal('50.00'), created_by=self.user,
+            **Sale.snapshot_fields(self.sicp)
+        )])
+        self.python.title = 'Renamed Cookbook'
+        self.python.author = 'Someone Else'
+        self.python.save()
+
+        for search, expected in (('beazley', [sale.id]), ('someone', []), ('abelson', [Sale.objects.get(book=self.sicp).id])):
+            results = [
+                [row['id'] for row in self.client.get('/api/books/sales/', {'search': search, **mode}).data['results']]
+                for mode in ({}, {'search_mode': 'fts'})
+            ]
+            self.assertEqual(results, [expected, expected])
+
+        Sale.objects.filter(pk=sale.pk).update(status='returned')
+        sale.delete()
+        response = self.client.get('/api/books/sales/', {'search': 'beazley', 'search_mode': 'fts'})
+        self.assertEqual(response.data['results'], [])
+
+
+class BookSuggestTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.python = self.create_book('9780000000001', 'Python Cookbook', author='David Beazley')
+        self.fluent = self.create_book('9780000000002', 'Fluent Python', author='Luciano Ramalho')
+        self.pyramid = self.create_book('9780000000003', 'Pyramids', author='Pyle')
+        suggest_index.rebuild()
+
+    def test_suggest_matches_title_and_author_word_prefixes(self):
+        response = self.client.get('/api/books/books/suggest/', {'q': 'pyt'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual({row['id'] for row in response.data}, {self.python.id, self.fluent.id})
+
+        response = self.client.get('/api/books/books/suggest/', {'q': 'ramal'})
+        self.assertEqual([row['id'] for row in response.data], [self.fluent.id])
+
+    def test_suggest_prefers_titles_and_respects_limit(self):
+        response = self.client.get('/api/books/books/suggest/', {'q': 'py', 'limit': 2})
+        self.assertEqual(len(response.data), 2)
+
+    def test_suggest_index_updates_incrementally(self):
+        self.pyramid.title = 'Django for Professionals'
+        self.pyramid.save()
+        self.fluent.delete()
+        with self.assertNumQueries(0):
+            results = suggest_index.suggest('django')
+        self.assertEqual([row['id'] for row in results], [self.pyramid.id])
+        self.assertEqual([row['id'] for row in suggest_index.suggest('python')], [self.python.id])
+
+    def test_batch_update_merges_entries(self):
+        self.pyramid.title = 'Django for Professionals'
+        new_books = [
+            Book(id=10000 + number, title=f'Batch Python {number}', author='Batch Author') for number in range(50)
+        ]
+        suggest_index.update_many([self.pyramid, self.python] + new_books + [self.pyramid])
+        # 批量归并后的词条与按每本书重新生成的完全一致
+        self.assertEqual(
+            suggest_index._entries,
+            sorted(entry for _, _, book_entries in suggest_index._books.values() for entry in book_entries)
+        )
+        self.assertEqual([row['id'] for row in suggest_index.suggest('django')], [self.pyramid.id])
+        self.assertEqual(suggest_index.suggest('pyramids'), [])
+        self.assertEqual(len(suggest_index.suggest('batch', limit=100)), 50)
+
+    def test_local_change_does_not_hide_other_workers_changes(self):
+        # 其他工作进程改名：写入数据库并把版本号加一，本进程的内存索引不知道
+        Book.objects.filter(pk=self.python.pk).update(title='Rust in Action')
+        IndexVersion.bump('suggest')
+        self.pyramid.title = 'Django for Professionals'
+        self.pyramid.save()
+        suggest_index._checked_at = 0
+        self.assertEqual([row['id'] for row in suggest_index.suggest('rust')], [self.python.id])
+        self.assertEqual([row['id'] for row in suggest_index.suggest('django')], [self.pyramid.id])
+
+    def test_stock_and_price_changes_do_not_trigger_rebuild(self):
+        version = suggest_index._db_version()
+        adjust_stock(self.python.id, -1, 'sale', operator=self.user)
+        self.fluent.price = Decimal('60.00')
+        with CaptureQueriesContext(connection) as queries:
+            self.fluent.save()
+        self.assertFalse([query for query in queries if 'indexversion' in query['sql']])
+        self.assertEqual(suggest_index._db_version(), version)
+        suggest_index._checked_at = 0
+        with mock.patch.object(suggest_index, 'rebuild') as rebuild:
+            suggest_index.suggest('py')
+        rebuild.assert_not_called()
+
+
+class BookLookupTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+        scan_cache.clear()
+        self.book = self.create_book('9787536692930', '三体', author='刘慈欣', stock=3)
+        self.other = self.create_book('9780306406157', 'Other', stock=0)
+
+    def test_normalize_isbn(self):
+        self.assertEqual(normalize_isbn('978-7-5366-9293-0'), '9787536692930')
+        self.assertEqual(normalize_isbn('0-306-40615-2'), '9780306406157')
+        self.assertIsNone(normalize_isbn('12345'))
+
+    def test_bulk_lookup_uses_single_query(self):
+        with self.assertNumQueries(1):
+            response = self.client.post('/api/books/books/lookup/', {
+                'isbns': ['978-7-5366-9293-0', '0306406152', '9780000000000', 'bad']
+            }, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['id'] for row in response.data['results']], [self.book.id, self.other.id])
+        self.assertEqual(response.data['not_found'], ['9780000000000'])
+        self.assertEqual(response.data['invalid'], ['bad'])
+
+    def test_repeat_scan_is_served_from_cache_and_invalidated_on_save(self):
+        self.client.get('/api/books/books/lookup/', {'isbn': '9787536692930'})
+        with self.assertNumQueries(0):
+            scan_cache.lookup(['9787536692930'])
+
+        self.book.price = Decimal('60.00')
+        self.book.save()
+        response = self.client.get('/api/books/books/lookup/', {'isbn': '9787536692930'})
+        self.assertEqual(response.data['results'][0]['price'], '60.00')
+
+
+class QueryCountTests(BookAPITestCase):
+    def create_rows(self, start, count):
+        for number in range(start, start + count):
+            book = self.create_book(f'978000000{number:04d}', f'Book {number}')
+            Sale.objects.create(book=book, quantity=1, sale_price=book.price, created_by=self.user)
+            PurchaseOrder.objects.create(book=book, purchase_price=Decimal('30.00'), quantity=2, created_by=self.user)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_list_query_counts_do_not_grow_with_rows(self):
+        urls = ['/api/books/books/', '/api/books/sales/', '/api/books/purchase-orders/']
+        self.create_rows(0, 1)
+        baseline = {url: self.count_queries(url) for url in urls}
+        self.create_rows(1, 20)
+        for url in urls:
+            self.assertEqual(self.count_queries(url), baseline[url], url)
+
+
+class BookSnapshotTests(BookAPITestCase):
+    def test_rows_keep_book_details_from_write_time(self):
+        book = self.create_book('9787000000740', '旧书名', author='旧作者', status='in_stock', publisher='旧出版社')
+        self.client.post('/api/books/sales/create_batch/', {'items': [{'book_id': book.id, 'quantity': 1}]}, format='json')
+        PurchaseOrder.objects.create(book=book, purchase_price=Decimal('30.00'), quantity=2, created_by=self.user)
+        Book.objects.filter(pk=book.pk).update(title='新书名', author='新作者', publisher='新出版社')
+
+        for url in ('/api/books/sales/', '/api/books/purchase-orders/'):
+            with CaptureQueriesContext(connection) as context:
+                row = self.client.get(url, {'search': '旧作者'}).data['results'][0]
+            self.assertEqual(
+                (row['book_title'], row['book_isbn'], row['book_author'], row['book_category']),
+                ('旧书名', '9787000000740', '旧作者', '小说')
+            )
+            if url.endswith('sales/'):
+                # 销售列表和搜索不再关联图书表；进货订单仍需关联以返回实时库存
+                self.assertFalse(any('"books_book"' in query['sql'] for query in context.captured_queries))
+            self.assertEqual(self.client.get(url, {'search': '新书名'}).data['results'], [])
+            row = self.client.get(url, {'search': '旧出版社'}).data['results'][0]
+            self.assertEqual(row['book_publisher'], '旧出版社')
+
+    def test_backfill_migration_fills_existing_rows(self):
+        from django.apps import apps
+        from importlib import import_module
+
+        book = self.create_book('9787000000741', '回填', author='回填作者')
+        sale = Sale.objects.create(book=book, quantity=1, sale_price=book.price)
+        order = PurchaseOrder.objects.create(book=book, purchase_price=Decimal('30.00'), quantity=1)
+        empty = {'book_title': '', 'book_isbn': '', 'book_author': '', 'book_publisher': '', 'book_category': ''}
+        Sale.objects.update(**empty)
+        PurchaseOrder.objects.update(**empty)
+
+        import_module('books.migrations.0015_backfill_book_snapshot').backfill_book_snapshot(apps, None)
+        import_module('books.migrations.0020_book_publisher_snapshot').backfill_book_publisher(apps, None)
+        for row in (Sale.objects.get(pk=sale.pk), PurchaseOrder.objects.get(pk=order.pk)):
+            self.assertEqual(
+                (row.book_title, row.book_isbn, row.book_author, row.book_publisher, row.book_category),
+                ('回填', '9787000000741', '回填作者', '出版社', '小说')
+            )
+
+
+class SparseFieldsetTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = self.create_book('9780000000001', 'Python Cookbook', description='很长的描述')
+
+    def test_fields_param_limits_payload_and_columns(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/books/books/', {'fields': 'id,title,price'})
+        self.assertEqual(list(response.data['results'][0]), ['id', 'title', 'price'])
+        sql = context.captured_queries[-1]['sql']
+        self.assertNotIn('"description"', sql)
+        self.assertNotIn('books_category', sql)
+
+    def test_exclude_param_defers_heavy_columns(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(f'/api/books/books/{self.book.id}/', {'exclude': 'description,cover'})
+        self.assertNotIn('description', response.data)
+        self.assertIn('category_name', response.data)
+        self.assertNotIn('"description"', context.captured_queries[-1]['sql'])
+
+    def test_field_selection_applies_to_related_lists(self):
+        Sale.objects.create(book=self.book, quantity=1, sale_price=self.book.price, created_by=self.user)
+        response = self.client.get('/api/books/sales/', {'fields': 'id,book_title'})
+        results = response.data['results']
+        self.assertEqual(results, [{'id': results[0]['id'], 'book_title': 'Python Cookbook'}])
+
+
+class PaginationTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+        for number in range(7):
+            self.create_book(f'978000000{number:04d}', f'Book {number % 3}')
+
+    def test_page_size_is_bounded(self):
+        with mock.patch.object(StandardPagination, 'max_page_size', 5):
+            response = self.client.get('/api/books/books/', {'page_size': 10000})
+        self.assertEqual(response.data['count'], 7)
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_cursor_pagination_walks_title_id_keyset(self):
+        expected = list(Book.objects.order_by('title', 'id').values_list('id', flat=True))
+        seen = []
+        response = self.client.get('/api/books/books/', {'pagination': 'cursor', 'page_size': 3})
+        while True:
+            self.assertNotIn('count', response.data)
+            seen.extend(row['id'] for row in response.data['results'])
+            if not response.data['next']:
+                break
+            response = self.client.get(response.data['next'])
+        self.assertEqual(seen, expected)
+
+    def test_invalid_cursor_returns_404(self):
+        response = self.client.get('/api/books/books/', {'cursor': 'not-a-cursor'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_approximate_count_skips_full_count(self):
+        response = self.client.get('/api/books/books/', {'count': 'approximate', 'page_size': 5})
+        self.assertTrue(response.data['count_is_approximate'])
+        self.assertGreaterEqual(response.data['count'], 7)
+        self.assertEqual(len(response.data['results']), 5)
+
+    def test_approximate_count_does_not_limit_deep_pages(self):
+        self.create_book('9780000000100', 'Book 9')
+        params = {'count': 'approximate', 'page_size': 2, 'search': 'Book'}
+        with mock.patch('bookstore_backend.pagination.APPROXIMATE_COUNT_CAP', 3):
+            ids = []
+            response = self.client.get('/api/books/books/', params)
+            while True:
+                self.assertEqual(response.status_code, 200)
+                ids.extend(row['id'] for row in response.data['results'])
+                if not response.data['next']:
+                    break
+                response = self.client.get(response.data['next'])
+        self.assertEqual(response.data['count'], 8)
+        self.assertEqual(ids, list(Book.objects.order_by('title', 'id').values_list('id', flat=True)))
+        response = self.client.get('/api/books/books/', {**params, 'page': 5})
+        self.assertEqual(response.status_code, 404)
+
+
+class ConditionalRequestTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = self.create_book('9780000000001', 'Python Cookbook')
+
+    def test_unchanged_list_returns_304(self):
+        response = self.client.get('/api/books/books/')
+        etag = response['ETag']
+        self.assertIn('Last-Modified', response)
+
+        response = self.client.get('/api/books/books/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+
+    def test_list_etag_changes_with_rows_and_dependencies(self):
+        etag = self.client.get('/api/books/books/')['ETag']
+        self.category.name = '文学'
+        self.category.save()
+        response = self.client.get('/api/books/books/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['category_name'], '文学')
+
+        etag = response['ETag']
+        self.book.delete()
+        response = self.client.get('/api/books/books/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_if_match_guards_writes(self):
+        etag = self.client.get(f'/api/books/books/{self.book.id}/')['ETag']
+        url = f'/api/books/books/{self.book.id}/update_stock/'
+        response = self.client.post(url, {'stock_change': 1}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        # 旧的 ETag 已失效
+        response = self.client.post(url, {'stock_change': 1}, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.stock, 11)
+
+
+class BookExportTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.create_book('9780000000001', 'Python Cookbook', stock=3)
+        self.create_book('9780000000002', 'Fluent Python', category=None)
+        self.create_book('9780000000003', 'Other', status='discontinued')
+
+    def test_csv_export_streams_filtered_catalog(self):
+        response = self.client.get('/api/books/books/export/', {'search': 'python'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        rows = list(csv.DictReader(io.StringIO(content)))
+        self.assertEqual([row['title'] for row in rows], ['Fluent Python', 'Python Cookbook'])
+        self.assertEqual(rows[0]['category'], '')
+        self.assertEqual(rows[1]['category'], '小说')
+
+    def test_ndjson_export(self):
+        response = self.client.get('/api/books/books/export/', {'export_format': 'ndjson', 'status': 'discontinued'})
+        lines = b''.join(response.streaming_content).decode().splitlines()
+        self.assertEqual([json.loads(line)['isbn'] for line in lines], ['9780000000003'])
+
+    def test_unknown_export_format(self):
+        response = self.client.get('/api/books/books/export/', {'export_format': 'xml'})
+        self.assertEqual(response.status_code, 400)
+
+
+class CatalogImportTests(BookAPITestCase):
+    CSV = (
+        'isbn,title,author,publisher,category,price,stock\n'
+        '978-0-0000-0000-1,New Title,作者,出版社,小说,39.90,5\n'
+        '9780000000002,Second,作者,出版社,科技,20,0\n'
+        'bad,Broken,作者,出版社,小说,10,1\n'
+        '9780000000003,No Price,作者,出版社,小说,-1,1\n'
+    )
+
+    def upload(self, content, name='catalog.csv'):
+        file = io.BytesIO(content.encode())
+        file.name = name
+        return self.client.post('/api/books/books/import_catalog/', {'file': file}, format='multipart')
+
+    def test_import_upserts_by_isbn_and_reports_errors(self):
+        existing = self.create_book('9780000000001', 'Old Title', stock=7)
+        suggest_index.rebuild()
+
+        response = self.upload(self.CSV)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['updated'], response.data['failed']), (1, 1, 2))
+        self.assertEqual([error['row'] for error in response.data['errors']], [4, 5])
+
+        existing.refresh_from_db()
+        self.assertEqual(existing.title, 'New Title')
+        self.assertEqual(existing.price, Decimal('39.90'))
+        self.assertEqual(existing.stock, 7)
+        second = Book.objects.get(isbn='9780000000002')
+        self.assertEqual(second.category.name, '科技')
+        self.assertEqual(second.status, 'out_of_stock')
+        # 批量写入后检索索引同步更新
+        self.assertEqual([row['id'] for row in suggest_index.suggest('second')], [second.id])
+        response = self.client.get('/api/books/books/', {'search': 'second', 'search_mode': 'fts'})
+        self.assertEqual([row['id'] for row in response.data['results']], [second.id])
+
+    def test_management_command_reads_file(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as file:
+            file.write(self.CSV)
+        output = io.StringIO()
+        call_command('import_catalog', file.name, chunk_size=1, stdout=output, stderr=io.StringIO())
+        os.unlink(file.name)
+        self.assertIn('新增 2', output.getvalue())
+        self.assertEqual(Book.objects.count(), 2)
+
+    def test_non_finite_price_is_a_row_error(self):
+        response = self.upload(
+            'isbn,title,author,publisher,price\n'
+            '9780000000004,NaN,作者,出版社,NaN\n'
+            '9780000000005,Inf,作者,出版社,Infinity\n'
+            '9780000000006,Ok,作者,出版社,12\n'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual((response.data['created'], response.data['failed']), (1, 2))
+        self.assertEqual([error['error'] for error in response.data['errors']], ['价格格式错误'] * 2)
+
+
+@override_settings(COVER_THUMBNAIL_WORKERS=0)
+class CoverVariantTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.media_root = tempfile.mkdtemp()
+        self.settings_override = override_settings(MEDIA_ROOT=self.media_root)
+        self.settings_override.enable()
+        self.book = self.create_book('9780000000001', 'Python Cookbook')
+        self.other = self.create_book('9780000000002', 'Fluent Python')
+
+    def tearDown(self):
+        self.settings_override.disable()
+        shutil.rmtree(self.media_root)
+        super().tearDown()
+
+    def image_file(self, color='red'):
+        buffer = io.BytesIO()
+        Image.new('RGB', (800, 1200), color).save(buffer, 'PNG')
+        return SimpleUploadedFile('cover.png', buffer.getvalue(), content_type='image/png')
+
+    def upload(self, book, file):
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.patch(f'/api/books/books/{book.id}/', {'cover': file}, format='multipart')
+        self.assertEqual(response.status_code, 200)
+        book.refresh_from_db()
+
+    def test_upload_generates_variants(self):
+        self.upload(self.book, self.image_file())
+        self.assertEqual(len(self.book.cover_hash), 64)
+        with Image.open(self.book.cover_thumbnail.path) as thumbnail:
+            self.assertLessEqual(max(thumbnail.size), 96)
+        response = self.client.get(f'/api/books/books/{self.book.id}/')
+        self.assertTrue(response.data['cover_thumbnail'].endswith(f'{self.book.cover_hash}.jpg'))
+
+    def test_identical_images_are_deduplicated(self):
+        self.upload(self.book, self.image_file())
+        self.upload(self.other, self.image_file())
+        self.assertEqual(self.other.cover.name, self.book.cover.name)
+        self.assertEqual(self.other.cover_thumbnail.name, self.book.cover_thumbnail.name)
+        self.assertEqual(len(os.listdir(os.path.join(self.media_root, 'book_covers'))), 3)
+
+    def test_backfill_command_processes_existing_covers(self):
+        for book, color in ((self.book, 'red'), (self.other, 'blue')):
+            book.cover.save('cover.png', self.image_file(color), save=False)
+            Book.objects.filter(pk=book.pk).update(cover=book.cover.name)
+        call_command('process_covers', workers=2, stdout=io.StringIO())
+        hashes = set(Book.objects.values_list('cover_hash', flat=True))
+        self.assertEqual(len(hashes), 2)
+        self.assertNotIn('', hashes)
+
+
+class StockMutationTests(BookAPITestCase):
+    def test_update_stock_rejects_negative(self):
+        book = self.create_book('9787000000501', '库存', stock=3)
+        response = self.client.post(f'/api/books/books/{book.id}/update_stock/', {'stock_change': -4}, format='json')
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(f'/api/books/books/{book.id}/update_stock/', {'stock_change': -3}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['stock'], 0)
+        self.assertEqual(response.data['status'], 'out_of_stock')
+
+    def test_discontinued_status_is_kept(self):
+        book = self.create_book('9787000000502', '停售', stock=3, status='discontinued')
+        self.assertTrue(adjust_stock(book.id, 5))
+        book.refresh_from_db()
+        self.assertEqual((book.stock, book.status), (8, 'discontinued'))
+
+    def test_database_rejects_negative_stock(self):
+        book = self.create_book('9787000000503', '约束', stock=1)
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Book.objects.filter(pk=book.pk).update(stock=-1)
+
+    def test_apply_stock_changes_is_all_or_nothing(self):
+        first = self.create_book('9787000000504', '甲', stock=5)
+        second = self.create_book('9787000000505', '乙', stock=1)
+        with self.assertRaises(InsufficientStock) as caught, transaction.atomic():
+            apply_stock_changes({first.id: -2, second.id: -2}, 'sale')
+        self.assertEqual(caught.exception.book_ids, {second.id})
+        first.refresh_from_db()
+        self.assertEqual(first.stock, 5)
+
+        with transaction.atomic():
+            apply_stock_changes({first.id: -5, second.id: 3}, 'adjustment')
+        first.refresh_from_db()
+        second.refresh_from_db()
+        self.assertEqual((first.stock, first.status), (0, 'out_of_stock'))
+        self.assertEqual(second.stock, 4)
+
+    def test_failed_batch_sale_restores_stock(self):
+        first = self.create_book('9787000000506', '甲', stock=5, status='in_stock')
+        second = self.create_book('9787000000507', '乙', stock=1, status='in_stock')
+        response = self.client.post('/api/books/sales/create_batch/', {'items': [
+            {'book_id': first.id, 'quantity': 2},
+            {'book_id': second.id, 'quantity': 2},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 400)
+        first.refresh_from_db()
+        self.assertEqual(first.stock, 5)
+        self.assertFalse(Sale.objects.exists())
+
+    def test_pay_and_return_only_apply_once(self):
+        book = self.create_book('9787000000508', '进货', stock=0, status='out_of_stock')
+        order = PurchaseOrder.objects.create(book=book, purchase_price=Decimal('10.00'), quantity=4, created_by=self.user)
+        self.assertEqual(self.client.post(f'/api/books/purchase-orders/{order.id}/pay/').status_code, 200)
+        self.assertEqual(self.client.post(f'/api/books/purchase-orders/{order.id}/pay/').status_code, 400)
+        book.refresh_from_db()
+        self.assertEqual((book.stock, book.status), (4, 'in_stock'))
+
+        sale = Sale.objects.create(book=book, quantity=1, sale_price=Decimal('50.00'), created_by=self.user)
+        self.assertEqual(self.client.post(f'/api/books/sales/{sale.id}/return_sale/').status_code, 200)
+        self.assertEqual(self.client.post(f'/api/books/sales/{sale.id}/return_sale/').status_code, 400)
+        book.refresh_from_db()
+        self.assertEqual(book.stock, 5)
+
+
+class PurchaseOrderHeaderTests(BookAPITestCase):
+    def create_header(self, books, quantity=5):
+        response = self.client.post('/api/books/purchase-order-headers/', {
+            'supplier': '供应商',
+            'items': [{'book': book.id, 'purchase_price': '30.00', 'quantity': quantity} for book in books],
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data
+
+    def test_failed_line_insert_leaves_no_header(self):
+        book = self.create_book('9787000000890', '失败', stock=0)
+        with mock.patch.object(PurchaseOrder.objects, 'bulk_create', side_effect=IntegrityError):
+            with self.assertRaises(IntegrityError):
+                self.client.post('/api/books/purchase-order-headers/', {
+                    'supplier': '供应商',
+                    'items': [{'book': book.id, 'purchase_price': '30.00', 'quantity': 1}],
+                }, format='json')
+        self.assertFalse(PurchaseOrderHeader.objects.exists())
+
+    def test_pay_and_shelve_use_constant_queries(self):
+        books = [self.create_book(f'97870000008{number:02d}', f'进{number}', stock=0) for number in range(21)]
+        small, large = self.create_header(books[:1]), self.create_header(books[1:])
+        self.assertEqual(len(large['lines']), 20)
+        self.assertEqual(large['lines'][0]['book_title'], '进1')
+
+        counts = {}
+        for header in (small, large):
+            url = f'/api/books/purchase-order-headers/{header["id"]}/'
+            with CaptureQueriesContext(connection) as paid:
+                self.assertEqual(self.client.post(url + 'pay/').status_code, 200)
+            with CaptureQueriesContext(connection) as shelved:
+                response = self.client.post(url + 'shelve/', format='json')
+            self.assertEqual(response.status_code, 200)
+            counts[header['id']] = (len(paid), len(shelved))
+        self.assertEqual(counts[small['id']], counts[large['id']])
+        self.assertEqual(len(response.data['books']), 20)
+
+        # 付款和上架各增加一次库存，与单本订单一致
+        self.assertEqual(set(Book.objects.values_list('stock', flat=True)), {10})
+        self.assertEqual(set(PurchaseOrder.objects.values_list('status', flat=True)), {'shelved'})
+        expense = Financial.objects.get(object_id=large['id'])
+        self.assertEqual(expense.amount, Decimal('3000.00'))
+        self.assertEqual(Financial.objects.filter(category='purchase').count(), 2)
+
+    def test_new_books_need_retail_prices(self):
+        book = self.create_book('9787000000830', '新书', stock=0)
+        header = self.create_header([book])
+        url = f'/api/books/purchase-order-headers/{header["id"]}/'
+        self.client.post(url + 'pay/')
+        Book.objects.filter(pk=book.pk).update(stock=0)
+
+        response = self.client.post(url + 'shelve/', {}, format='json')
+        self.assertEqual(response.data['error'], '图书 《新书》 需要设置零售价格')
+        response = self.client.post(url + 'shelve/', {'retail_prices': {book.id: '-1'}}, format='json')
+        self.assertEqual(response.data['error'], '零售价格必须为正数')
+        response = self.client.post(url + 'shelve/', {'retail_prices': {book.id: '68.00'}}, format='json')
+        self.assertEqual(response.status_code, 200)
+        book.refresh_from_db()
+        self.assertEqual((book.price, book.stock, book.status), (Decimal('68.00'), 5, 'in_stock'))
+
+    def test_lines_follow_the_header(self):
+        book = self.create_book('9787000000831', '整单')
+        header = self.create_header([book])
+        line = header['lines'][0]['id']
+        response = self.client.post(f'/api/books/purchase-orders/{line}/pay/')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], f'该订单属于进货单 {header["id"]}，请对整张进货单操作')
+
+        url = f'/api/books/purchase-order-headers/{header["id"]}/'
+        self.assertEqual(self.client.post(url + 'shelve/').data['error'], '只有已付款的进货单才能上架')
+        self.assertEqual(self.client.post(url + 'return_order/').status_code, 200)
+        self.assertEqual(PurchaseOrder.objects.get(pk=line).status, 'returned')
+        self.assertEqual(self.client.post(url + 'pay/').data['error'], '只有未付款的进货单才能进行付款')
+
+    def test_missing_book_is_rejected(self):
+        response = self.client.post('/api/books/purchase-order-headers/', {
+            'items': [{'book': 999999, 'purchase_price': '30.00', 'quantity': 1}],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(PurchaseOrderHeader.objects.exists())
+
+
+class ManifestImportTests(BookAPITestCase):
+    def upload(self, content, name='manifest.csv', **data):
+        file = io.BytesIO(content.encode())
+        file.name = name
+        return self.client.post(
+            '/api/books/purchase-order-headers/import_manifest/', {'file': file, **data}, format='multipart'
+        )
+
+    def test_manifest_creates_books_and_one_header(self):
+        existing = self.create_book('9787000000900', '已有', stock=3)
+        rows = ['isbn,quantity,purchase_price,title,author,publisher,category']
+        rows.append('9787000000900,4,20.00,,,,')
+        rows += [f'97870000009{number:02d},2,10.00,新书{number},作者,出版社,教辅' for number in range(1, 51)]
+        rows.append('9787000000901,1,12.00,,,,')
+
+        with CaptureQueriesContext(connection) as context:
+            response = self.upload('\n'.join(rows) + '\n', supplier='新华')
+        self.assertEqual(response.status_code, 201)
+        self.assertLess(len(context), 30)
+        self.assertEqual((response.data['lines'], response.data['created_books']), (52, 50))
+
+        header = PurchaseOrderHeader.objects.get(pk=response.data['header'])
+        self.assertEqual((header.supplier, header.lines.count()), ('新华', 52))
+        new_book = Book.objects.get(isbn='9787000000901')
+        self.assertEqual((new_book.price, new_book.stock, new_book.status), (Decimal('13.00'), 0, 'out_of_stock'))
+        self.assertEqual(new_book.category.name, '教辅')
+        self.assertEqual(header.lines.get(book=existing).book_title, '已有')
+        self.assertTrue(StockCheckpoint.objects.filter(book=new_book).exists())
+
+    def test_any_bad_row_imports_nothing(self):
+        content = (
+            'isbn,quantity,purchase_price,title,author,publisher\n'
+            '9787000000960,2,10.00,好书,作者,出版社\n'
+            '9787000000961,0,10.00,坏数量,作者,出版社\n'
+            '9787000000962,1,10.00,,作者,出版社\n'
+        )
+        response = self.upload(content)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual([(error['row'], error['error']) for error in response.data['errors']], [
+            (3, '数量必须大于0'), (4, '新书的 title 不能为空'),
+        ])
+        self.assertFalse(Book.objects.exists())
+        self.assertFalse(PurchaseOrderHeader.objects.exists())
+
+
+class PurchaseOrderBatchTests(BookAPITestCase):
+    def create_orders(self, books, quantity=5):
+        return [
+            PurchaseOrder.objects.create(book=book, purchase_price=Decimal('30.00'), quantity=quantity, created_by=self.user).id
+            for book in books
+        ]
+
+    def post(self, action, data):
+        return self.client.post(f'/api/books/purchase-orders/{action}/', data, format='json')
+
+    def test_batch_query_counts_are_constant(self):
+        books = [self.create_book(f'97870000008{number:02d}', f'批{number}', stock=1) for number in range(40, 61)]
+        small, large = self.create_orders(books[:1]), self.create_orders(books[1:])
+        counts = []
+        for ids in (small, large):
+            with CaptureQueriesContext(connection) as paid:
+                self.assertEqual(self.post('pay_batch', {'orders': ids}).status_code, 200)
+            with CaptureQueriesContext(connection) as shelved:
+                response = self.post('shelve_batch', {'orders': ids})
+            counts.append((len(paid), len(shelved)))
+        self.assertEqual(counts[0], counts[1])
+        self.assertEqual(response.data['results'][0], {'id': large[0], 'status': 'shelved'})
+        self.assertEqual(set(Book.objects.values_list('stock', flat=True)), {11})
+        self.assertEqual(Financial.objects.get(description='批量付款：进货订单 20 笔').amount, Decimal('3000.00'))
+
+    def test_each_order_reports_its_outcome(self):
+        paid_book = self.create_book('9787000000870', '已付', stock=1)
+        new_book = self.create_book('9787000000871', '新书', stock=0)
+        header = PurchaseOrderHeader.objects.create(created_by=self.user)
+        already_paid, fresh = self.create_orders([paid_book, new_book])
+        in_header = PurchaseOrder.objects.create(
+            header=header, book=paid_book, purchase_price=Decimal('30.00'), quantity=1
+        ).id
+        PurchaseOrder.objects.filter(pk=already_paid).update(status='paid')
+
+        response = self.post('pay_batch', {'orders': [already_paid, fresh, in_header, 999999]})
+        self.assertEqual(response.data['results'], [
+            {'id': already_paid, 'error': '只有未付款的订单才能进行付款'},
+            {'id': fresh, 'status': 'paid'},
+            {'id': in_header, 'error': f'该订单属于进货单 {header.id}，请对整张进货单操作'},
+            {'id': 999999, 'error': '订单不存在'},
+        ])
+
+        Book.objects.filter(pk=new_book.pk).update(stock=0)
+        response = self.post('shelve_batch', {'orders': [already_paid, fresh]})
+        self.assertEqual(response.data['results'][1], {'id': fresh, 'error': '图书 《新书》 需要设置零售价格'})
+        response = self.post('shelve_batch', {'orders': [fresh], 'retail_prices': {new_book.id: '45.50'}})
+        self.assertEqual(response.data['results'], [{'id': fresh, 'status': 'shelved'}])
+        new_book.refresh_from_db()
+        self.assertEqual((new_book.price, new_book.stock), (Decimal('45.50'), 5))
+
+        self.assertEqual(self.post('pay_batch', {'orders': []}).data['error'], '订单列表不能为空')
+        self.assertEqual(self.post('shelve_batch', {'orders': [fresh], 'retail_prices': [1]}).data['error'], '零售价格格式错误')
+
+
+class CheckoutTests(BookAPITestCase):
+    def checkout(self, books, quantity=1):
+        return self.client.post('/api/books/sales/create_batch/', {
+            'items': [{'book_id': book.id, 'quantity': quantity} for book in books]
+        }, format='json')
+
+    def test_query_count_is_constant_in_basket_size(self):
+        books = [self.create_book(f'97870000006{number:02d}', f'书{number}', status='in_stock') for number in range(31)]
+        with CaptureQueriesContext(connection) as single:
+            self.assertEqual(self.checkout(books[:1]).status_code, 201)
+        with CaptureQueriesContext(connection) as basket:
+            response = self.checkout(books[1:])
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 30)
+        self.assertEqual(len(basket), len(single))
+        self.assertEqual(StockMovement.objects.filter(reason='sale').count(), 31)
+        self.assertEqual(Financial.objects.get(amount=Decimal('1500.00')).description, '销售图书 30 本')
+
+    def test_duplicate_lines_are_merged(self):
+        book = self.create_book('9787000000650', '合并', stock=5, status='in_stock')
+        response = self.client.post('/api/books/sales/create_batch/', {'items': [
+            {'book_id': book.id, 'quantity': 2}, {'book_id': book.id, 'quantity': 3},
+        ]}, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data[0]['quantity'], 5)
+        book.refresh_from_db()
+        self.assertEqual((book.stock, book.status), (0, 'out_of_stock'))
+
+    def test_invalid_basket_writes_nothing(self):
+        book = self.create_book('9787000000651', '校验', stock=5, status='in_stock')
+        for items, error in [
+            ([], '销售项目不能为空'),
+            ([{'book_id': book.id}], '销售项目格式错误'),
+            ([{'book_id': book.id, 'quantity': 0}], '销售数量必须大于0'),
+            ([{'book_id': book.id, 'quantity': 1}, {'book_id': 999999, 'quantity': 1}], '图书ID 999999 不存在'),
+            ([{'book_id': book.id, 'quantity': 6}], '图书 校验 库存不足'),
+        ]:
+            response = self.client.post('/api/books/sales/create_batch/', {'items': items}, format='json')
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['error'], error)
+        self.assertFalse(Sale.objects.exists())
+        self.assertFalse(Financial.objects.exists())
+
+    def test_concurrent_decrement_rolls_back(self):
+        book = self.create_book('9787000000652', '并发', stock=2, status='in_stock')
+        other = self.create_book('9787000000653', '其他', stock=2, status='in_stock')
+        original = checkout_module.load_books
+
+        def load_then_sell_out(quantities):
+            books = original(quantities)
+            Book.objects.filter(pk=book.pk).update(stock=0)
+            return books
+
+        with mock.patch('books.checkout.load_books', load_then_sell_out):
+            response = self.checkout([other, book])
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data['error'], '图书 并发 库存不足')
+        other.refresh_from_db()
+        self.assertEqual(other.stock, 2)
+        self.assertFalse(Sale.objects.exists())
+
+
+class ReturnBatchTests(BookAPITestCase):
+    def sell(self, books, quantity=2):
+        response = self.client.post('/api/books/sales/create_batch/', {
+            'items': [{'book_id': book.id, 'quantity': quantity} for book in books]
+        }, format='json')
+        return [sale['id'] for sale in response.data]
+
+    def return_batch(self, sale_ids):
+        return self.client.post('/api/books/sales/return_batch/', {'sales': sale_ids}, format='json')
+
+    def test_query_count_is_constant_in_receipt_size(self):
+        books = [self.create_book(f'97870000007{number:02d}', f'退{number}', status='in_stock') for number in range(21)]
+        sale_ids = self.sell(books)
+        with CaptureQueriesContext(connection) as single:
+            self.assertEqual(self.return_batch(sale_ids[:1]).status_code, 200)
+        with CaptureQueriesContext(connection) as receipt:
+            response = self.return_batch(sale_ids[1:])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(receipt), len(single))
+        self.assertEqual({sale['status'] for sale in response.data['sales']}, {'returned'})
+        self.assertEqual(set(Book.objects.values_list('stock', flat=True)), {10})
+        self.assertEqual(StockMovement.objects.filter(reason='sale_return').count(), 21)
+        refund = Financial.objects.get(type='expense', description='销售退货 20 笔')
+        self.assertEqual(refund.amount, Decimal('2000.00'))
+        self.assertEqual(
+            DailySalesRollup.objects.filter(book=books[1]).values_list('units', 'returned_units').get(), (2, 2)
+        )
+
+    def test_invalid_receipt_returns_nothing(self):
+        book = self.create_book('9787000000730', '整单', status='in_stock')
+        returned, completed = self.sell([book]), self.sell([book])
+        self.assertEqual(self.return_batch(returned).status_code, 200)
+        for sale_ids, error in [
+            ([], '退货项目不能为空'),
+            (['x'], '退货项目格式错误'),
+            (completed + [999999], '销售记录ID 999999 不存在'),
+            (completed + returned, f'销售记录 {returned[0]} 不是已完成的销售，不能退货'),
+        ]:
+            response = self.return_batch(sale_ids)
+            self.assertEqual(response.status_code, 400)
+            self.assertEqual(response.data['error'], error)
+        self.assertEqual(Sale.objects.get(pk=completed[0]).status, 'completed')
+        book.refresh_from_db()
+        self.assertEqual(book.stock, 8)
+        self.assertEqual(Financial.objects.filter(type='expense').count(), 1)
+
+    def test_single_return_books_the_same_refund(self):
+        book = self.create_book('9787000000731', '单笔', status='in_stock', price='30.00')
+        single, batch = self.sell([book]), self.sell([book])
+        response = self.client.post(f'/api/books/sales/{single[0]}/return_sale/')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['sale']['status'], 'returned')
+        self.assertEqual(self.return_batch(batch).status_code, 200)
+        self.assertEqual(
+            list(Financial.objects.filter(type='expense').values_list('category', 'amount', 'description')),
+            [('sale', Decimal('60.00'), '销售退货 1 笔')] * 2
+        )
+        book.refresh_from_db()
+        self.assertEqual(book.stock, 10)
+
+
+class OfflineSyncTests(BookAPITestCase):
+    def post(self, receipts):
+        body = '\n'.join(r if isinstance(r, str) else json.dumps(r) for r in receipts)
+        response = self.client.post('/api/books/sales/sync/', body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, 200)
+        return response
+
+    def sync(self, receipts, chunk_size=200):
+        with mock.patch('books.sync.CHUNK_SIZE', chunk_size):
+            response = self.post(receipts)
+            return [json.loads(line) for line in b''.join(response.streaming_content).decode().splitlines()]
+
+    def receipt(self, client_id, book, quantity=1, created_at='2026-10-01T09:30:00+08:00'):
+        return {'client_id': client_id, 'created_at': created_at, 'items': [{'book_id': book.id, 'quantity': quantity}]}
+
+    def test_receipts_keep_original_time_and_deduplicate(self):
+        book = self.create_book('9787000000660', '离线', stock=10, status='in_stock')
+        results = self.sync([self.receipt('till-1-1', book, 2), self.receipt('till-1-2', book, 3)])
+        self.assertEqual([r['status'] for r in results], ['created', 'created'])
+        sale = Sale.objects.get(client_id='till-1-1')
+        self.assertEqual(results[0]['sales'], [sale.id])
+        self.assertEqual(sale.created_at, datetime.fromisoformat('2026-10-01T09:30:00+08:00'))
+        book.refresh_from_db()
+        self.assertEqual(book.stock, 5)
+        self.assertEqual(DailySalesRollup.objects.get(book=book, date=parse_date('2026-10-01')).units, 5)
+        self.assertEqual(Financial.objects.count(), 2)
+
+        # 重新上传同一批小票不会重复扣减库存
+        results = self.sync([self.receipt('till-1-1', book, 2), self.receipt('till-1-1', book, 2)])
+        self.assertEqual(results, [
+            {'line': 1, 'client_id': 'till-1-1', 'status': 'duplicate', 'sales': [sale.id]},
+            {'line': 2, 'client_id': 'till-1-1', 'status': 'duplicate', 'sales': []},
+        ])
+        book.refresh_from_db()
+        self.assertEqual(book.stock, 5)
+        self.assertEqual(Sale.objects.count(), 2)
+
+    def test_bad_lines_do_not_block_the_rest(self):
+        book = self.create_book('9787000000661', '部分', stock=3, status='in_stock')
+        results = self.sync([
+            'not json',
+            {'client_id': 'till-2-1', 'created_at': 'yesterday', 'items': []},
+            self.receipt('till-2-2', book, 2),
+            self.receipt('till-2-3', book, 2),
+            {'created_at': '2026-10-01T10:00:00', 'items': [{'book_id': book.id, 'quantity': 1}]},
+            self.receipt('till-2-4', book, 1),
+        ])
+        self.assertEqual([(r['line'], r['status'], r.get('error')) for r in results], [
+            (1, 'error', '不是有效的 JSON'),
+            (2, 'error', 'created_at 时间格式错误'),
+            (3, 'created', None),
+            (4, 'error', '图书 部分 库存不足'),
+            (5, 'error', 'client_id 不能为空'),
+            (6, 'created', None),
+        ])
+        book.refresh_from_db()
+        self.assertEqual((book.stock, book.status), (0, 'out_of_stock'))
+
+    def test_query_count_is_constant_per_chunk(self):
+        books = [self.create_book(f'97870000006{number:02d}', f'同步{number}', status='in_stock') for number in range(70, 90)]
+        with CaptureQueriesContext(connection) as small:
+            self.sync([self.receipt(f'a-{n}', books[n]) for n in range(2)], chunk_size=50)
+        with CaptureQueriesContext(connection) as large:
+            results = self.sync([self.receipt(f'b-{n}', books[n % 20]) for n in range(40)], chunk_size=50)
+        self.assertTrue(all(r['status'] == 'created' for r in results))
+        self.assertEqual(len(large), len(small))
+        self.assertEqual(StockMovement.objects.filter(reason='sale').count(), 22)
+
+    def test_results_stream_as_each_chunk_commits(self):
+        book = self.create_book('9787000000692', '分块', stock=10, status='in_stock')
+        with mock.patch('books.sync.CHUNK_SIZE', 2):
+            content = self.post([self.receipt(f'c-{n}', book) for n in range(5)]).streaming_content
+            first = [json.loads(next(content)) for _ in range(2)]
+            self.assertEqual([r['line'] for r in first], [1, 2])
+            self.assertEqual(Sale.objects.count(), 2)
+            rest = [json.loads(line) for line in content]
+        self.assertEqual([r['line'] for r in rest], [3, 4, 5])
+        book.refresh_from_db()
+        self.assertEqual(book.stock, 5)
+
+
+class IdempotencyKeyTests(BookAPITestCase):
+    def pay(self, order, key):
+        return self.client.post(f'/api/books/purchase-orders/{order.id}/pay/', HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_replay_returns_stored_response_without_executing(self):
+        book = self.create_book('9787000000701', '幂等', stock=0, status='out_of_stock')
+        order = PurchaseOrder.objects.create(book=book, purchase_price=Decimal('10.00'), quantity=3, created_by=self.user)
+        first = self.pay(order, 'pay-1')
+        replay = self.pay(order, 'pay-1')
+        self.assertEqual(first.status_code, 200)
+        self.assertEqual(replay.status_code, 200)
+        self.assertEqual(replay.data, first.data)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        book.refresh_from_db()
+        self.assertEqual(book.stock, 3)
+        self.assertEqual(Financial.objects.count(), 1)
+        # 没有幂等键时照常执行
+        self.assertEqual(self.client.post(f'/api/books/purchase-orders/{order.id}/pay/').status_code, 400)
+
+    def test_checkout_replay_and_key_reuse(self):
+        book = self.create_book('9787000000702', '结账', stock=5, status='in_stock')
+        items = {'items': [{'book_id': book.id, 'quantity': 2}]}
+        url = '/api/books/sales/create_batch/'
+        self.assertEqual(self.client.post(url, items, format='json', HTTP_IDEMPOTENCY_KEY='till-1').status_code, 201)
+        self.assertEqual(self.client.post(url, items, format='json', HTTP_IDEMPOTENCY_KEY='till-1').status_code, 201)
+        book.refresh_from_db()
+        self.assertEqual(book.stock, 3)
+        self.assertEqual(Sale.objects.count(), 1)
+        other = {'items': [{'book_id': book.id, 'quantity': 1}]}
+        self.assertEqual(self.client.post(url, other, format='json', HTTP_IDEMPOTENCY_KEY='till-1').status_code, 422)
+
+    def test_in_progress_and_expired_keys(self):
+        book = self.create_book('9787000000703', '处理中', stock=5, status='in_stock')
+        url = f'/api/books/books/{book.id}/update_stock/'
+        response = self.client.post(url, {'stock_change': 1}, format='json', HTTP_IDEMPOTENCY_KEY='k')
+        record = IdempotencyKey.objects.get(key='k')
+        record.status_code = None
+        record.save()
+        response = self.client.post(url, {'stock_change': 1}, format='json', HTTP_IDEMPOTENCY_KEY='k')
+        self.assertEqual(response.status_code, 409)
+
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        response = self.client.post(url, {'stock_change': 1}, format='json', HTTP_IDEMPOTENCY_KEY='k')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['stock'], 7)
+
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(days=2))
+        call_command('purge_idempotency_keys', stdout=io.StringIO())
+        self.assertFalse(IdempotencyKey.objects.exists())
+
+    @override_settings(IDEMPOTENCY_LOCK_TIMEOUT=30)
+    def test_abandoned_in_progress_key_can_be_reclaimed(self):
+        book = self.create_book('9787000000705', '中断', stock=5, status='in_stock')
+        url = f'/api/books/books/{book.id}/update_stock/'
+        # 原请求的进程在处理中崩溃，只留下处理中的记录
+        self.client.post(url, {'stock_change': 1}, format='json', HTTP_IDEMPOTENCY_KEY='k')
+        IdempotencyKey.objects.update(status_code=None, response_body='')
+        response = self.client.post(url, {'stock_change': 1}, format='json', HTTP_IDEMPOTENCY_KEY='k')
+        self.assertEqual(response.status_code, 409)
+
+        IdempotencyKey.objects.update(created_at=timezone.now() - timedelta(seconds=31))
+        response = self.client.post(url, {'stock_change': 1}, format='json', HTTP_IDEMPOTENCY_KEY='k')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['stock'], 7)
+        response = self.client.post(url, {'stock_change': 1}, format='json', HTTP_IDEMPOTENCY_KEY='k')
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.assertEqual(response.data['stock'], 7)
+
+    def test_user_actions_accept_keys(self):
+        admin = User.objects.create_user('admin', 'admin@example.com', 'password123', role='admin', is_staff=True)
+        self.client.force_authenticate(admin)
+        url = f'/api/accounts/users/{self.user.id}/deactivate/'
+        self.assertEqual(self.client.post(url, HTTP_IDEMPOTENCY_KEY='u').status_code, 200)
+        self.user.is_active = True
+        self.user.save()
+        response = self.client.post(url, HTTP_IDEMPOTENCY_KEY='u')
+        self.assertEqual(response['Idempotent-Replayed'], 'true')
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.is_active)
+
+    def test_keys_are_scoped_per_user(self):
+        book = self.create_book('9787000000704', '用户', stock=5, status='in_stock')
+        url = f'/api/books/books/{book.id}/update_stock/'
+        self.client.post(url, {'stock_change': 1}, format='json', HTTP_IDEMPOTENCY_KEY='shared')
+        other = APIClient()
+        other.force_authenticate(User.objects.create_user('other', 'other@example.com', 'password123', role='staff'))
+        other.post(url, {'stock_change': 1}, format='json', HTTP_IDEMPOTENCY_KEY='shared')
+        book.refresh_from_db()
+        self.assertEqual(book.stock, 7)
+
+
+class SalesRollupTests(BookAPITestCase):
+    def sell(self, book, quantity):
+        return self.client.post('/api/books/sales/create_batch/', {
+            'items': [{'book_id': book.id, 'quantity': quantity}]
+        }, format='json').data[0]['id']
+
+    def test_rollup_is_maintained_by_checkout_and_return(self):
+        book = self.create_book('9787000000801', '汇总', stock=10, status='in_stock', price='20.00')
+        self.sell(book, 2)
+        sale_id = self.sell(book, 3)
+        self.client.post(f'/api/books/sales/{sale_id}/return_sale/')
+
+        row = DailySalesRollup.objects.get(book=book, date=timezone.localdate())
+        self.assertEqual((row.units, row.revenue), (5, Decimal('100.00')))
+        self.assertEqual((row.returned_units, row.returned_revenue), (3, Decimal('60.00')))
+        self.assertEqual(row.category_id, self.category.id)
+
+        # 重建得到的结果与增量维护的一致
+        rollup.rebuild_month(timezone.localdate().replace(day=1))
+        rebuilt = DailySalesRollup.objects.get(book=book, date=timezone.localdate())
+        self.assertEqual(
+            (rebuilt.units, rebuilt.revenue, rebuilt.returned_units, rebuilt.returned_revenue),
+            (5, Decimal('100.00'), 3, Decimal('60.00')),
+        )
+
+    def test_command_rebuilds_open_month_in_one_transaction(self):
+        from .management.commands import rebuild_sales_rollup
+
+        book = self.create_book('9787000000803', '本月', stock=10, status='in_stock', price='20.00')
+        self.sell(book, 2)
+        current = timezone.localdate().replace(day=1)
+        with mock.patch.object(rebuild_sales_rollup, '_aggregate', wraps=rebuild_sales_rollup._aggregate) as aggregate, \
+                mock.patch.object(rollup, 'rebuild_month', wraps=rollup.rebuild_month) as rebuild:
+            call_command('rebuild_sales_rollup', f'{current:%Y-%m}', stdout=io.StringIO())
+        # 本月不走并行汇总，汇总和写入在 rebuild_month 的同一个事务中完成
+        aggregate.assert_not_called()
+        rebuild.assert_called_once_with(current)
+        self.assertEqual(DailySalesRollup.objects.get(book=book).units, 2)
+
+    def test_rollup_endpoint_groups_by_period(self):
+        book = self.create_book('9787000000802', '报表', price='10.00')
+        for day, units in (('2024-01-30', 1), ('2024-01-31', 2), ('2024-02-01', 4)):
+            rollup.apply_changes(parse_date(day), {book.id: {'units': units, 'revenue': Decimal(units * 10)}})
+
+        url = '/api/books/sales/rollup/'
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url, {'granularity': 'month'})
+        self.assertFalse([query for query in context if 'books_sale' in query['sql']])
+        self.assertEqual([(row['period'], row['units']) for row in response.data], [
+            (parse_date('2024-01-01'), 3), (parse_date('2024-02-01'), 4),
+        ])
+        response = self.client.get(url, {'granularity': 'week'})
+        self.assertEqual([row['units'] for row in response.data], [7])
+        response = self.client.get(url, {'granularity': 'day', 'start': '2024-01-31', 'end': '2024-01-31'})
+        self.assertEqual([(row['units'], row['revenue']) for row in response.data], [(2, Decimal('20.00'))])
+        self.assertEqual(self.client.get(url, {'granularity': 'year'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'start': '2024-13-01'}).status_code, 400)
+        self.assertEqual([row['units'] for row in self.client.get(url, {'book': book.id}).data], [1, 2, 4])
+        self.assertEqual(self.client.get(url, {'category': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(url, {'book': '1.5'}).status_code, 400)
+
+
+class AsyncPOSTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.pos = Client(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(self.user)}')
+
+    def test_requires_staff_token(self):
+        self.assertEqual(Client().get('/api/books/pos/lookup/', {'isbn': '9787000000951'}).status_code, 401)
+        customer = User.objects.create_user('guest', 'guest@example.com', 'password123', role='customer')
+        client = Client(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(customer)}')
+        self.assertEqual(client.get('/api/books/pos/lookup/', {'isbn': '9787000000951'}).status_code, 403)
+        bad = Client(HTTP_AUTHORIZATION='Bearer not-a-token')
+        self.assertEqual(bad.get('/api/books/pos/lookup/', {'isbn': '9787000000951'}).status_code, 401)
+
+    def test_lookup_matches_sync_endpoint(self):
+        scan_cache.clear()
+        self.create_book('9787000000951', '异步')
+        params = {'isbn': '9787000000951,7000000950,123'}
+        response = self.pos.get('/api/books/pos/lookup/', params)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), json.loads(self.client.get('/api/books/books/lookup/', params).content))
+        self.assertEqual(response.json()['invalid'], ['123'])
+        self.assertEqual(self.pos.get('/api/books/pos/lookup/').status_code, 400)
+
+    def test_checkout_with_idempotency_key(self):
+        book = self.create_book('9787000000952', '收银', stock=5, status='in_stock')
+        body = json.dumps({'items': [{'book_id': book.id, 'quantity': 2}]})
+        url = '/api/books/pos/checkout/'
+        first = self.pos.post(url, body, content_type='application/json', HTTP_IDEMPOTENCY_KEY='pos-1')
+        replay = self.pos.post(url, body, content_type='application/json', HTTP_IDEMPOTENCY_KEY='pos-1')
+        self.assertEqual(first.status_code, 201)
+        self.assertEqual(first.json()[0]['quantity'], 2)
+        self.assertEqual(replay.status_code, 201)
+        self.assertEqual(replay['Idempotent-Replayed'], 'true')
+        self.assertEqual(replay.json(), first.json())
+        book.refresh_from_db()
+        self.assertEqual(book.stock, 3)
+
+        response = self.pos.post(url, json.dumps({'items': [{'book_id': book.id, 'quantity': 9}]}), content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'error': '图书 收银 库存不足'})
+        self.assertEqual(self.pos.get(url).status_code, 405)
+
+    def test_late_checkout_does_not_overwrite_reclaimed_key(self):
+        from . import async_views
+
+        book = self.create_book('9787000000953', '超时', stock=5, status='in_stock')
+        checkout = async_views._checkout
+
+        def slow_checkout(items, user):
+            # 原请求超过锁定时间，期间重试请求接管了幂等键并已完成
+            record = IdempotencyKey.objects.get(key='pos-2')
+            IdempotencyKey.objects.filter(pk=record.pk).delete()
+            IdempotencyKey.objects.create(
+                key='pos-2', user=user, request_hash=record.request_hash, status_code=201, response_body='[]'
+            )
+            return checkout(items, user)
+
+        body = json.dumps({'items': [{'book_id': book.id, 'quantity': 1}]})
+        with mock.patch.object(async_views, '_checkout', slow_checkout):
+            response = self.pos.post('/api/books/pos/checkout/', body, content_type='application/json', HTTP_IDEMPOTENCY_KEY='pos-2')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(IdempotencyKey.objects.get(key='pos-2').response_body, '[]')
+
+
+class LeaderboardTests(BookAPITestCase):
+    def test_windows_expire_and_returns_subtract(self):
+        board = Leaderboard()
+        start = timezone.now()
+        with mock.patch('books.leaderboard.timezone.now', return_value=start):
+            board.rebuild()
+            board.record([(1, 10, 5), (2, 10, 3), (3, 20, 4)])
+        later = start + timedelta(days=2)
+        with mock.patch('books.leaderboard.timezone.now', return_value=later):
+            board.record([(2, 10, 1)])
+            board.record([(1, 10, -2)], start)
+            self.assertEqual(board.top('1d'), [(2, 1)])
+            self.assertEqual(board.top('7d'), [(2, 4), (3, 4), (1, 3)])
+            self.assertEqual(board.top('7d', category=20), [(3, 4)])
+            self.assertEqual(board.top('7d', limit=1), [(2, 4)])
+        with mock.patch('books.leaderboard.timezone.now', return_value=start + timedelta(days=8)):
+            self.assertEqual(board.top('7d'), [(2, 1)])
+            self.assertEqual(board.top('30d'), [(2, 4), (3, 4), (1, 3)])
+        with mock.patch('books.leaderboard.timezone.now', return_value=start + timedelta(days=40)):
+            self.assertEqual(board.top('30d'), [])
+
+    def test_return_after_category_change_subtracts_original_category(self):
+        other = Category.objects.create(name='科技')
+        book = self.create_book('9787000000905', '换分类', stock=10, status='in_stock')
+        board = Leaderboard()
+        board.rebuild()
+        start = timezone.now()
+        sale = Sale.objects.create(book=book, quantity=3, sale_price=book.price, created_by=self.user)
+        with mock.patch('books.leaderboard.timezone.now', return_value=start):
+            board.record([(book.id, self.category.id, 3)])
+        book.category = other
+        book.save()
+        sale.refresh_from_db()
+        with self.captureOnCommitCallbacks(execute=True), \
+                mock.patch('books.leaderboard.timezone.now', return_value=start):
+            board.record_returns([sale])
+        self.assertEqual(board.top('1d', category=self.category.id), [])
+        self.assertEqual(board.top('1d', category=other.id), [])
+        # 销售所在的桶移出窗口后，分类累计不会被减成错误的值
+        with mock.patch('books.leaderboard.timezone.now', return_value=start + timedelta(days=2)):
+            self.assertEqual(board.top('1d', category=self.category.id), [])
+            self.assertEqual(board._category_totals['1d'].get(other.id, {}), {})
+            self.assertEqual(dict(board._category_totals['1d'].get(self.category.id, {})), {})
+
+    def test_top_endpoint_tracks_sales_and_rebuilds(self):
+        leaderboard.rebuild()
+        first = self.create_book('9787000000901', '畅销', stock=10, status='in_stock')
+        second = self.create_book('9787000000902', '次之', stock=10, status='in_stock')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/books/sales/create_batch/', {'items': [
+                {'book_id': first.id, 'quantity': 3}, {'book_id': second.id, 'quantity': 1},
+            ]}, format='json')
+
+        response = self.client.get('/api/books/sales/top/', {'window': '1d'})
+        self.assertEqual([(row['title'], row['units']) for row in response.data], [('畅销', 3), ('次之', 1)])
+        response = self.client.get('/api/books/sales/top/', {'window': '7d', 'category': self.category.id + 1})
+        self.assertEqual(response.data, [])
+        self.assertEqual(self.client.get('/api/books/sales/top/', {'window': '2d'}).status_code, 400)
+
+        # 重启后从销售记录重建
+        leaderboard.rebuild()
+        response = self.client.get('/api/books/sales/top/', {'window': '30d', 'category': self.category.id})
+        self.assertEqual([row['units'] for row in response.data], [3, 1])
+
+    def test_local_sales_do_not_hide_other_workers_sales(self):
+        first = self.create_book('9787000000903', '本进程', stock=10, status='in_stock')
+        other = self.create_book('9787000000904', '其他进程', stock=10, status='in_stock')
+        board = Leaderboard()
+        board.rebuild()
+        # 其他工作进程的销售：写入数据库并把版本号加一，本进程的内存榜单不知道
+        Sale.objects.create(book=other, quantity=5, sale_price=other.price, created_by=self.user)
+        IndexVersion.bump('leaderboard')
+        Sale.objects.create(book=first, quantity=2, sale_price=first.price, created_by=self.user)
+        board.record([(first.id, self.category.id, 2)])
+        self.assertEqual(board.top('1d'), [(first.id, 2)])
+        board._checked_at = 0
+        self.assertEqual(board.top('1d'), [(other.id, 5), (first.id, 2)])
+        self.assertEqual(board.top('1d', category=self.category.id), [(other.id, 5), (first.id, 2)])
+
+        # 只有本进程的记录时不重建
+        board.record([(first.id, self.category.id, 1)])
+        board._checked_at = 0
+        with mock.patch.object(board, 'rebuild') as rebuild:
+            self.assertEqual(board.top('1d'), [(other.id, 5), (first.id, 3)])
+        rebuild.assert_not_called()
+
+
+class CostLotTests(BookAPITestCase):
+    def receive(self, book, quantity, price):
+        order = PurchaseOrder.objects.create(book=book, purchase_price=Decimal(price), quantity=quantity, created_by=self.user)
+        self.assertEqual(self.client.post(f'/api/books/purchase-orders/{order.id}/pay/').status_code, 200)
+
+    def sell(self, book, quantity):
+        response = self.client.post('/api/books/sales/create_batch/', {
+            'items': [{'book_id': book.id, 'quantity': quantity}]
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        return response.data[0]
+
+    def test_sales_consume_lots_first_in_first_out(self):
+        book = self.create_book('9787000000980', '成本', stock=0, status='in_stock')
+        self.receive(book, 5, '10.00')
+        self.receive(book, 5, '20.00')
+        sale = self.sell(book, 7)
+        self.assertEqual(Decimal(sale['cogs']), Decimal('90.00'))
+        self.assertEqual(list(CostLot.objects.order_by('id').values_list('remaining', flat=True)), [0, 3])
+
+        self.client.post(f'/api/books/sales/{sale["id"]}/return_sale/')
+        returned = CostLot.objects.get(source='sale_return')
+        self.assertEqual((returned.remaining, returned.reference_id), (7, sale['id']))
+        self.assertEqual(returned.unit_cost.quantize(Decimal('0.0001')), Decimal('12.8571'))
+        # 先消耗剩余的 3 本 20 元批次，再消耗按原销售时间入库的退货批次
+        self.assertEqual(Decimal(self.sell(book, 7)['cogs']), Decimal('111.43'))
+
+    @override_settings(INVENTORY_COST_METHOD='average')
+    def test_weighted_average_option(self):
+        book = self.create_book('9787000000981', '平均', stock=0, status='in_stock')
+        self.receive(book, 5, '10.00')
+        self.receive(book, 5, '20.00')
+        self.assertEqual(Decimal(self.sell(book, 7)['cogs']), Decimal('105.00'))
+
+    def test_units_without_lots_use_latest_purchase_cost(self):
+        book = self.create_book('9787000000982', '旧库存', stock=10, status='in_stock')
+        self.assertEqual(Decimal(self.sell(book, 2)['cogs']), Decimal('0.00'))
+        self.receive(book, 1, '12.00')
+        self.assertEqual(Decimal(self.sell(book, 3)['cogs']), Decimal('36.00'))
+
+
+class ReorderSuggestionTests(BookAPITestCase):
+    def history(self, book, units, returned=0, days=90):
+        today = timezone.localdate()
+        DailySalesRollup.objects.bulk_create([
+            DailySalesRollup(
+                date=today - timedelta(days=offset), book=book, category=book.category,
+                units=units, revenue=units * book.price, returned_units=returned
+            )
+            for offset in range(1, days + 1)
+        ])
+
+    def test_forecast_covers_catalog_in_one_pass(self):
+        steady = self.create_book('9787000001100', '畅销', stock=10)
+        returned = self.create_book('9787000001101', '退货多', stock=100)
+        quiet = self.create_book('9787000001102', '无销量', stock=3)
+        stopped = self.create_book('9787000001103', '停售', stock=0, status='discontinued')
+        self.history(steady, 2)
+        self.history(returned, 3, returned=2)
+        self.history(stopped, 5)
+        ReorderPolicy.objects.create(book=quiet, reorder_point=5, lead_time_days=3)
+
+        # 图书、销售汇总、补货参数各一次查询，写入在一个事务中
+        with self.assertNumQueries(7):
+            result = forecast.run()
+        self.assertEqual((result['books'], result['suggestions'], result['reorder']), (3, 3, 2))
+
+        suggestion = ReorderSuggestion.objects.get(book=steady)
+        self.assertAlmostEqual(suggestion.velocity, 2)
+        self.assertAlmostEqual(suggestion.forecast, 2)
+        self.assertAlmostEqual(suggestion.days_of_cover, 5)
+        # 需求稳定时安全库存为 0：再订货点 2 x 7，建议补足 2 x (7 + 14) 天的需求
+        self.assertEqual((suggestion.safety_stock, suggestion.reorder_point, suggestion.suggested_quantity), (0, 14, 32))
+
+        suggestion = ReorderSuggestion.objects.get(book=returned)
+        self.assertAlmostEqual(suggestion.forecast, 1)
+        self.assertEqual(suggestion.suggested_quantity, 0)
+
+        suggestion = ReorderSuggestion.objects.get(book=quiet)
+        self.assertIsNone(suggestion.days_of_cover)
+        self.assertEqual((suggestion.reorder_point, suggestion.suggested_quantity), (5, 2))
+        self.assertFalse(ReorderSuggestion.objects.filter(book=stopped).exists())
+
+        # 再次运行整体替换
+        steady.stock = 50
+        steady.save()
+        forecast.run()
+        self.assertEqual(ReorderSuggestion.objects.get(book=steady).suggested_quantity, 0)
+
+    def test_smoothing_follows_recent_demand(self):
+        book = self.create_book('9787000001104', '升温', stock=0)
+        self.history(book, 4, days=10)
+        forecast.run()
+        suggestion = ReorderSuggestion.objects.get(book=book)
+        self.assertAlmostEqual(suggestion.velocity, 4 * 10 / 90, places=4)
+        self.assertGreater(suggestion.forecast, 3.8)
+
+    def test_list_and_create_draft_orders(self):
+        priced = self.create_book('9787000001105', '有进货价', stock=0, price='65.00')
+        new = self.create_book('9787000001106', '无进货价', stock=1, price='13.00')
+        enough = self.create_book('9787000001107', '库存充足', stock=500)
+        PurchaseOrder.objects.create(book=priced, purchase_price=Decimal('40.00'), quantity=1, created_by=self.user)
+        for book in (priced, new, enough):
+            self.history(book, 1)
+        forecast.run()
+
+        response = self.client.get('/api/books/reorder-suggestions/', {'needs_reorder': 'true'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([row['book'] for row in response.data['results']], [priced.id, new.id])
+        self.assertEqual(response.data['results'][0]['category_name'], '小说')
+
+        response = self.client.post('/api/books/reorder-suggestions/create_orders/', {}, format='json')
+        self.assertEqual(response.status_code, 201)
+        header = PurchaseOrderHeader.objects.get(pk=response.data['id'])
+        self.assertEqual(header.status, 'pending')
+        lines = {line.book_id: line for line in header.lines.all()}
+        self.assertEqual(set(lines), {priced.id, new.id})
+        self.assertEqual(lines[priced.id].purchase_price, Decimal('40.00'))
+        self.assertEqual(lines[new.id].purchase_price, Decimal('10.00'))
+        self.assertEqual(lines[new.id].quantity, ReorderSuggestion.objects.get(book=new).suggested_quantity)
+        self.assertEqual(lines[new.id].book_title, '无进货价')
+
+        suggestion = ReorderSuggestion.objects.get(book=enough)
+        response = self.client.post('/api/books/reorder-suggestions/create_orders/', {
+            'suggestions': [suggestion.id]
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_policies_and_command(self):
+        book = self.create_book('9787000001108', '参数', stock=2)
+        response = self.client.post('/api/books/reorder-policies/', {
+            'book': book.id, 'reorder_point': 4
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        out = io.StringIO()
+        call_command('forecast_reorders', stdout=out)
+        self.assertIn('1 本需要补货', out.getvalue())
+        self.assertEqual(ReorderSuggestion.objects.get(book=book).reorder_point, 4)
+
+        with mock.patch.object(forecast, '_numpy', side_effect=forecast.ForecastError('服务器未安装 numpy，无法计算补货建议')):
+            with self.assertRaisesMessage(CommandError, 'numpy'):
+                call_command('forecast_reorders', stdout=io.StringIO())
+
+
+class RebuildSalesRollupCommandTests(TransactionTestCase):
+    def test_rebuild_backfills_months_in_parallel(self):
+        user = User.objects.create_user('staff', 'staff@example.com', 'password123', role='staff')
+        book = Book.objects.create(
+            isbn='9787000000899', title='回填', author='作者', publisher='出版社',
+            price=Decimal('10.00'), stock=10,
+        )
+        for month in (1, 3):
+            sale = Sale.objects.create(book=book, quantity=month, sale_price=Decimal('10.00'), created_by=user)
+            Sale.objects.filter(pk=sale.pk).update(created_at=timezone.make_aware(datetime(2024, month, 15)))
+        DailySalesRollup.objects.create(date=parse_date('2024-02-10'), book=book, units=99)
+
+        output = io.StringIO()
+        call_command('rebuild_sales_rollup', '2024-01', '2024-02', '2024-03', '--workers', '3', stdout=output)
+        rows = DailySalesRollup.objects.order_by('date').values_list('date', 'units', 'revenue')
+        self.assertEqual(list(rows), [
+            (parse_date('2024-01-15'), 1, Decimal('10.00')),
+            (parse_date('2024-03-15'), 3, Decimal('30.00')),
+        ])
+
+
+class BenchmarkCheckoutCommandTests(BookAPITestCase):
+    def test_requires_confirmation_and_cleans_up(self):
+        from .management.commands.benchmark_checkout import Command
+
+        with self.assertRaises(CommandError):
+            call_command('benchmark_checkout', '--username', 'staff', '--password', 'x', stdout=io.StringIO())
+        self.assertFalse(Book.objects.exists())
+
+        def run_targets(command, books, options):
+            # 压测期间库存经过库存流水增加，并模拟一次结账
+            self.assertEqual(
+                sorted(StockMovement.objects.values_list('book_id', 'quantity')), [(book, 10 ** 9) for book in books]
+            )
+            self.client.post('/api/books/sales/create_batch/', {
+                'items': [{'book_id': book, 'quantity': 1} for book in books]
+            }, format='json')
+
+        Financial.objects.create(type='income', category='sale', amount=Decimal('20.00'), operator=self.user)
+        with mock.patch.object(Command, 'run_targets', run_targets):
+            call_command(
+                'benchmark_checkout', '--username', 'staff', '--password', 'x', '--items', '2',
+                '--confirm-writes', stdout=io.StringIO()
+            )
+        self.assertFalse(Book.objects.exists())
+        self.assertFalse(Sale.objects.exists())
+        self.assertFalse(StockMovement.objects.exists())
+        self.assertEqual(list(Financial.objects.values_list('amount', flat=True)), [Decimal('20.00')])
+
+
+class RebuildCostLotsCommandTests(TransactionTestCase):
+    def test_rebuild_replays_history_per_book(self):
+        user = User.objects.create_user('staff', 'staff@example.com', 'password123', role='staff')
+        client = APIClient()
+        client.force_authenticate(user)
+        books = [
+            Book.objects.create(
+                isbn=f'978700000099{number}', title=f'重放{number}', author='作者', publisher='出版社',
+                price=Decimal('50.00'), stock=0,
+            )
+            for number in range(3)
+        ]
+        for book in books:
+            for price in ('10.00', '20.00'):
+                order = PurchaseOrder.objects.create(book=book, purchase_price=Decimal(price), quantity=5, created_by=user)
+                client.post(f'/api/books/purchase-orders/{order.id}/pay/')
+        admin = APIClient()
+        admin.force_authenticate(User.objects.create_user('admin', 'admin@example.com', 'password123', is_staff=True))
+        # 旧版采购记录同样生成批次，重放时也要计入
+        response = admin.post('/api/purchases/purchases/', {
+            'book_id': books[0].id, 'purchaser_id': user.id, 'quantity': 3, 'price': '15.00', 'supplier': '供应商',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        sales = client.post('/api/books/sales/create_batch/', {
+            'items': [{'book_id': book.id, 'quantity': 7} for book in books]
+        }, format='json').data
+        client.post(f'/api/books/sales/{sales[0]["id"]}/return_sale/')
+        client.post('/api/books/sales/create_batch/', {'items': [{'book_id': books[0].id, 'quantity': 4}]}, format='json')
+
+        def state():
+            return (
+                list(Sale.objects.order_by('id').values_list('cogs', flat=True)),
+                sorted(CostLot.objects.values_list('book_id', 'source', 'remaining')),
+            )
+
+        live = state()
+        Sale.objects.update(cogs=None)
+        CostLot.objects.all().delete()
+        call_command('rebuild_cost_lots', '--chunk-size', '1', '--workers', '3', stdout=io.StringIO())
+        self.assertEqual(state(), live)
+        self.assertEqual(live[0], [Decimal('90.00')] * 3 + [Decimal('75.00')])
+
+
+class ConcurrentBookEditTests(BookAPITestCase):
+    def setUp(self):
+        super().setUp()
+        self.book = self.create_book('9787000001200', '并发', stock=10)
+        get_object = BookViewSet.get_object
+
+        def stale_get_object(view):
+            # 视图读出图书之后，另一个请求卖出了几本
+            book = get_object(view)
+            adjust_stock(book.id, -self.sold, 'sale')
+            return book
+
+        patcher = mock.patch.object(BookViewSet, 'get_object', stale_get_object)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_patch_keeps_concurrent_stock_change(self):
+        self.sold = 3
+        response = self.client.patch(f'/api/books/books/{self.book.id}/', {'title': '改名'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['stock'], 7)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.title, self.book.stock), ('改名', 7))
+
+    def test_patch_stock_is_relative_to_current_stock(self):
+        self.sold = 3
+        response = self.client.patch(f'/api/books/books/{self.book.id}/', {'stock': 20}, format='json')
+        self.assertEqual(response.data['stock'], 20)
+        self.assertEqual(
+            list(StockMovement.objects.filter(book=self.book).order_by('id').values_list('quantity', flat=True)),
+            [-3, 13]
+        )
+
+    def test_update_status_keeps_concurrent_stock_change(self):
+        self.sold = 4
+        response = self.client.post(f'/api/books/books/{self.book.id}/update_status/', {'status': 'discontinued'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['stock'], 6)
+        self.book.refresh_from_db()
+        self.assertEqual((self.book.status, self.book.stock), ('discontinued', 6))
+
+
+class StockLedgerTests(BookAPITestCase):
+    def move(self, book, delta, when):
+        with mock.patch('books.stock.timezone.now', return_value=when):
+            self.assertTrue(adjust_stock(book.id, delta))
+
+    def test_every_stock_change_is_recorded(self):
+        book = self.create_book('9787000000511', '流水', stock=5, status='in_stock')
+        self.client.post(f'/api/books/books/{book.id}/update_stock/', {'stock_change': 3}, format='json')
+        response = self.client.post('/api/books/sales/create_batch/', {
+            'items': [{'book_id': book.id, 'quantity': 2}]
+        }, format='json')
+        sale_id = response.data[0]['id']
+        self.client.post(f'/api/books/sales/{sale_id}/return_sale/')
+        self.client.patch(f'/api/books/books/{book.id}/', {'stock': 1}, format='json')
+
+        movements = list(StockMovement.objects.filter(book=book).order_by('id').values_list('reason', 'quantity', 'reference_id'))
+        self.assertEqual(movements, [
+            ('adjustment', 3, None), ('sale', -2, sale_id), ('sale_return', 2, sale_id), ('adjustment', -7, None),
+        ])
+        book.refresh_from_db()
+        self.assertEqual(book.stock, 1)
+        self.assertEqual(StockCheckpoint.objects.get(book=book).stock, 5)
+        with self.assertRaises(ValueError):
+            StockMovement.objects.first().save()
+
+    def test_as_of_uses_checkpoint_and_movements(self):
+        book = self.create_book('9787000000512', '时点', stock=10)
+        start = book.created_at
+        self.move(book, -3, start + timedelta(days=1))
+        self.move(book, 5, start + timedelta(days=2))
+        self.assertEqual(create_checkpoints(start + timedelta(days=2, hours=1)), 1)
+        self.move(book, -4, start + timedelta(days=3))
+
+        def stock_as_of(moment):
+            response = self.client.get(f'/api/books/books/{book.id}/', {'as_of': moment.isoformat()})
+            self.assertEqual(response.status_code, 200)
+            return response.data['stock_as_of']
+
+        self.assertEqual(stock_as_of(start), 10)
+        self.assertEqual(stock_as_of(start + timedelta(days=1, hours=1)), 7)
+        self.assertEqual(stock_as_of(start + timedelta(days=2, hours=2)), 12)
+        self.assertEqual(stock_as_of(start + timedelta(days=4)), 8)
+
+        response = self.client.get('/api/books/books/', {'as_of': (start - timedelta(days=1)).date().isoformat()})
+        self.assertEqual(response.data['results'], [])
+        response = self.client.get('/api/books/books/', {'as_of': 'yesterday'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_checkpoints_only_cover_books_with_movements(self):
+        moved = self.create_book('9787000000513', '有变化', stock=4)
+        self.create_book('9787000000514', '无变化', stock=4)
+        self.move(moved, -1, moved.created_at + timedelta(minutes=1))
+        cutoff = moved.created_at + timedelta(hours=1)
+        self.assertEqual(create_checkpoints(cutoff), 1)
+        self.assertEqual(StockCheckpoint.objects.get(book=moved, taken_at=cutoff).stock, 3)
+        self.assertEqual(create_checkpoints(cutoff + timedelta(hours=1)), 0)
+
+
+class ConcurrentStockTests(TransactionTestCase):
+    THREADS = 8
+    ATTEMPTS = 25
+
+    def run_threads(self, target):
+        errors = []
+
+        def worker():
+            try:
+                target()
+            except Exception as exc:
+                errors.append(exc)
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(self.THREADS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def retry(self, operation):
+        # SQLite 只允许一个写入者，被锁住时重试；其他数据库上不会进入该分支
+        while True:
+            try:
+                return operation()
+            except OperationalError:
+                time.sleep(0.001)
+
+    def test_no_lost_updates_and_never_negative(self):
+        category = Category.objects.create(name='并发')
+        book = Book.objects.create(
+            isbn='9787000000599', title='并发', author='作者', publisher='出版社',
+            category=category, price=Decimal('10.00'), stock=100,
+        )
+        sold = []
+        lock = threading.Lock()
+
+        def till():
+            for _ in range(self.ATTEMPTS):
+                if self.retry(lambda: adjust_stock(book.id, -1)):
+                    with lock:
+                        sold.append(1)
+                stock = self.retry(lambda: Book.objects.values_list('stock', flat=True).get(pk=book.id))
+                self.assertGreaterEqual(stock, 0)
+
+        def restock():
+            for _ in range(self.ATTEMPTS):
+                self.retry(lambda: adjust_stock(book.id, 1))
+
+        self.run_threads(till)
+        book.refresh_from_db()
+        # 8 个线程共尝试售出 200 本，只有库存中的 100 本能成功
+        self.assertEqual(len(sold), 100)
+        self.assertEqual((book.stock, book.status), (0, 'out_of_stock'))
+
+        self.run_threads(restock)
+        book.refresh_from_db()
+        self.assertEqual(book.stock, self.THREADS * self.ATTEMPTS)
+        self.assertEqual(book.status, 'in_stock')
@@ -1,13 +1,23 @@
 from django.urls import path, include
 from rest_framework.routers import DefaultRouter
-from .views import BookViewSet, CategoryViewSet, PurchaseOrderViewSet, SaleViewSet
+from .views import (
+    BookViewSet, CategoryViewSet, PurchaseOrderHeaderViewSet, PurchaseOrderViewSet,
+    ReorderPolicyViewSet, ReorderSuggestionViewSet, SaleViewSet
+)
+from . import async_views
 
 router = DefaultRouter()
 router.register(r'books', BookViewSet)
 router.register(r'categories', CategoryViewSet)
 router.register(r'purchase-orders', PurchaseOrderViewSet)
+router.register(r'purchase-order-headers', PurchaseOrderHeaderViewSet)
+router.register(r'reorder-policies', ReorderPolicyViewSet)
+router.register(r'reorder-suggestions', ReorderSuggestionViewSet)
 router.register(r'sales', SaleViewSet)
 
 urlpatterns = [
+    # 收银台异步接口，部署在 ASGI 下时不占用工作线程
+    path('pos/lookup/', async_views.lookup, name='pos-lookup'),
+    path('pos/checkout/', async_views.checkout, name='pos-checkout'),
     path('', include(router.urls)),
 ] 
\ No newline at end of file
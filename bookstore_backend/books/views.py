@@ -1,46 +1,84 @@
 from django.shortcuts import render
+from django.http import StreamingHttpResponse
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import Book, Category, PurchaseOrder, Sale
+from bookstore_backend.conditional import ConditionalRequestMixin
+from bookstore_backend.idempotency import IdempotentActionMixin
+from accounts.models import User
+from bookstore_backend.mixins import OptimizedQuerySetMixin
+from .models import (
+    Book, Category, DailySalesRollup, PurchaseOrder, PurchaseOrderHeader, ReorderPolicy, ReorderSuggestion, Sale
+)
 from .serializers import (
     BookSerializer, CategorySerializer,
-    PurchaseOrderSerializer, NewBookPurchaseOrderSerializer,
-    SaleSerializer
+    PurchaseOrderSerializer, PurchaseOrderHeaderSerializer, NewBookPurchaseOrderSerializer,
+    SaleSerializer, ReorderPolicySerializer, ReorderSuggestionSerializer
 )
-from financials.models import Financial
 from rest_framework.permissions import IsAuthenticated
 from .permissions import IsAdminOrReadOnly
-from django.db import models
-from django.db.models import Q
+from django.db import models, transaction
+from django.db.models import Q, Sum
+from django.db.models.functions import TruncDay, TruncMonth, TruncWeek
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from datetime import datetime, time
+from rest_framework.exceptions import ParseError
 from accounts.permissions import IsStaffOrManagerOrAdmin
 from decimal import Decimal
+from . import search as search_index
+from . import export
+from .importer import ImportFormatError, import_catalog
+from .manifest import ManifestError, import_manifest
+from rest_framework.parsers import MultiPartParser
+from .suggest import index as suggest_index
+from .scan import cache as scan_cache, split_isbns, MAX_LOOKUP_ISBNS
+from .stock import adjust_stock, with_stock_as_of
+from .checkout import CheckoutError, checkout, return_sales
+from .purchasing import (
+    PAY_ERROR, RETAIL_MARKUP, SHELVE_ERROR, PurchaseError, collect_order_ids, parse_retail_prices,
+    partition_orders, pay_orders, shelve_orders
+)
+from .sync import sync_stream
+from .forecast import create_draft_orders
+from .leaderboard import WINDOWS as LEADERBOARD_WINDOWS, leaderboard
 
 # Create your views here.
 
-class CategoryViewSet(viewsets.ModelViewSet):
+class CategoryViewSet(ConditionalRequestMixin, OptimizedQuerySetMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
     permission_classes = [IsStaffOrManagerOrAdmin]
+    keyset_ordering = ('name', 'id')
 
     def get_queryset(self):
         return Category.objects.all().order_by('name')
 
-class BookViewSet(viewsets.ModelViewSet):
+class BookViewSet(IdempotentActionMixin, ConditionalRequestMixin, OptimizedQuerySetMixin, viewsets.ModelViewSet):
     queryset = Book.objects.all()
     serializer_class = BookSerializer
     permission_classes = [IsStaffOrManagerOrAdmin]
+    etag_dependencies = (Category,)
+    keyset_ordering = ('title', 'id')
+    # POST 查询只读，不需要幂等键
+    idempotency_exempt_actions = ('lookup',)
 
     def get_queryset(self):
         queryset = Book.objects.all()
         category = self.request.query_params.get('category', None)
         search = self.request.query_params.get('search', None)
+        search_mode = self.request.query_params.get('search_mode', None)
         status = self.request.query_params.get('status', None)
 
         if category:
             queryset = queryset.filter(category=category)
         if status:
             queryset = queryset.filter(status=status)
+        if search and search_mode == 'fts':
+            # 使用全文索引检索并按相关度排序，过短的关键词回退到模糊匹配
+            ranked = search_index.search_books(queryset, search)
+            if ranked is not None:
+                return ranked
         if search:
             queryset = queryset.filter(
                 Q(title__icontains=search) |
@@ -50,6 +88,117 @@ class BookViewSet(viewsets.ModelViewSet):
             )
         return queryset.order_by('title')
 
+    def get_as_of(self):
+        # ?as_of= 接受日期时间或日期，只有日期时取当天结束时的库存
+        value = self.request.query_params.get('as_of')
+        if not value or self.action not in ('list', 'retrieve'):
+            return None
+        try:
+            moment = parse_datetime(value)
+            if moment is None:
+                day = parse_date(value)
+                moment = datetime.combine(day, time.max) if day else None
+        except ValueError:
+            moment = None
+        if moment is None:
+            raise ParseError('as_of 格式错误，应为日期或日期时间')
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        moment = self.get_as_of()
+        if moment is not None:
+            # 只包含当时已经存在的图书，stock_as_of 由库存快照加流水计算
+            queryset = with_stock_as_of(queryset.filter(created_at__lte=moment), moment)
+        return queryset
+
+    def perform_update(self, serializer):
+        # 库存的修改通过条件更新完成并记录流水，其余字段只写入提交的列
+        stock = serializer.validated_data.pop('stock', None)
+        book = serializer.save()
+        book.refresh_from_db(fields=['stock', 'status', 'updated_at'])
+        if stock is not None and stock != book.stock:
+            adjust_stock(book.id, stock - book.stock, operator=self.request.user)
+            book.refresh_from_db(fields=['stock', 'status', 'updated_at'])
+
+    @action(detail=False, methods=['get'])
+    def suggest(self, request):
+        query = request.query_params.get('q', '')
+        try:
+            limit = max(min(int(request.query_params.get('limit', 10)), 50), 1)
+        except ValueError:
+            return Response(
+                {'error': 'limit必须是整数'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(suggest_index.suggest(query, limit))
+
+    @action(detail=False, methods=['get'])
+    def export(self, request):
+        # ?format 被 DRF 用于内容协商，这里使用 export_format
+        export_format = request.query_params.get('export_format', 'csv')
+        if export_format not in export.FORMATS:
+            return Response(
+                {'error': '导出格式只支持 csv 或 ndjson'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        content_type, extension = export.FORMATS[export_format]
+        response = StreamingHttpResponse(
+            export.stream(self.get_queryset(), export_format),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = f'attachment; filename="books.{extension}"'
+        return response
+
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser])
+    def import_catalog(self, request):
+        file = request.FILES.get('file')
+        if file is None:
+            return Response(
+                {'error': '请上传 CSV 或 XLSX 文件'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            report = import_catalog(file, file.name)
+        except (ImportFormatError, UnicodeDecodeError) as exc:
+            return Response(
+                {'error': str(exc)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(report)
+
+    @action(detail=False, methods=['get', 'post'])
+    def lookup(self, request):
+        # 扫码查询：GET ?isbn=a,b 或 POST {"isbns": [...]}
+        if request.method == 'POST':
+            values = request.data.get('isbns', [])
+            if not isinstance(values, list):
+                values = [values]
+        else:
+            values = [value for value in request.query_params.get('isbn', '').split(',') if value]
+
+        if not values:
+            return Response(
+                {'error': 'ISBN不能为空'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(values) > MAX_LOOKUP_ISBNS:
+            return Response(
+                {'error': f'单次最多查询 {MAX_LOOKUP_ISBNS} 个ISBN'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        isbns, invalid = split_isbns(values)
+        found = scan_cache.lookup(isbns)
+        return Response({
+            'results': [found[isbn] for isbn in isbns if isbn in found],
+            'not_found': [isbn for isbn in isbns if isbn not in found],
+            'invalid': invalid
+        })
+
     @action(detail=True, methods=['post'])
     def update_stock(self, request, pk=None):
         book = self.get_object()
@@ -63,21 +212,14 @@ class BookViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        new_stock = book.stock + stock_change
-        if new_stock < 0:
+        # 库存和状态在一条条件 UPDATE 中更新，并发修改不会丢失
+        if not adjust_stock(book.id, stock_change, operator=request.user):
             return Response(
                 {'error': '库存不能为负数'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        book.refresh_from_db()
 
-        book.stock = new_stock
-        # 根据库存更新状态
-        if new_stock > 0:
-            book.status = 'in_stock'
-        else:
-            book.status = 'out_of_stock'
-        book.save()
-        
         serializer = self.get_serializer(book)
         return Response(serializer.data)
 
@@ -92,36 +234,53 @@ class BookViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
+        # 只写状态列，不把内存中的库存写回
         book.status = new_status
-        book.save()
-        
+        book.save(update_fields=['status', 'updated_at'])
+        book.refresh_from_db(fields=['stock'])
+
         serializer = self.get_serializer(book)
         return Response(serializer.data)
 
-class PurchaseOrderViewSet(viewsets.ModelViewSet):
+class PurchaseOrderViewSet(IdempotentActionMixin, ConditionalRequestMixin, OptimizedQuerySetMixin, viewsets.ModelViewSet):
     queryset = PurchaseOrder.objects.all()
     serializer_class = PurchaseOrderSerializer
     permission_classes = [IsAuthenticated]
+    etag_dependencies = (Book, User)
+    keyset_ordering = ('-created_at', '-id')
 
     def get_queryset(self):
         queryset = PurchaseOrder.objects.all()
         status = self.request.query_params.get('status', None)
         search = self.request.query_params.get('search', None)
+        search_mode = self.request.query_params.get('search_mode', None)
 
         if status:
             queryset = queryset.filter(status=status)
+        if search and search_mode == 'fts':
+            filtered = search_index.filter_by_snapshot(queryset, search)
+            if filtered is not None:
+                return filtered.order_by('-created_at')
         if search:
+            # 只查询订单表上的图书快照列
             queryset = queryset.filter(
-                models.Q(book__title__icontains=search) |
-                models.Q(book__author__icontains=search) |
-                models.Q(book__publisher__icontains=search) |
-                models.Q(book__isbn__icontains=search)
+                models.Q(book_title__icontains=search) |
+                models.Q(book_author__icontains=search) |
+                models.Q(book_publisher__icontains=search) |
+                models.Q(book_isbn__icontains=search)
             )
-        return queryset
+        return queryset.order_by('-created_at')
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
+    def header_error(self, order):
+        # 属于进货单的订单只能随整张进货单付款、上架或退货
+        return Response(
+            {'error': f'该订单属于进货单 {order.header_id}，请对整张进货单操作'},
+            status=status.HTTP_400_BAD_REQUEST
+        )
+
     @action(detail=True, methods=['post'])
     def pay(self, request, pk=None):
         order = self.get_object()
@@ -131,24 +290,20 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        order.status = 'paid'
-        order.save()
+        if order.header_id:
+            return self.header_error(order)
 
-        # 更新图书库存
-        book = order.book
-        book.stock += order.quantity
-        if book.stock > 0:
-            book.status = 'in_stock'
-        book.save()
-        
-        total_amount = order.purchase_price * order.quantity
-        Financial.objects.create(
-            type='expense',
-            category='purchase',
-            amount=total_amount,
-            description=f'进货图书 《{order.book.title}》 {order.quantity} 本',
-            operator=self.request.user
-        )
+        try:
+            with transaction.atomic():
+                pay_orders(
+                    [order], request.user,
+                    description=f'进货图书 《{order.book.title}》 {order.quantity} 本'
+                )
+        except PurchaseError as exc:
+            return Response(
+                {'error': str(exc)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
         return Response({
             'message': '付款成功',
@@ -163,6 +318,8 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet):
                 {'error': '只有未付款的订单才能进行退货'},
                 status=status.HTTP_400_BAD_REQUEST
             )
+        if order.header_id:
+            return self.header_error(order)
 
         order.status = 'returned'
         order.save()
@@ -180,8 +337,11 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet):
                 {'error': '只有已付款的订单才能上架'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-        
+        if order.header_id:
+            return self.header_error(order)
+
         book = order.book
+        retail_prices = {}
         # 如果图书库存为0，说明是新书，需要设置零售价格
         if book.stock == 0:
             retail_price = request.data.get('retail_price')
@@ -194,15 +354,18 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet):
                     {'error': '零售价格必须为正数'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-            book.price = retail_price
+            retail_prices[book.id] = retail_price
 
-        book.stock += order.quantity
-        book.status = 'in_stock'
-        book.save()
-
-        # 标记订单为已上架
-        order.status = 'shelved'
-        order.save()
+        try:
+            with transaction.atomic():
+                # 标记订单为已上架并增加库存
+                shelve_orders([order], request.user, retail_prices)
+        except PurchaseError as exc:
+            return Response(
+                {'error': str(exc)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        book.refresh_from_db()
 
         return Response({
             'message': '上架成功',
@@ -210,6 +373,50 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet):
             'order_status': order.status
         })
 
+    def batch_results(self, ids, orders, errors):
+        # 按请求中的顺序返回每个订单的结果
+        done = {order.id: order.status for order in orders}
+        return Response({
+            'results': [
+                {'id': order_id, 'status': done[order_id]} if order_id in done
+                else {'id': order_id, 'error': errors[order_id]}
+                for order_id in ids
+            ]
+        })
+
+    @action(detail=False, methods=['post'])
+    def pay_batch(self, request):
+        # {"orders": [订单ID, ...]}，不能付款的订单单独报告，其余在一个事务中付款
+        try:
+            ids = collect_order_ids(request.data.get('orders'))
+            orders, errors = partition_orders(ids, 'pending', PAY_ERROR)
+            if orders:
+                with transaction.atomic():
+                    pay_orders(orders, request.user, description=f'批量付款：进货订单 {len(orders)} 笔')
+        except PurchaseError as exc:
+            return Response(
+                {'error': str(exc)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return self.batch_results(ids, orders, errors)
+
+    @action(detail=False, methods=['post'])
+    def shelve_batch(self, request):
+        # {"orders": [...], "retail_prices": {图书ID: 零售价}}，库存为 0 的新书需要给出零售价格
+        try:
+            ids = collect_order_ids(request.data.get('orders'))
+            retail_prices = parse_retail_prices(request.data.get('retail_prices'))
+            orders, errors = partition_orders(ids, 'paid', SHELVE_ERROR, retail_prices)
+            if orders:
+                with transaction.atomic():
+                    shelve_orders(orders, request.user, retail_prices)
+        except PurchaseError as exc:
+            return Response(
+                {'error': str(exc)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return self.batch_results(ids, orders, errors)
+
     @action(detail=False, methods=['post'])
     def create_with_new_book(self, request):
         serializer = NewBookPurchaseOrderSerializer(data=request.data)
@@ -224,7 +431,7 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet):
             'publisher': serializer.validated_data['publisher'],
             'category': serializer.validated_data['category'],
             'description': serializer.validated_data.get('description', ''),
-            'price': serializer.validated_data['purchase_price'] * Decimal('1.3'),  # 设置销售价格为进货价格的1.3倍
+            'price': serializer.validated_data['purchase_price'] * RETAIL_MARKUP,  # 设置销售价格为进货价格的1.3倍
             'stock': 0,
             'status': 'out_of_stock'
         }
@@ -244,88 +451,364 @@ class PurchaseOrderViewSet(viewsets.ModelViewSet):
             status=status.HTTP_201_CREATED
         )
 
-class SaleViewSet(viewsets.ModelViewSet):
+class PurchaseOrderHeaderViewSet(IdempotentActionMixin, ConditionalRequestMixin, OptimizedQuerySetMixin, viewsets.ModelViewSet):
+    queryset = PurchaseOrderHeader.objects.all()
+    serializer_class = PurchaseOrderHeaderSerializer
+    permission_classes = [IsAuthenticated]
+    etag_dependencies = (PurchaseOrder, Book, User)
+    keyset_ordering = ('-created_at', '-id')
+    # 订单行在创建时写入，之后只能通过付款、上架、退货改变
+    http_method_names = ['get', 'post', 'delete', 'head', 'options']
+
+    def get_queryset(self):
+        queryset = PurchaseOrderHeader.objects.prefetch_related(
+            models.Prefetch('lines', queryset=PurchaseOrder.objects.select_related('book', 'created_by').order_by('id'))
+        )
+        status = self.request.query_params.get('status', None)
+        if status:
+            queryset = queryset.filter(status=status)
+        return queryset.order_by('-created_at')
+
+    def perform_create(self, serializer):
+        serializer.save(created_by=self.request.user)
+
+    def get_lines(self, header):
+        return list(header.lines.select_related('book').order_by('id'))
+
+    def transition(self, header, source, target, error):
+        # 进货单和订单行在同一事务中按原状态条件更新
+        updated = PurchaseOrderHeader.objects.filter(pk=header.pk, status=source).update(
+            status=target, updated_at=timezone.now()
+        )
+        if not updated:
+            raise PurchaseError(error)
+        header.status = target
+
+    @action(detail=True, methods=['post'])
+    def pay(self, request, pk=None):
+        header = self.get_object()
+        lines = self.get_lines(header)
+        try:
+            with transaction.atomic():
+                self.transition(header, 'pending', 'paid', '只有未付款的进货单才能进行付款')
+                pay_orders(
+                    lines, request.user,
+                    description=f'进货单 {header.id}：进货图书 {len(lines)} 行 {sum(line.quantity for line in lines)} 本',
+                    source=header
+                )
+        except PurchaseError as exc:
+            return Response(
+                {'error': str(exc)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response({
+            'message': '付款成功',
+            'status': header.status
+        })
+
+    @action(detail=True, methods=['post'])
+    def shelve(self, request, pk=None):
+        # 新书（库存为 0）的零售价格以 {"retail_prices": {图书ID: 价格}} 给出
+        header = self.get_object()
+        lines = self.get_lines(header)
+        try:
+            retail_prices = parse_retail_prices(request.data.get('retail_prices'))
+            with transaction.atomic():
+                self.transition(header, 'paid', 'shelved', '只有已付款的进货单才能上架')
+                book_ids = shelve_orders(lines, request.user, retail_prices)
+        except PurchaseError as exc:
+            return Response(
+                {'error': str(exc)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        books = Book.objects.select_related('category').filter(pk__in=book_ids).order_by('id')
+        return Response({
+            'message': '上架成功',
+            'books': BookSerializer(books, many=True).data,
+            'order_status': header.status
+        })
+
+    @action(detail=False, methods=['post'], parser_classes=[MultiPartParser])
+    def import_manifest(self, request):
+        # 上传供应商到货清单，整张清单建成一张进货单
+        file = request.FILES.get('file')
+        if file is None:
+            return Response(
+                {'error': '请上传 CSV 或 XLSX 文件'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            report = import_manifest(
+                file, file.name,
+                supplier=request.data.get('supplier', '')[:100],
+                note=request.data.get('note', ''),
+                operator=request.user
+            )
+        except ManifestError as exc:
+            return Response(
+                {'error': str(exc), 'errors': exc.errors},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        except (ImportFormatError, UnicodeDecodeError) as exc:
+            return Response(
+                {'error': str(exc)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return Response(report, status=status.HTTP_201_CREATED)
+
+    @action(detail=True, methods=['post'])
+    def return_order(self, request, pk=None):
+        header = self.get_object()
+        with transaction.atomic():
+            updated = PurchaseOrderHeader.objects.filter(pk=header.pk, status='pending').update(
+                status='returned', updated_at=timezone.now()
+            )
+            if not updated:
+                return Response(
+                    {'error': '只有未付款的进货单才能进行退货'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            header.status = 'returned'
+            header.lines.filter(status='pending').update(status='returned', updated_at=timezone.now())
+
+        return Response({
+            'message': '退货成功',
+            'status': header.status
+        })
+
+class ReorderPolicyViewSet(ConditionalRequestMixin, OptimizedQuerySetMixin, viewsets.ModelViewSet):
+    queryset = ReorderPolicy.objects.all()
+    serializer_class = ReorderPolicySerializer
+    permission_classes = [IsStaffOrManagerOrAdmin]
+    etag_dependencies = (Book,)
+    keyset_ordering = ('id',)
+
+    def get_queryset(self):
+        return ReorderPolicy.objects.order_by('id')
+
+class ReorderSuggestionViewSet(IdempotentActionMixin, ConditionalRequestMixin, OptimizedQuerySetMixin, viewsets.ReadOnlyModelViewSet):
+    # 补货建议由 forecast_reorders 命令批量生成，接口只读
+    queryset = ReorderSuggestion.objects.all()
+    serializer_class = ReorderSuggestionSerializer
+    permission_classes = [IsStaffOrManagerOrAdmin]
+    etag_dependencies = (Book, Category)
+    # 可售天数可能为空，游标分页改按建议数量排序
+    keyset_ordering = ('-suggested_quantity', 'id')
+
+    def get_queryset(self):
+        queryset = ReorderSuggestion.objects.all()
+        category = self.request.query_params.get('category', None)
+        if category:
+            queryset = queryset.filter(book__category_id=category)
+        if self.request.query_params.get('needs_reorder') in ('1', 'true'):
+            queryset = queryset.filter(suggested_quantity__gt=0)
+        # 可售天数最少的排在前面，没有销量的排在最后
+        return queryset.order_by(models.F('days_of_cover').asc(nulls_last=True), 'id')
+
+    @action(detail=False, methods=['post'])
+    def create_orders(self, request):
+        # {"suggestions": [建议ID]} 生成一张未付款的进货单，不传时包含全部需要补货的建议
+        suggestion_ids = request.data.get('suggestions')
+        queryset = self.get_queryset().filter(suggested_quantity__gt=0)
+        if suggestion_ids is not None:
+            if not isinstance(suggestion_ids, list):
+                return Response(
+                    {'error': '建议列表格式错误'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+            try:
+                queryset = queryset.filter(pk__in=[int(suggestion_id) for suggestion_id in suggestion_ids])
+            except (TypeError, ValueError):
+                return Response(
+                    {'error': '建议列表格式错误'},
+                    status=status.HTTP_400_BAD_REQUEST
+                )
+
+        header = create_draft_orders(list(queryset), request.user)
+        if header is None:
+            return Response(
+                {'error': '没有需要补货的图书'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        header = PurchaseOrderHeader.objects.prefetch_related(
+            models.Prefetch('lines', queryset=PurchaseOrder.objects.select_related('book', 'created_by').order_by('id'))
+        ).get(pk=header.pk)
+        return Response(
+            PurchaseOrderHeaderSerializer(header).data,
+            status=status.HTTP_201_CREATED
+        )
+
+class SaleViewSet(IdempotentActionMixin, ConditionalRequestMixin, OptimizedQuerySetMixin, viewsets.ModelViewSet):
     queryset = Sale.objects.all()
     serializer_class = SaleSerializer
     permission_classes = [IsStaffOrManagerOrAdmin]
+    etag_dependencies = (User,)
+    etag_action_models = {'rollup': (DailySalesRollup,)}
+    keyset_ordering = ('-created_at', '-id')
+    rollup_periods = {'day': TruncDay, 'week': TruncWeek, 'month': TruncMonth}
+    # 离线同步按 client_id 去重，不需要幂等键
+    idempotency_exempt_actions = ('sync',)
 
     def get_queryset(self):
         queryset = Sale.objects.all()
         search = self.request.query_params.get('search', None)
+        search_mode = self.request.query_params.get('search_mode', None)
 
+        if search and search_mode == 'fts':
+            filtered = search_index.filter_by_snapshot(queryset, search)
+            if filtered is not None:
+                return filtered.order_by('-created_at')
         if search:
+            # 只查询销售表上的图书快照列
             queryset = queryset.filter(
-                Q(book__title__icontains=search) |
-                Q(book__author__icontains=search) |
-                Q(book__publisher__icontains=search) |
-                Q(book__isbn__icontains=search)
+                Q(book_title__icontains=search) |
+                Q(book_author__icontains=search) |
+                Q(book_publisher__icontains=search) |
+                Q(book_isbn__icontains=search)
             )
         return queryset.order_by('-created_at')
 
     def perform_create(self, serializer):
         serializer.save(created_by=self.request.user)
 
-    @action(detail=False, methods=['post'])
-    def create_batch(self, request):
-        items = request.data.get('items', [])
-        if not items:
+    @action(detail=False, methods=['get'])
+    def rollup(self, request):
+        # 只读取每日销售汇总表，按天、周（周一开始）或月合并
+        granularity = request.query_params.get('granularity', 'day')
+        if granularity not in self.rollup_periods:
             return Response(
-                {'error': '销售项目不能为空'},
+                {'error': 'granularity 必须是 day、week 或 month'},
                 status=status.HTTP_400_BAD_REQUEST
             )
-
-        sales = []
-        total_amount = 0
-        for item in items:
+        queryset = DailySalesRollup.objects.all()
+        for param, lookup in (('start', 'date__gte'), ('end', 'date__lte')):
+            value = request.query_params.get(param)
+            if not value:
+                continue
             try:
-                book = Book.objects.get(id=item['book_id'])
-                if book.status != 'in_stock':
-                    return Response(
-                        {'error': f'图书 {book.title} 不在销售状态'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                if book.stock < item['quantity']:
-                    return Response(
-                        {'error': f'图书 {book.title} 库存不足'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
-                # 创建销售记录，使用图书的零售价
-                sale = Sale.objects.create(
-                    book=book,
-                    quantity=item['quantity'],
-                    sale_price=book.price,  # 使用图书的零售价
-                    created_by=request.user
+                day = parse_date(value)
+            except ValueError:
+                day = None
+            if day is None:
+                return Response(
+                    {'error': f'{param} 日期格式错误'},
+                    status=status.HTTP_400_BAD_REQUEST
                 )
-                sales.append(sale)
-                total_amount += book.price * item['quantity']
-
-                # 更新库存
-                book.stock -= item['quantity']
-                if book.stock == 0:
-                    book.status = 'out_of_stock'
-                book.save()
-
-            except Book.DoesNotExist:
+            queryset = queryset.filter(**{lookup: day})
+        for param in ('book', 'category'):
+            value = request.query_params.get(param)
+            if not value:
+                continue
+            try:
+                value = int(value)
+            except ValueError:
                 return Response(
-                    {'error': f'图书ID {item["book_id"]} 不存在'},
+                    {'error': f'{param} 必须是整数'},
                     status=status.HTTP_400_BAD_REQUEST
                 )
-        
-        # 创建销售记录
-        Financial.objects.create(
-            type='income',
-            category='sale',
-            amount=total_amount,
-            description=f'销售图书 {len(sales)} 本',
-            operator=request.user
+            queryset = queryset.filter(**{param: value})
+
+        rows = (
+            queryset.annotate(period=self.rollup_periods[granularity]('date'))
+            .values('period')
+            .annotate(
+                units=Sum('units'),
+                revenue=Sum('revenue'),
+                returned_units=Sum('returned_units'),
+                returned_revenue=Sum('returned_revenue'),
+            )
+            .order_by('period')
         )
+        return Response(list(rows))
+
+    @action(detail=False, methods=['get'])
+    def top(self, request):
+        # 畅销榜由内存中的滚动窗口计数提供，不查询销售记录
+        window = request.query_params.get('window', '7d')
+        if window not in LEADERBOARD_WINDOWS:
+            return Response(
+                {'error': 'window 必须是 1d、7d 或 30d'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        try:
+            category = request.query_params.get('category') or None
+            category = int(category) if category is not None else None
+            limit = min(max(int(request.query_params.get('limit', 10)), 1), 100)
+        except ValueError:
+            return Response(
+                {'error': 'category 和 limit 必须是整数'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        ranking = leaderboard.top(window, category, limit)
+        books = Book.objects.only('id', 'title', 'author', 'isbn').in_bulk([book_id for book_id, _ in ranking])
+        return Response([
+            {
+                'id': book_id,
+                'title': books[book_id].title,
+                'author': books[book_id].author,
+                'isbn': books[book_id].isbn,
+                'units': units,
+            }
+            for book_id, units in ranking if book_id in books
+        ])
+
+    def build_sale(self, book, quantity):
+        # 创建销售记录，使用图书的零售价
+        return Sale(
+            book=book,
+            quantity=quantity,
+            sale_price=book.price,
+            created_by=self.request.user,
+            **Sale.snapshot_fields(book)
+        )
+
+    @action(detail=False, methods=['post'])
+    def create_batch(self, request):
+        try:
+            sales = checkout(request.data.get('items', []), request.user, Sale, self.build_sale)
+        except CheckoutError as exc:
+            return Response(
+                {'error': str(exc)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
         return Response(
             SaleSerializer(sales, many=True).data,
             status=status.HTTP_201_CREATED
         )
 
+    @action(detail=False, methods=['post'])
+    def return_batch(self, request):
+        # 整单退货：{"sales": [销售记录ID, ...]}，任何一笔不能退货时整单不处理
+        try:
+            sales = return_sales(request.data.get('sales'), request.user)
+        except CheckoutError as exc:
+            return Response(
+                {'error': str(exc)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        return Response({
+            'message': '退货成功',
+            'sales': SaleSerializer(sales, many=True).data
+        })
+
+    @action(detail=False, methods=['post'])
+    def sync(self, request):
+        # 请求体为 NDJSON，每行一张离线小票；逐行读取，按块写入并流式返回每行的结果
+        if request.stream is None:
+            return Response(
+                {'error': '请求体不能为空'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        return StreamingHttpResponse(
+            sync_stream(request.stream, request.user),
+            content_type='application/x-ndjson'
+        )
+
     @action(detail=True, methods=['post'])
     def return_sale(self, request, pk=None):
         sale = self.get_object()
@@ -335,16 +818,14 @@ class SaleViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        # 更新销售状态
-        sale.status = 'returned'
-        sale.save()
-
-        # 恢复库存
-        book = sale.book
-        book.stock += sale.quantity
-        if book.stock > 0:
-            book.status = 'in_stock'
-        book.save()
+        # 与整单退货走同一流程，恢复库存和成本批次并记一笔退款
+        try:
+            sale, = return_sales([sale.id], request.user)
+        except CheckoutError as exc:
+            return Response(
+                {'error': str(exc)},
+                status=status.HTTP_400_BAD_REQUEST
+            )
 
         return Response({
             'message': '退货成功',
@@ -0,0 +1,138 @@
+import hashlib
+from django.db.models import Count, Max
+from django.utils.http import http_date, parse_http_date_safe, quote_etag
+from rest_framework import permissions, status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = '资源已被修改，请刷新后重试'
+    default_code = 'precondition_failed'
+
+
+class NotModified(Exception):
+    pass
+
+
+def queryset_version(queryset):
+    """用一次聚合查询得到查询集的版本：行数、最大主键和最后更新时间"""
+    model = queryset.model
+    aggregates = {'count': Count('pk'), 'max_pk': Max('pk')}
+    if any(field.name == 'updated_at' for field in model._meta.concrete_fields):
+        aggregates['updated_at'] = Max('updated_at')
+    return (model._meta.label, *queryset.order_by().aggregate(**aggregates).values())
+
+
+def model_version(model):
+    return queryset_version(model._default_manager.all())
+
+
+def make_etag(*parts):
+    return quote_etag(hashlib.md5(repr(parts).encode()).hexdigest())
+
+
+def _matches(header, etag):
+    if not header:
+        return False
+    tags = [tag.strip() for tag in header.split(',')]
+    # 比较时忽略弱校验前缀
+    return '*' in tags or etag in [tag[2:] if tag.startswith('W/') else tag for tag in tags]
+
+
+class ConditionalRequestMixin:
+    """
+    条件请求：GET 根据查询集版本计算 ETag / Last-Modified，
+    客户端缓存仍有效时直接返回 304，不执行序列化；
+    写操作支持 If-Match，资源已变化时返回 412。
+
+    etag_dependencies 列出序列化结果中引用的其他模型（如图书列表中的分类名），
+    etag_action_models 为自定义动作指定其依赖的模型。
+    其他 GET 动作退化为按响应内容计算 ETag。
+    """
+    etag_dependencies = ()
+    etag_action_models = {}
+
+    def get_object_version_queryset(self):
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        if lookup_url_kwarg not in self.kwargs:
+            return None
+        return self.filter_queryset(self.get_queryset()).filter(
+            **{self.lookup_field: self.kwargs[lookup_url_kwarg]}
+        )
+
+    def get_versions(self):
+        if self.action in self.etag_action_models:
+            return [model_version(model) for model in self.etag_action_models[self.action]]
+        if self.action == 'list':
+            queryset = self.filter_queryset(self.get_queryset())
+        elif self.action == 'retrieve' or (self.detail and self.request.method not in permissions.SAFE_METHODS):
+            queryset = self.get_object_version_queryset()
+        else:
+            return None
+        if queryset is None:
+            return None
+        return [queryset_version(queryset)] + [model_version(model) for model in self.etag_dependencies]
+
+    def get_etag(self, versions):
+        if self.detail:
+            # 对象的 ETag 与具体动作的路径无关，GET 得到的 ETag 可用于后续写操作的 If-Match
+            return make_etag(self.kwargs, self.request.GET.urlencode(), versions)
+        return make_etag(self.request.path, self.request.GET.urlencode(), versions)
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.etag = None
+        self.last_modified = None
+        safe = request.method in permissions.SAFE_METHODS
+        if not safe and not request.headers.get('If-Match'):
+            return
+        versions = self.get_versions()
+        if versions is None:
+            return
+        self.etag = self.get_etag(versions)
+        # 版本元组的第四项是 updated_at（模型有该字段时）
+        updated = [version[3] for version in versions if len(version) > 3 and version[3]]
+        if updated:
+            self.last_modified = max(updated).timestamp()
+
+        if safe:
+            if_none_match = request.headers.get('If-None-Match')
+            if _matches(if_none_match, self.etag):
+                raise NotModified()
+            if_modified_since = parse_http_date_safe(request.headers.get('If-Modified-Since') or '')
+            if (not if_none_match and self.action == 'retrieve' and self.last_modified
+                    and if_modified_since and int(self.last_modified) <= if_modified_since):
+                raise NotModified()
+        else:
+            if_match = request.headers.get('If-Match')
+            if if_match and not _matches(if_match, self.etag):
+                raise PreconditionFailed()
+
+    def handle_exception(self, exc):
+        if isinstance(exc, NotModified):
+            response = Response(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = self.etag
+            return response
+        return super().handle_exception(exc)
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        if request.method not in permissions.SAFE_METHODS or response.status_code != status.HTTP_200_OK:
+            return response
+        if not isinstance(response, Response):
+            return response
+        etag = getattr(self, 'etag', None)
+        if etag is None:
+            # 没有可用的版本信息时按响应内容计算，至少可以节省传输
+            response.render()
+            etag = make_etag(response.content)
+            if _matches(request.headers.get('If-None-Match'), etag):
+                response = Response(status=status.HTTP_304_NOT_MODIFIED)
+                response = super().finalize_response(request, response, *args, **kwargs)
+        response['ETag'] = etag
+        if getattr(self, 'last_modified', None):
+            response['Last-Modified'] = http_date(self.last_modified)
+        response['Cache-Control'] = 'private, no-cache'
+        return response
@@ -0,0 +1,171 @@
+import hashlib
+import json
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+from rest_framework import permissions, status
+from rest_framework.exceptions import APIException, ParseError
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+from books.models import IdempotencyKey
+
+MAX_KEY_LENGTH = 255
+# 这些标准动作不属于自定义动作，不处理幂等键
+STANDARD_ACTIONS = {'list', 'retrieve', 'create', 'update', 'partial_update', 'destroy'}
+
+
+class RequestInProgress(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = '相同幂等键的请求正在处理中，请稍后重试'
+    default_code = 'request_in_progress'
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = '幂等键已用于不同的请求'
+    default_code = 'idempotency_key_reused'
+
+
+class Replay(Exception):
+    def __init__(self, record):
+        self.record = record
+
+
+def key_ttl():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_KEY_TTL', 24 * 60 * 60))
+
+
+def lock_timeout():
+    return timedelta(seconds=getattr(settings, 'IDEMPOTENCY_LOCK_TIMEOUT', 60))
+
+
+def purge_expired_keys(now=None):
+    cutoff = (now or timezone.now()) - key_ttl()
+    deleted, _ = IdempotencyKey.objects.filter(created_at__lt=cutoff).delete()
+    return deleted
+
+
+def fingerprint(method, path, data):
+    if hasattr(data, 'lists'):
+        data = dict(data.lists())
+    payload = json.dumps([method, path, data], sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode()).hexdigest()
+
+
+def claim_key(key, user, request_hash):
+    """
+    占用幂等键并返回新记录；键已存在时按情况抛出
+    Replay（返回保存的响应）、RequestInProgress 或 IdempotencyKeyReused
+    """
+    if len(key) > MAX_KEY_LENGTH:
+        raise ParseError(f'Idempotency-Key 长度不能超过 {MAX_KEY_LENGTH}')
+    try:
+        with transaction.atomic():
+            return IdempotencyKey.objects.create(key=key, user=user, request_hash=request_hash)
+    except IntegrityError:
+        pass
+    record = IdempotencyKey.objects.filter(key=key, user=user).first()
+    now = timezone.now()
+    if record is None or record.created_at < now - key_ttl():
+        # 记录已过期（或刚被清理），按新请求处理
+        IdempotencyKey.objects.filter(key=key, user=user).delete()
+        return claim_key(key, user, request_hash)
+    if record.status_code is None and record.created_at < now - lock_timeout():
+        # 处理中的记录超过锁定时间，视为原请求的进程已崩溃；条件删除保证只有一个请求能接管
+        IdempotencyKey.objects.filter(pk=record.pk, status_code__isnull=True).delete()
+        return claim_key(key, user, request_hash)
+    if record.request_hash != request_hash:
+        raise IdempotencyKeyReused()
+    if record.status_code is None:
+        raise RequestInProgress()
+    raise Replay(record)
+
+
+def stored_response(record):
+    """返回 (状态码, 响应数据)"""
+    return record.status_code, json.loads(record.response_body) if record.response_body else None
+
+
+def fill_response(record, status_code, data):
+    record.status_code = status_code
+    record.response_body = '' if data is None else json.dumps(data, cls=JSONEncoder)
+
+
+def _pending(record):
+    # 超过锁定时间后键可能已被其他请求接管，只写入仍在处理中的本条记录，不覆盖对方的记录
+    return IdempotencyKey.objects.filter(pk=record.pk, status_code__isnull=True)
+
+
+def store_response(record, status_code, data):
+    """保存请求的响应，返回是否写入"""
+    fill_response(record, status_code, data)
+    return _pending(record).update(status_code=record.status_code, response_body=record.response_body) == 1
+
+
+async def astore_response(record, status_code, data):
+    """store_response 的异步版本"""
+    fill_response(record, status_code, data)
+    return await _pending(record).aupdate(status_code=record.status_code, response_body=record.response_body) == 1
+
+
+class IdempotentActionMixin:
+    """
+    自定义写操作（付款、结账、退货等）支持 Idempotency-Key 请求头：
+    首次请求执行后保存响应，同一用户用相同的键重放时直接返回保存的响应，不再执行；
+    原请求仍在处理时返回 409，键被用于不同请求时返回 422。
+    服务器错误（5xx）不保存，客户端可以用同一个键重试。
+    """
+    idempotency_exempt_actions = ()
+
+    def uses_idempotency_key(self, request):
+        return (
+            request.method not in permissions.SAFE_METHODS
+            and self.action not in STANDARD_ACTIONS
+            and self.action not in self.idempotency_exempt_actions
+            and bool(request.headers.get('Idempotency-Key'))
+        )
+
+    def initial(self, request, *args, **kwargs):
+        super().initial(request, *args, **kwargs)
+        self.idempotency_record = None
+        if not self.uses_idempotency_key(request):
+            return
+        user = request.user if request.user.is_authenticated else None
+        self.idempotency_record = claim_key(
+            request.headers['Idempotency-Key'], user,
+            fingerprint(request.method, request.path, request.data)
+        )
+
+    def handle_exception(self, exc):
+        if isinstance(exc, Replay):
+            status_code, data = stored_response(exc.record)
+            response = Response(data, status=status_code)
+            response['Idempotent-Replayed'] = 'true'
+            return response
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            # 未处理的异常不会经过 finalize_response，释放幂等键以便重试
+            self.release_key()
+            raise
+
+    def release_key(self):
+        record = getattr(self, 'idempotency_record', None)
+        self.idempotency_record = None
+        if record is not None:
+            record.delete()
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(request, response, *args, **kwargs)
+        record = getattr(self, 'idempotency_record', None)
+        if record is None:
+            return response
+        if response.status_code >= 500 or not isinstance(response, Response):
+            self.release_key()
+            return response
+        self.idempotency_record = None
+        store_response(record, response.status_code, response.data)
+        return response
@@ -0,0 +1,150 @@
+import re
+from django.core.exceptions import FieldDoesNotExist
+from rest_framework import permissions
+from rest_framework.serializers import BaseSerializer, ListSerializer
+
+DISPLAY_METHOD = re.compile(r'get_(\w+)_display')
+
+
+def _join(prefix, name):
+    return f'{prefix}__{name}' if prefix else name
+
+
+class QueryPlan:
+    """根据序列化器字段推导出的 select_related / prefetch_related / only 方案"""
+
+    def __init__(self):
+        self.select_related = set()
+        self.prefetch_related = set()
+        self.only = set()
+        # 含有无法推导列的层级（属性、方法字段等），这些层级需要加载全部列
+        self.unrestricted = set()
+
+    def add_serializer(self, serializer, model, prefix=''):
+        for field in serializer.fields.values():
+            if field.write_only:
+                continue
+            if field.source == '*':
+                if isinstance(field, BaseSerializer) and not isinstance(field, ListSerializer):
+                    self.add_serializer(field, model, prefix)
+                else:
+                    self.unrestricted.add(prefix)
+                continue
+            self.add_source(field, model, prefix)
+
+    def add_source(self, field, model, prefix):
+        parts = field.source.split('.')
+        path = prefix
+        for position, part in enumerate(parts):
+            last = position == len(parts) - 1
+            try:
+                model_field = model._meta.get_field(part)
+            except FieldDoesNotExist:
+                match = DISPLAY_METHOD.fullmatch(part)
+                if match:
+                    self.only.add(_join(path, match.group(1)))
+                else:
+                    self.unrestricted.add(path)
+                return
+
+            field_path = _join(path, part)
+            if not model_field.is_relation or model_field.related_model is None:
+                self.only.add(field_path)
+                return
+            if model_field.many_to_many or model_field.one_to_many:
+                self.prefetch_related.add(field_path)
+                return
+            if last and not isinstance(field, BaseSerializer):
+                # 主键关联字段只需要外键列
+                self.only.add(field_path)
+                return
+
+            self.select_related.add(field_path)
+            model = model_field.related_model
+            path = field_path
+            if last:
+                self.add_serializer(field, model, path)
+
+    def only_fields(self, extra_related=()):
+        if '' in self.unrestricted:
+            return None
+        # 只写关联名表示加载该关联模型的全部列
+        full = {path for path in self.unrestricted | set(extra_related) if path}
+        fields = {
+            path for path in self.only - self.select_related
+            if not any(path.startswith(prefix + '__') for prefix in full)
+        }
+        return fields | full
+
+    def apply(self, queryset, restrict_columns=True):
+        existing = queryset.query.select_related
+        if self.select_related:
+            queryset = queryset.select_related(*sorted(self.select_related))
+        if self.prefetch_related:
+            queryset = queryset.prefetch_related(*sorted(self.prefetch_related))
+        if restrict_columns and existing is not True:
+            # get_queryset 中手动添加的 select_related 无法推导所需列，完整加载
+            extra = _flatten(existing) if existing else ()
+            fields = self.only_fields(path for path in extra if path not in self.select_related)
+            if fields is not None:
+                queryset = queryset.only(*sorted(fields))
+        return queryset
+
+
+def _flatten(tree, prefix=''):
+    paths = []
+    for name, children in tree.items():
+        path = _join(prefix, name)
+        paths.append(path)
+        paths.extend(_flatten(children, path))
+    return paths
+
+
+class OptimizedQuerySetMixin:
+    """
+    根据序列化器的 source 路径和嵌套序列化器，自动为查询集添加
+    select_related / prefetch_related，读请求还会用 only() 只取需要的列。
+
+    读请求支持 ?fields=id,title 和 ?exclude=description 选择返回字段，
+    未选择的字段既不序列化也不从数据库读取。
+    """
+    _query_plans = {}
+    max_query_plans = 256
+
+    def _split_param(self, name):
+        value = self.request.query_params.get(name, '')
+        return {field.strip() for field in value.split(',') if field.strip()}
+
+    def is_read_request(self):
+        request = getattr(self, 'request', None)
+        return request is not None and request.method in permissions.SAFE_METHODS
+
+    def select_fields(self, serializer):
+        fields = self._split_param('fields')
+        exclude = self._split_param('exclude')
+        for name in list(serializer.fields):
+            if (fields and name not in fields) or name in exclude:
+                serializer.fields.pop(name)
+        return serializer
+
+    def get_serializer(self, *args, **kwargs):
+        serializer = super().get_serializer(*args, **kwargs)
+        if self.is_read_request():
+            self.select_fields(getattr(serializer, 'child', serializer))
+        return serializer
+
+    def get_query_plan(self):
+        serializer = self.get_serializer()
+        key = (type(serializer), tuple(serializer.fields))
+        plan = self._query_plans.get(key)
+        if plan is None:
+            plan = QueryPlan()
+            plan.add_serializer(serializer, serializer.Meta.model)
+            if len(self._query_plans) >= self.max_query_plans:
+                self._query_plans.clear()
+            self._query_plans[key] = plan
+        return plan
+
+    def filter_queryset(self, queryset):
+        queryset = super().filter_queryset(queryset)
+        return self.get_query_plan().apply(queryset, restrict_columns=self.is_read_request())
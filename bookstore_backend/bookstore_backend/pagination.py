@@ -0,0 +1,163 @@
+import base64
+import json
+from functools import reduce
+from operator import or_
+
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+from django.db.models import F, Max, Q
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+# 近似计数时最多数到这么多行，超过后只返回上限
+APPROXIMATE_COUNT_CAP = 10000
+
+
+def approximate_count(queryset, cap=None):
+    """返回 (行数, 是否近似)，避免在大表上执行完整的 COUNT(*)"""
+    cap = cap or APPROXIMATE_COUNT_CAP
+    if not queryset.query.where:
+        # 未过滤时用主键最大值估算，走主键索引只需一次查找
+        return queryset.model._default_manager.aggregate(total=Max('pk'))['total'] or 0, True
+    count = queryset.order_by()[:cap].count()
+    return count, count >= cap
+
+
+class ApproximatePage(Page):
+    def has_next(self):
+        return self.more
+
+
+class ApproximateCountPaginator(Paginator):
+    """
+    近似计数只用于展示，页码不按它校验：取 page_size + 1 行判断是否还有下一页，
+    超过计数上限的深页也能正常访问。
+    """
+    approximate = False
+    seen = 0
+
+    @cached_property
+    def count(self):
+        count, self.approximate = approximate_count(self.object_list)
+        # 已经翻到的行数一定存在
+        return max(count, self.seen)
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('页码必须是整数')
+        if number < 1:
+            raise EmptyPage('页码必须大于0')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('该页没有数据')
+        page = ApproximatePage(rows[:self.per_page], number, self)
+        page.more = len(rows) > self.per_page
+        self.seen = bottom + len(page.object_list)
+        return page
+
+
+class KeysetPagination:
+    """
+    按 (排序字段..., id) 的键集游标分页，翻页只做一次带索引条件的查询，
+    不需要 COUNT(*)，也不会因为 OFFSET 变深而变慢。只支持向后翻页。
+    """
+    cursor_query_param = 'cursor'
+
+    def __init__(self, page_size, ordering):
+        self.page_size = page_size
+        self.ordering = tuple(ordering)
+        self.fields = [name.lstrip('-') for name in self.ordering]
+
+    def encode_cursor(self, row):
+        values = [getattr(row, f'_cursor_{position}') for position in range(len(self.fields))]
+        payload = json.dumps([None if value is None else str(value) for value in values])
+        return base64.urlsafe_b64encode(payload.encode()).decode()
+
+    def decode_cursor(self, cursor, model):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()).decode())
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            return [
+                model._meta.get_field(name).to_python(value)
+                for name, value in zip(self.fields, values)
+            ]
+        except Exception:
+            raise NotFound('无效的游标')
+
+    def after(self, values):
+        # (a, b) > (x, y) 展开为 a > x OR (a = x AND b > y)
+        conditions = []
+        for position, name in enumerate(self.ordering):
+            field = self.fields[position]
+            lookup = 'lt' if name.startswith('-') else 'gt'
+            equal = {self.fields[index]: values[index] for index in range(position)}
+            conditions.append(Q(**equal, **{f'{field}__{lookup}': values[position]}))
+        return reduce(or_, conditions)
+
+    def paginate_queryset(self, queryset, request):
+        self.request = request
+        queryset = queryset.order_by(*self.ordering).annotate(**{
+            f'_cursor_{position}': F(name) for position, name in enumerate(self.fields)
+        })
+        cursor = request.query_params.get(self.cursor_query_param)
+        if cursor:
+            queryset = queryset.filter(self.after(self.decode_cursor(cursor, queryset.model)))
+        rows = list(queryset[:self.page_size + 1])
+        self.has_next = len(rows) > self.page_size
+        rows = rows[:self.page_size]
+        self.next_cursor = self.encode_cursor(rows[-1]) if self.has_next else None
+        return rows
+
+    def get_next_link(self):
+        if self.next_cursor is None:
+            return None
+        return replace_query_param(self.request.build_absolute_uri(), self.cursor_query_param, self.next_cursor)
+
+    def get_paginated_response(self, data):
+        return Response({
+            'next': self.get_next_link(),
+            'results': data
+        })
+
+
+class StandardPagination(PageNumberPagination):
+    """
+    全局分页：默认按页码分页，?page_size= 最大不超过 max_page_size；
+    ?count=approximate 使用近似计数；传入 ?cursor= 或 ?pagination=cursor 时
+    切换为键集游标分页，排序由视图的 keyset_ordering 指定。
+    """
+    page_size = 50
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    default_keyset_ordering = ('-id',)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.keyset = None
+        params = request.query_params
+        if params.get('cursor') is not None or params.get('pagination') == 'cursor':
+            ordering = getattr(view, 'keyset_ordering', self.default_keyset_ordering)
+            self.keyset = KeysetPagination(self.get_page_size(request), ordering)
+            return self.keyset.paginate_queryset(queryset, request)
+
+        self.django_paginator_class = (
+            ApproximateCountPaginator if params.get('count') == 'approximate' else Paginator
+        )
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.keyset is not None:
+            return self.keyset.get_paginated_response(data)
+        response = super().get_paginated_response(data)
+        if getattr(self.page.paginator, 'approximate', False):
+            response.data['count_is_approximate'] = True
+        return response
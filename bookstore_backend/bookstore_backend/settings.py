@@ -80,6 +80,9 @@ CORS_ALLOW_HEADERS = [
     'user-agent',
     'x-csrftoken',
     'x-requested-with',
+    'if-match',
+    'if-none-match',
+    'idempotency-key',
 ]
 
 # CSRF settings
@@ -159,6 +162,27 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+MEDIA_URL = 'media/'
+MEDIA_ROOT = BASE_DIR / 'media'
+
+# 封面缩略图后台处理进程数，0 表示在请求中同步处理
+COVER_THUMBNAIL_WORKERS = 2
+
+# 幂等键保留时间（秒），过期的键由 purge_idempotency_keys 命令清理
+IDEMPOTENCY_KEY_TTL = 24 * 60 * 60
+# 处理中的幂等键超过这段时间（秒）仍未完成时，视为原请求已中断，同一个键可以重新提交
+IDEMPOTENCY_LOCK_TIMEOUT = 60
+
+# 销售成本计算方式：'fifo' 先进先出，'average' 按剩余批次加权平均，见 books.costing
+INVENTORY_COST_METHOD = 'fifo'
+
+# 补货建议参数，见 books.forecast：历史天数、指数平滑系数、默认到货天数、盘点周期天数、安全库存的服务水平系数
+REORDER_HISTORY_DAYS = 90
+REORDER_SMOOTHING = 0.3
+REORDER_LEAD_TIME_DAYS = 7
+REORDER_REVIEW_DAYS = 14
+REORDER_SERVICE_Z = 1.65
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
@@ -173,6 +197,8 @@ REST_FRAMEWORK = {
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    'DEFAULT_PAGINATION_CLASS': 'bookstore_backend.pagination.StandardPagination',
+    'PAGE_SIZE': 50,
 }
 
 # JWT settings
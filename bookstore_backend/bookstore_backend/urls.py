@@ -14,6 +14,8 @@ Including another URLconf
     1. Import the include() function: from django.urls import include, path
     2. Add a URL to urlpatterns:  path('blog/', include('blog.urls'))
 """
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
@@ -27,4 +29,4 @@ urlpatterns = [
     path('api/sales/', include('sales.urls')),
     path('api/purchases/', include('purchases.urls')),
     path('api/financials/', include('financials.urls')),
-]
+] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
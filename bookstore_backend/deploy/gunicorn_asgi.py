@@ -0,0 +1,15 @@
+# ASGI 部署配置，收银台异步接口 /api/books/pos/ 在这种部署下不占用工作线程
+# 使用方法（在 bookstore_backend 目录下）:
+#   pip install gunicorn uvicorn
+#   gunicorn -c deploy/gunicorn_asgi.py bookstore_backend.asgi:application
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8001')
+worker_class = 'uvicorn.workers.UvicornWorker'
+# 异步工作进程用事件循环处理并发连接，进程数与 CPU 核数相同即可
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
@@ -0,0 +1,16 @@
+# WSGI 部署配置，作为 ASGI 部署的对照
+# 使用方法（在 bookstore_backend 目录下）:
+#   pip install gunicorn
+#   gunicorn -c deploy/gunicorn_wsgi.py bookstore_backend.wsgi:application
+import multiprocessing
+import os
+
+bind = os.environ.get('BIND', '0.0.0.0:8000')
+worker_class = 'gthread'
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+# 每个请求在返回前一直占用一个线程
+threads = int(os.environ.get('WEB_THREADS', 4))
+timeout = 30
+graceful_timeout = 30
+keepalive = 5
+accesslog = '-'
@@ -0,0 +1,20 @@
+# Generated by Django 5.2.18 on 2026-10-18 13:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('financials', '0002_financial_content_type_financial_object_id'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='financial',
+            index=models.Index(fields=['created_at', 'id'], name='financial_created_id_idx'),
+        ),
+    ]
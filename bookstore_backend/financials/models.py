@@ -36,6 +36,9 @@ class Financial(models.Model):
         verbose_name = '财务记录'
         verbose_name_plural = '财务记录'
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['created_at', 'id'], name='financial_created_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.get_type_display()} - {self.get_category_display()} - {self.amount}元"
@@ -1,3 +1,45 @@
+from decimal import Decimal
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from accounts.models import User
+from .models import Financial
 
 # Create your tests here.
+
+class FinancialQueryCountTests(TestCase):
+    def setUp(self):
+        self.client = APIClient()
+
+    def create_records(self, count):
+        for _ in range(count):
+            operator = User.objects.create_user(f'operator{Financial.objects.count()}', 'op@example.com', 'password123')
+            Financial.objects.create(type='income', category='sale', amount=Decimal('10.00'), operator=operator)
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/financials/financials/')
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_list_query_count_does_not_grow_with_rows(self):
+        self.client.force_authenticate(User.objects.create_user('staff', 'staff@example.com', 'password123'))
+        self.create_records(1)
+        baseline = self.count_queries()
+        self.create_records(10)
+        self.assertEqual(self.count_queries(), baseline)
+
+
+class FinancialSummaryConditionalTests(TestCase):
+    def test_summary_returns_304_until_records_change(self):
+        user = User.objects.create_user('staff', 'staff@example.com', 'password123')
+        client = APIClient()
+        client.force_authenticate(user)
+        etag = client.get('/api/financials/financials/summary/')['ETag']
+        self.assertEqual(client.get('/api/financials/financials/summary/', HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        Financial.objects.create(type='income', category='sale', amount=Decimal('10.00'), operator=user)
+        response = client.get('/api/financials/financials/summary/', HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['total_income'], Decimal('10.00'))
@@ -2,6 +2,9 @@ from django.shortcuts import render
 from rest_framework import viewsets, permissions, status
 from rest_framework.decorators import action
 from rest_framework.response import Response
+from bookstore_backend.conditional import ConditionalRequestMixin
+from accounts.models import User
+from bookstore_backend.mixins import OptimizedQuerySetMixin
 from django.db.models import Sum, Count
 from django.contrib.contenttypes.models import ContentType
 from .models import Financial
@@ -13,10 +16,13 @@ logger = logging.getLogger(__name__)
 
 # Create your views here.
 
-class FinancialViewSet(viewsets.ModelViewSet):
+class FinancialViewSet(ConditionalRequestMixin, OptimizedQuerySetMixin, viewsets.ModelViewSet):
     queryset = Financial.objects.all()
     serializer_class = FinancialSerializer
     permission_classes = [permissions.IsAuthenticated]
+    etag_dependencies = (User,)
+    etag_action_models = {'summary': (Financial, Book)}
+    keyset_ordering = ('-created_at', '-id')
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -27,9 +33,14 @@ class FinancialViewSet(viewsets.ModelViewSet):
 
     def list(self, request):
         logger.info('Listing financial records')
-        queryset = self.get_queryset()
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            logger.info(f'Returning {len(page)} financial records')
+            return self.get_paginated_response(serializer.data)
         serializer = self.get_serializer(queryset, many=True)
-        logger.info(f'Found {len(queryset)} financial records')
+        logger.info(f'Returning {len(serializer.data)} financial records')
         return Response(serializer.data)
 
     def perform_create(self, serializer):
@@ -0,0 +1,25 @@
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    # 已有记录以采购日期作为最后更新时间
+    apps.get_model('purchases', 'Purchase').objects.update(updated_at=F('purchase_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('purchases', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='purchase',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='更新时间'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
@@ -10,6 +10,8 @@ class Purchase(models.Model):
     supplier = models.CharField(max_length=100, verbose_name='供应商')
     purchaser = models.ForeignKey(User, on_delete=models.PROTECT, verbose_name='采购员')
     purchase_date = models.DateTimeField(auto_now_add=True, verbose_name='采购日期')
+    # 作为条件请求 ETag / If-Match 的版本依据，编辑记录时更新
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
     notes = models.TextField(blank=True, verbose_name='备注')
 
     class Meta:
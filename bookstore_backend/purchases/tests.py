@@ -1,3 +1,44 @@
+from decimal import Decimal
 from django.test import TestCase
+from rest_framework.test import APIClient
+from accounts.models import User
+from books.models import Book, CostLot, StockMovement
+from financials.models import Financial
+from .models import Purchase
 
 # Create your tests here.
+
+class PurchaseCreateTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('admin', 'admin@example.com', 'password123', is_staff=True)
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.book = Book.objects.create(
+            isbn='9787000009001', title='旧版采购', author='作者', publisher='出版社',
+            price=Decimal('30.00'), stock=2
+        )
+
+    def test_create_adds_stock_and_cost_lot(self):
+        response = self.client.post('/api/purchases/purchases/', {
+            'book_id': self.book.id, 'purchaser_id': self.user.id,
+            'quantity': 4, 'price': '12.50', 'supplier': '供应商',
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        purchase = Purchase.objects.get()
+        self.assertEqual(purchase.total, Decimal('50.00'))
+        self.book.refresh_from_db()
+        self.assertEqual(self.book.stock, 6)
+        self.assertEqual(Financial.objects.get().amount, Decimal('50.00'))
+        lot = CostLot.objects.get()
+        self.assertEqual(
+            (lot.book_id, lot.source, lot.reference_id, lot.unit_cost, lot.remaining),
+            (self.book.id, 'legacy_purchase', purchase.id, Decimal('12.50'), 4)
+        )
+        self.assertEqual(StockMovement.objects.get().reason, 'legacy_purchase')
+
+        # 之后的销售按旧版采购的进价计算成本
+        response = self.client.post('/api/books/sales/create_batch/', {
+            'items': [{'book_id': self.book.id, 'quantity': 2}]
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.data[0]['cogs'], '25.00')
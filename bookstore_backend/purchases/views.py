@@ -1,19 +1,28 @@
+from django.db import transaction
 from django.shortcuts import render
 from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
+from bookstore_backend.conditional import ConditionalRequestMixin
+from accounts.models import User
+from books.models import Category
+from bookstore_backend.mixins import OptimizedQuerySetMixin
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from .models import Purchase
 from .serializers import PurchaseSerializer
 from financials.models import Financial
 from books.models import Book
+from books import costing
+from books.stock import adjust_stock
 
 # Create your views here.
 
-class PurchaseViewSet(viewsets.ModelViewSet):
+class PurchaseViewSet(ConditionalRequestMixin, OptimizedQuerySetMixin, viewsets.ModelViewSet):
     queryset = Purchase.objects.all()
     serializer_class = PurchaseSerializer
     permission_classes = [IsAuthenticated]
+    etag_dependencies = (Book, Category, User)
+    keyset_ordering = ('-purchase_date', '-id')
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -22,22 +31,19 @@ class PurchaseViewSet(viewsets.ModelViewSet):
             permission_classes = [permissions.IsAuthenticated]
         return [permission() for permission in permission_classes]
 
+    @transaction.atomic
     def perform_create(self, serializer):
-        purchase = serializer.save(created_by=self.request.user)
-        
+        purchase = serializer.save(purchaser=self.request.user)
+
         # 创建财务记录
-        total_amount = purchase.quantity * purchase.purchase_price
         Financial.objects.create(
             type='expense',
             category='purchase',
-            amount=total_amount,
+            amount=purchase.total,
             description=f'进货图书 {purchase.book.title} {purchase.quantity} 本',
             operator=self.request.user
         )
 
-        # 更新图书库存
-        book = purchase.book
-        book.stock += purchase.quantity
-        if book.status == 'out_of_stock' and book.stock > 0:
-            book.status = 'in_stock'
-        book.save()
+        # 更新图书库存，入库的数量同时生成成本批次，之后的销售按进价计算成本
+        adjust_stock(purchase.book_id, purchase.quantity, 'legacy_purchase', purchase.id, self.request.user)
+        costing.receive_legacy([purchase])
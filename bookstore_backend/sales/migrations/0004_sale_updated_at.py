@@ -0,0 +1,25 @@
+import django.utils.timezone
+from django.db import migrations, models
+from django.db.models import F
+
+
+def backfill_updated_at(apps, schema_editor):
+    # 已有记录以销售日期作为最后更新时间
+    apps.get_model('sales', 'Sale').objects.update(updated_at=F('sale_date'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('sales', '0003_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='sale',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, default=django.utils.timezone.now, verbose_name='更新时间'),
+            preserve_default=False,
+        ),
+        migrations.RunPython(backfill_updated_at, migrations.RunPython.noop),
+    ]
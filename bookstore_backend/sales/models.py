@@ -10,6 +10,8 @@ class Sale(models.Model):
     customer = models.CharField(max_length=100, verbose_name='客户')
     seller = models.ForeignKey(User, on_delete=models.PROTECT, verbose_name='销售员')
     sale_date = models.DateTimeField(auto_now_add=True, verbose_name='销售日期')
+    # 作为条件请求 ETag / If-Match 的版本依据，编辑记录时更新
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
     notes = models.TextField(blank=True, verbose_name='备注')
 
     class Meta:
@@ -1,3 +1,69 @@
+from decimal import Decimal
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from accounts.models import User
+from books.models import Book, Category
+from .models import Sale
 
 # Create your tests here.
+
+class SaleQueryCountTests(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user('staff', 'staff@example.com', 'password123')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.category = Category.objects.create(name='小说')
+
+    def create_sales(self, start, count):
+        for number in range(start, start + count):
+            book = Book.objects.create(
+                isbn=f'978000000{number:04d}', title=f'Book {number}', author='作者', publisher='出版社',
+                category=self.category, price=Decimal('20.00'), stock=5
+            )
+            Sale.objects.create(book=book, quantity=1, price=book.price, customer='顾客', seller=self.user)
+
+    def count_queries(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get('/api/sales/sales/')
+        self.assertEqual(response.status_code, 200)
+        return len(context)
+
+    def test_list_query_count_does_not_grow_with_rows(self):
+        self.create_sales(0, 1)
+        baseline = self.count_queries()
+        self.create_sales(1, 10)
+        self.assertEqual(self.count_queries(), baseline)
+
+    def test_create_batch(self):
+        book = Book.objects.create(
+            isbn='9780000009999', title='Batch', author='作者', publisher='出版社',
+            category=self.category, price=Decimal('20.00'), stock=5
+        )
+        response = self.client.post('/api/sales/sales/create_batch/', {
+            'items': [{'book_id': book.id, 'quantity': 2}]
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(Sale.objects.get().total, Decimal('40.00'))
+        book.refresh_from_db()
+        self.assertEqual(book.stock, 3)
+
+    def test_edit_changes_etag(self):
+        self.create_sales(0, 1)
+        sale = Sale.objects.get()
+        admin = User.objects.create_user('admin', 'admin@example.com', 'password123', is_staff=True)
+        self.client.force_authenticate(admin)
+        url = f'/api/sales/sales/{sale.id}/'
+        list_etag = self.client.get('/api/sales/sales/')['ETag']
+        etag = self.client.get(url)['ETag']
+
+        response = self.client.patch(url, {'notes': '改过'}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        response = self.client.get('/api/sales/sales/', HTTP_IF_NONE_MATCH=list_etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['results'][0]['notes'], '改过')
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        # 旧的 If-Match 已失效
+        response = self.client.patch(url, {'notes': '再改'}, format='json', HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
@@ -1,19 +1,26 @@
 from django.shortcuts import render
 from rest_framework import viewsets, permissions, status
 from rest_framework.response import Response
+from bookstore_backend.conditional import ConditionalRequestMixin
+from bookstore_backend.idempotency import IdempotentActionMixin
+from accounts.models import User
+from books.models import Category
+from bookstore_backend.mixins import OptimizedQuerySetMixin
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from .models import Sale
 from .serializers import SaleSerializer
-from financials.models import Financial
 from books.models import Book
+from books.checkout import CheckoutError, checkout
 
 # Create your views here.
 
-class SaleViewSet(viewsets.ModelViewSet):
+class SaleViewSet(IdempotentActionMixin, ConditionalRequestMixin, OptimizedQuerySetMixin, viewsets.ModelViewSet):
     queryset = Sale.objects.all()
     serializer_class = SaleSerializer
     permission_classes = [IsAuthenticated]
+    etag_dependencies = (Book, Category, User)
+    keyset_ordering = ('-sale_date', '-id')
 
     def get_permissions(self):
         if self.action in ['create', 'update', 'partial_update', 'destroy']:
@@ -22,62 +29,27 @@ class SaleViewSet(viewsets.ModelViewSet):
             permission_classes = [permissions.IsAuthenticated]
         return [permission() for permission in permission_classes]
 
+    def build_sale(self, book, quantity):
+        # bulk_create 不调用 save()，需要直接给出总价
+        return Sale(
+            book=book,
+            quantity=quantity,
+            price=book.price,
+            total=book.price * quantity,
+            customer='',
+            seller=self.request.user
+        )
+
     @action(detail=False, methods=['post'])
     def create_batch(self, request):
-        items = request.data.get('items', [])
-        if not items:
+        try:
+            sales = checkout(request.data.get('items', []), request.user, Sale, self.build_sale)
+        except CheckoutError as exc:
             return Response(
-                {'error': '销售项目不能为空'},
+                {'error': str(exc)},
                 status=status.HTTP_400_BAD_REQUEST
             )
 
-        sales = []
-        total_amount = 0
-        for item in items:
-            try:
-                book = Book.objects.get(id=item['book_id'])
-                if book.status != 'in_stock':
-                    return Response(
-                        {'error': f'图书 {book.title} 不在销售状态'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-                if book.stock < item['quantity']:
-                    return Response(
-                        {'error': f'图书 {book.title} 库存不足'},
-                        status=status.HTTP_400_BAD_REQUEST
-                    )
-
-                # 创建销售记录
-                sale = Sale.objects.create(
-                    book=book,
-                    quantity=item['quantity'],
-                    sale_price=book.price,
-                    created_by=request.user
-                )
-                sales.append(sale)
-                total_amount += book.price * item['quantity']
-
-                # 更新库存
-                book.stock -= item['quantity']
-                if book.stock == 0:
-                    book.status = 'out_of_stock'
-                book.save()
-
-            except Book.DoesNotExist:
-                return Response(
-                    {'error': f'图书ID {item["book_id"]} 不存在'},
-                    status=status.HTTP_400_BAD_REQUEST
-                )
-
-        # 创建财务记录
-        Financial.objects.create(
-            type='income',
-            category='sale',
-            amount=total_amount,
-            description=f'销售图书 {len(sales)} 本',
-            operator=request.user
-        )
-
         return Response(
             SaleSerializer(sales, many=True).data,
             status=status.HTTP_201_CREATED
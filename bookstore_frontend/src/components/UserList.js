@@ -24,7 +24,7 @@ const UserList = () => {
         setLoading(true);
         try {
             const response = await api.get('/users/');
-            setUsers(response.data);
+            setUsers(response.data.results || response.data);
         } catch (error) {
             message.error('获取用户列表失败');
         }
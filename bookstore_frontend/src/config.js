@@ -1 +1,3 @@
-export const API_BASE_URL = 'http://localhost:8000/api'; 
\ No newline at end of file
+export const API_BASE_URL = 'http://localhost:8000/api';
+// 列表接口已分页，管理页面按最大页逐页取完全部数据（见 services/pagination.js）
+export const LIST_PAGE_SIZE = 500;
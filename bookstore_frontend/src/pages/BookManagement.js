@@ -13,7 +13,8 @@ import {
 } from 'antd';
 import { SearchOutlined, InfoCircleOutlined } from '@ant-design/icons';
 import axios from 'axios';
-import { API_BASE_URL } from '../config';
+import { API_BASE_URL, LIST_PAGE_SIZE } from '../config';
+import { fetchAllPages } from '../services/pagination';
 import { EditOutlined } from '@ant-design/icons';
 import { Modal, Form } from 'antd';
 
@@ -44,12 +45,13 @@ const BookManagement = () => {
 
   const fetchCategories = async () => {
     try {
-      const response = await axios.get(`${API_BASE_URL}/books/categories/`, {
+      const rows = await fetchAllPages(`${API_BASE_URL}/books/categories/`, {
+        params: { page_size: LIST_PAGE_SIZE },
         headers: {
           'Authorization': `Bearer ${localStorage.getItem('token')}`
         }
       });
-      setCategories(response.data);
+      setCategories(rows);
     } catch (error) {
       console.error('Error fetching categories:', error);
     }
@@ -69,12 +71,13 @@ const BookManagement = () => {
         url += `?${params.toString()}`;
       }
 
-      const response = await axios.get(url, {
+      const rows = await fetchAllPages(url, {
+        params: { page_size: LIST_PAGE_SIZE },
         headers: {
           'Authorization': `Bearer ${localStorage.getItem('token')}`
         }
       });
-      setBooks(response.data);
+      setBooks(rows);
     } catch (error) {
       console.error('Error fetching books:', error);
     } finally {
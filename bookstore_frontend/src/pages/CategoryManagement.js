@@ -13,7 +13,8 @@ import {
 } from 'antd';
 import { PlusOutlined, EditOutlined, DeleteOutlined } from '@ant-design/icons';
 import axios from 'axios';
-import { API_BASE_URL } from '../config';
+import { API_BASE_URL, LIST_PAGE_SIZE } from '../config';
+import { fetchAllPages } from '../services/pagination';
 
 const { Title } = Typography;
 
@@ -31,12 +32,13 @@ const CategoryManagement = () => {
   const fetchCategories = async () => {
     setLoading(true);
     try {
-      const response = await axios.get(`${API_BASE_URL}/books/categories/`, {
+      const rows = await fetchAllPages(`${API_BASE_URL}/books/categories/`, {
+        params: { page_size: LIST_PAGE_SIZE },
         headers: {
           'Authorization': `Bearer ${localStorage.getItem('token')}`
         }
       });
-      setCategories(response.data.results || response.data);
+      setCategories(rows);
     } catch (error) {
       message.error('获取分类列表失败');
       console.error('Error fetching categories:', error);
@@ -19,7 +19,8 @@ import {
 } from 'antd';
 import { PlusOutlined, DollarOutlined } from '@ant-design/icons';
 import axios from 'axios';
-import { API_BASE_URL } from '../config';
+import { API_BASE_URL, LIST_PAGE_SIZE } from '../config';
+import { fetchAllPages } from '../services/pagination';
 import moment from 'moment';
 
 const { Title } = Typography;
@@ -48,16 +49,17 @@ const FinancialManagement = () => {
     setLoading(true);
     try {
       console.log('Fetching records from:', `${API_BASE_URL}/financials/financials/`);
-      const response = await axios.get(`${API_BASE_URL}/financials/financials/`, {
+      const rows = await fetchAllPages(`${API_BASE_URL}/financials/financials/`, {
+        params: { page_size: LIST_PAGE_SIZE },
         headers: {
           'Authorization': `Bearer ${localStorage.getItem('token')}`
         }
       });
-      console.log('Financial records response:', response.data);
-      if (!Array.isArray(response.data)) {
-        console.warn('Response data is not an array:', response.data);
+      console.log('Financial records response:', rows);
+      if (!Array.isArray(rows)) {
+        console.warn('Response data is not an array:', rows);
       }
-      setRecords(Array.isArray(response.data) ? response.data : []);
+      setRecords(Array.isArray(rows) ? rows : []);
       setLoading(false);
     } catch (error) {
       console.error('Error fetching financial records:', error);
@@ -15,7 +15,8 @@ import {
 } from 'antd';
 import { PlusOutlined, PayCircleOutlined, RollbackOutlined } from '@ant-design/icons';
 import axios from 'axios';
-import { API_BASE_URL } from '../config';
+import { API_BASE_URL, LIST_PAGE_SIZE } from '../config';
+import { fetchAllPages } from '../services/pagination';
 
 const { Title } = Typography;
 const { Option } = Select;
@@ -36,12 +37,13 @@ const PurchaseManagement = () => {
   const fetchOrders = async () => {
     setLoading(true);
     try {
-      const response = await axios.get(`${API_BASE_URL}/books/purchase-orders/`, {
+      const rows = await fetchAllPages(`${API_BASE_URL}/books/purchase-orders/`, {
+        params: { page_size: LIST_PAGE_SIZE },
         headers: {
           'Authorization': `Bearer ${localStorage.getItem('token')}`
         }
       });
-      setOrders(response.data);
+      setOrders(rows);
     } catch (error) {
       message.error('获取进货订单失败');
       console.error('Error fetching orders:', error);
@@ -52,12 +54,13 @@ const PurchaseManagement = () => {
   // 获取所有图书
   const fetchBooks = async () => {
     try {
-      const response = await axios.get(`${API_BASE_URL}/books/books/`, {
+      const rows = await fetchAllPages(`${API_BASE_URL}/books/books/`, {
+        params: { page_size: LIST_PAGE_SIZE },
         headers: {
           'Authorization': `Bearer ${localStorage.getItem('token')}`
         }
       });
-      setBooks(response.data);
+      setBooks(rows);
     } catch (error) {
       console.error('Error fetching books:', error);
     }
@@ -66,12 +69,13 @@ const PurchaseManagement = () => {
   // 获取所有分类
   const fetchCategories = async () => {
     try {
-      const response = await axios.get(`${API_BASE_URL}/books/categories/`, {
+      const rows = await fetchAllPages(`${API_BASE_URL}/books/categories/`, {
+        params: { page_size: LIST_PAGE_SIZE },
         headers: {
           'Authorization': `Bearer ${localStorage.getItem('token')}`
         }
       });
-      setCategories(response.data);
+      setCategories(rows);
     } catch (error) {
       console.error('Error fetching categories:', error);
     }
@@ -18,7 +18,8 @@ import {
 } from 'antd';
 import { PlusOutlined, ShoppingCartOutlined, RollbackOutlined } from '@ant-design/icons';
 import axios from 'axios';
-import { API_BASE_URL } from '../config';
+import { API_BASE_URL, LIST_PAGE_SIZE } from '../config';
+import { fetchAllPages } from '../services/pagination';
 
 const { Title } = Typography;
 const { Search } = Input;
@@ -37,12 +38,13 @@ const SalesManagement = () => {
   const fetchSales = async () => {
     setLoading(true);
     try {
-      const response = await axios.get(`${API_BASE_URL}/books/sales/`, {
+      const rows = await fetchAllPages(`${API_BASE_URL}/books/sales/`, {
+        params: { page_size: LIST_PAGE_SIZE },
         headers: {
           'Authorization': `Bearer ${localStorage.getItem('token')}`
         }
       });
-      setSales(response.data);
+      setSales(rows);
     } catch (error) {
       message.error('获取销售记录失败');
       console.error('Error fetching sales:', error);
@@ -53,14 +55,15 @@ const SalesManagement = () => {
   // 获取所有图书
   const fetchBooks = async () => {
     try {
-      const response = await axios.get(`${API_BASE_URL}/books/books/`, {
+      const rows = await fetchAllPages(`${API_BASE_URL}/books/books/`, {
+        params: { page_size: LIST_PAGE_SIZE },
         headers: {
           'Authorization': `Bearer ${localStorage.getItem('token')}`
         }
       });
-      console.log('Fetched books:', response.data); // 添加日志
+      console.log('Fetched books:', rows); // 添加日志
       // 只显示在售状态且有库存的图书
-      const availableBooks = response.data.filter(book => book.status === 'in_stock' && book.stock > 0);
+      const availableBooks = rows.filter(book => book.status === 'in_stock' && book.stock > 0);
       console.log('Available books:', availableBooks); // 添加日志
       setBooks(availableBooks);
     } catch (error) {
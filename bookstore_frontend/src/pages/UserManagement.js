@@ -51,7 +51,7 @@ const UserManagement = () => {
             const response = await axios.get(`${API_BASE_URL}/accounts/users/`, {
                 headers: getAuthHeader()
             });
-            setUsers(response.data);
+            setUsers(response.data.results || response.data);
         } catch (error) {
             if (!handleAuthError(error)) {
                 message.error('获取用户列表失败');
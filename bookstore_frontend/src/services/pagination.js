@@ -0,0 +1,18 @@
+import axios from 'axios';
+
+// 列表接口已分页：沿着 next 链接取完全部页面，返回合并后的数组。
+// 未分页的接口直接返回数组本身。
+export const fetchAllPages = async (url, config = {}) => {
+  let response = await axios.get(url, config);
+  if (!response.data || !Array.isArray(response.data.results)) {
+    return response.data;
+  }
+  const rows = [...response.data.results];
+  // next 已包含全部查询参数，后续请求不再附加 params
+  const { params, ...rest } = config;
+  while (response.data.next) {
+    response = await axios.get(response.data.next, rest);
+    rows.push(...response.data.results);
+  }
+  return rows;
+};